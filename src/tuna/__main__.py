@@ -1,26 +1,20 @@
+import asyncio
+import json
 import logging
 import os
-import time
+from pathlib import Path
 
 import typer
 
 from tuna import __version__
-from tuna.config import ADDRESS
-from tuna.config import STRATUM_HOST
-from tuna.config import STRATUM_PASSWORD
-from tuna.config import STRATUM_WORKER
-from tuna.config import STRATUM_PORT
-from tuna.datums import TargetState
-from tuna.utils import get_hash
-from tuna.stratum import Stratum
-from tuna.stratum import StratumMethod
-
-try:
-    from tuna.gpu_library import mine_cuda
-
-    HAS_GPU = True
-except ModuleNotFoundError:
-    HAS_GPU = False
+from tuna.config import Settings
+from tuna.config import account
+from tuna.config import settings
+from tuna import backends
+from tuna.utils import Target
+
+# Modules that pull in pycardano (tuna.stratum and everything using it) are imported in
+# the commands that need them, so `--help` and the CLI start quickly
 
 logging.basicConfig(
     format="%(asctime)s - %(name)-8s - %(levelname)-8s - %(message)s",
@@ -29,124 +23,275 @@ logging.basicConfig(
 logger = logging.getLogger("tuna")
 logger.setLevel(os.environ.get("TUNA_LOG", "INFO"))
 
-connection = Stratum(
-    address=ADDRESS.encode(),
-    password=STRATUM_PASSWORD,
-    host=STRATUM_HOST,
-    worker=STRATUM_WORKER,
-    port=STRATUM_PORT,
-)
+app = typer.Typer(add_completion=False)
+
+
+def connect(
+    config: Settings, strict: bool = False, notify_timeout: float | None = None
+) -> "Stratum":
+    """The pool connection from the settings, `notify_timeout` 0 never switches pools."""
+    from tuna.stratum import NOTIFY_TIMEOUT
+    from tuna.stratum import Stratum
+    from tuna.stratum import parse_pools
+
+    if notify_timeout is None:
+        notify_timeout = NOTIFY_TIMEOUT
+    return Stratum(
+        address=config.address.encode(),
+        password=config.stratum_password,
+        host=config.stratum_host,
+        worker=config.stratum_worker,
+        port=config.stratum_port,
+        strict=strict,
+        pools=parse_pools(config.stratum_pools, config.stratum_port),
+        notify_timeout=notify_timeout or None,
+    )
 
-MAGIC_HASH_NUMBER = 256 * 32 * 32
 
+@app.callback(invoke_without_command=True)
+def main(
+    ctx: typer.Context,
+    nloops: int = 4096,
+    difficulty: int = 8,
+    workers: int = os.cpu_count(),
+    backend: str = typer.Option(
+        None, help=f"Hashing backend, one of {list(backends.BACKENDS)}"
+    ),
+    calibrate: bool = typer.Option(
+        False, help="Benchmark the available backends, print the results and exit"
+    ),
+    metrics_port: int = typer.Option(
+        None, help="Serve Prometheus metrics on this port"
+    ),
+    metrics_host: str = typer.Option(
+        "127.0.0.1", help="Address to serve metrics on, 0.0.0.0 for all interfaces"
+    ),
+    autotune: bool = typer.Option(
+        False,
+        help="Adjust nloops and difficulty while mining, starting from the given values",
+    ),
+    batch_seconds: float = typer.Option(
+        1.5, help="Batch time the autotuner aims for"
+    ),
+    checkpoint: str = typer.Option(
+        None, help="File to keep searched nonce ranges in, to resume after a restart"
+    ),
+    strict: bool = typer.Option(
+        False, help="Validate every Stratum message with pydantic (slower, for debugging)"
+    ),
+    notify_timeout: float = typer.Option(
+        None,
+        help="Seconds without a job before switching pools (600 by default), 0 never",
+    ),
+    record: str = typer.Option(
+        None, help="Record the messages from the pool to this file, for `replay`"
+    ),
+    events: str = typer.Option(
+        None, help="Append jobs, batches and shares to this binary event log"
+    ),
+):
+    """Mine on the Stratum pool from the environment."""
 
-def main(nloops: int = 4096, difficulty: int = 8):
+    # The mining options do not apply to commands like `bench`
+    if ctx.invoked_subcommand is not None:
+        return
+
+    from tuna import events as event_log
+    from tuna import session
+    from tuna.autotune import Autotuner
+    from tuna.miner import mine
+
+    if calibrate:
+        results = backends.calibrate(workers=workers)
+        print(json.dumps([r.to_dict() for r in results], indent=2))
+        return
+
+    config = settings()
+    connection = connect(config, strict, notify_timeout)
 
     logger.info(f"tuna-py {__version__} by Elder Millenial")
-    logger.info(f"Address: {ADDRESS.encode()}")
-    logger.info(f"Stratum Target: {STRATUM_HOST}:{STRATUM_PORT}")
-    logger.info(f"Stratum Worker: {STRATUM_WORKER}")
+    logger.info(f"Address: {connection.address}")
+    logger.info(f"Stratum Target: {config.stratum_host}:{config.stratum_port}")
+    if len(connection.pools) > 1:
+        backups = ", ".join(f"{host}:{port}" for host, port in connection.pools[1:])
+        logger.info(f"Backup Pools: {backups}")
+    logger.info(f"Stratum Worker: {config.stratum_worker}")
     logger.info(f"Submit Difficulty: {difficulty}")
-    logger.info(f"Number of CUDA Loops: {nloops}")
-
-    with connection as conn:
-
-        conn.subscribe()
-        conn.authorize()
-
-        submit_count = 0
-        hash_count = 0
-        start = time.time()
-        while True:
-
-            while len(conn.messages) > 0:
-                message = conn.messages.pop(0)
-                if hasattr(message, "method"):
-                    logger.debug(message)
-
-                    if message.method == StratumMethod.notify:
-                        logger.info(
-                            f"New job: {conn.job_id}, ({hash_count/(10 ** 6 * (time.time() - start)):0.3f} Mh/s, submissions={submit_count}, time={time.time() - start:0.3f}s),"
-                        )
-                        logger.info(f"Difficulty: {conn.difficulty}")
-                        with conn.job_lock:
-                            job_id = conn.job_id
-                        submit_count = 0
-                        hash_count = 0
-                        start = time.time()
-                        next_hash_time = start + 10
-                    elif message.method == StratumMethod.difficulty:
-                        logger.debug(f"New difficulty: {conn.difficulty}")
-                elif message.id == 4:
-                    if message.result:
-                        logger.debug("Successfully submitted nonce!")
-                    else:
-                        logger.error(f"Error submitting nonce: {message.error}")
-
-            try:
-                conn.thread.result(timeout=0)
-            except TimeoutError:
-                pass
-
-            if conn.target is None:
-                time.sleep(1)
-                continue
-
-            target_bytes = bytearray(conn.target.to_cbor())
-            target_view = memoryview(target_bytes)
-
-            window = slice(
-                4 + len(conn.extra_nonce_1),
-                4 + len(conn.extra_nonce_1) + len(conn.extra_nonce_2),
+    logger.info(f"Number of Loops: {nloops}")
+
+    miner = backends.select(backend, workers)
+    logger.info(f"Backend: {miner.name}")
+
+    tuner = None
+    if autotune:
+        tuner = Autotuner(nloops, difficulty, batch_seconds, miner.max_nonces)
+        logger.info(f"Autotune: batch target {batch_seconds}s")
+
+    if record is not None:
+        connection.recorder = session.Recorder(record)
+        logger.info(f"Recording the session to {record}")
+
+    sink = None
+    if events is not None:
+        sink = event_log.EventLog(events)
+        logger.info(f"Logging events to {events}")
+
+    try:
+        asyncio.run(
+            mine(
+                connection,
+                miner,
+                Target(difficulty),
+                nloops,
+                metrics_port,
+                metrics_host,
+                tuner,
+                checkpoint,
+                sink,
             )
-            nonce_size = len(conn.extra_nonce_2)
-
-            if not HAS_GPU:
-                hsh = get_hash(target_bytes)
-                while not all(["0" == h for h in hsh.hex()[:7]]):
-                    try:
-                        target_view[window] = (
-                            int.from_bytes(target_view[window]) + 1
-                        ).to_bytes(nonce_size)
-                    except OverflowError:
-                        print(target.nonce)
-                        raise
-                    hsh = get_hash(target_bytes)
-                    hash_count += 1
-                nonces = [target_view[window].hex()][:8]
-            else:
-                logger.debug("Starting GPU hashing...")
-                nonces = mine_cuda(conn.target.to_cbor(), difficulty, nloops)
-                hash_count += MAGIC_HASH_NUMBER * nloops
-                logger.debug("Finished GPU hashing!")
-
-                nonces = [n[8:] for n in nonces]
-
-            with conn.job_lock:
-                if job_id != conn.job_id:
-                    continue
-
-            if time.time() > next_hash_time:
-                next_hash_time += 10
-                logger.info(f"{hash_count/(10 ** 6 * (time.time() - start)):0.3f} Mh/s")
-
-            for nonce in nonces:
-                target_view[window] = (int.from_bytes(bytes.fromhex(nonce))).to_bytes(
-                    nonce_size
-                )
-                hsh = get_hash(target_bytes)
-                logger.info(
-                    f"Submitting nonce: {target_view[window].hex()}, hash={hsh.hex()}, address={conn.address}, worker={conn.worker}"
-                )
-                conn.submit_nonce(nonce)
-                submit_count += 1
-
-                target_view[window] = (
-                    int.from_bytes(target_view[window]) + 1
-                ).to_bytes(nonce_size)
-                with conn.job_lock:
-                    if job_id == conn.job_id:
-                        conn.target = TargetState.from_cbor(target_bytes)
-
-
-typer.run(main)
+        )
+    finally:
+        if connection.recorder is not None:
+            connection.recorder.close()
+        if sink is not None:
+            sink.close()
+
+
+@app.command()
+def bench(
+    output: Path = typer.Option(None, help="Write the results to this JSON file"),
+    seconds: float = typer.Option(1.0, help="Minimum time for each benchmark"),
+    backend: list[str] = typer.Option(
+        None, help="Backends for the end to end runs, defaults to all available"
+    ),
+    nloops: int = typer.Option(16, help="Loops per batch in the end to end runs"),
+    difficulty: int = typer.Option(4, help="Submit difficulty in the end to end runs"),
+    workers: int = os.cpu_count(),
+):
+    """Run the benchmark suite and print the results as JSON."""
+    from tuna import bench as benchmarks
+
+    results = benchmarks.run(seconds, backend or None, nloops, difficulty, workers)
+
+    text = json.dumps(results, indent=2)
+    if output is not None:
+        output.write_text(text + "\n")
+        logger.info(f"Benchmark results written to {output}")
+    else:
+        print(text)
+
+
+@app.command()
+def replay(
+    recording: Path = typer.Argument(..., help="A session recorded with --record"),
+    speed: float = typer.Option(1.0, help="Replay this many times faster than recorded"),
+    backend: str = typer.Option(
+        None, help=f"Hashing backend, one of {list(backends.BACKENDS)}"
+    ),
+    nloops: int = 4096,
+    difficulty: int = 8,
+    workers: int = os.cpu_count(),
+    output: Path = typer.Option(None, help="Write the results to this JSON file"),
+):
+    """Mine a recorded session against a local pool and print the results as JSON."""
+    from tuna import session
+
+    results = session.replay(
+        str(recording), backend, speed, nloops, difficulty, workers
+    )
+
+    text = json.dumps(results, indent=2)
+    if output is not None:
+        output.write_text(text + "\n")
+        logger.info(f"Replay results written to {output}")
+    else:
+        print(text)
+
+
+@app.command()
+def events(
+    log: Path = typer.Argument(..., help="An event log written with --events"),
+    csv: Path = typer.Option(None, help="Export the events to this CSV file"),
+    npy: Path = typer.Option(None, help="Export the events to this NumPy (.npy) file"),
+):
+    """Export an event log, or print the number of events of each kind."""
+    from tuna import events as event_log
+
+    if csv is not None:
+        count = event_log.to_csv(str(log), str(csv))
+        logger.info(f"Wrote {count} events to {csv}")
+    if npy is not None:
+        count = event_log.to_npy(str(log), str(npy))
+        logger.info(f"Wrote {count} events to {npy}")
+    if csv is None and npy is None:
+        counts = {kind.name: 0 for kind in event_log.Event}
+        for event in event_log.read(str(log)):
+            counts[event_log.Event(event[1]).name] += 1
+        print(json.dumps(counts, indent=2))
+
+
+@app.command()
+def proxy(
+    host: str = typer.Option("127.0.0.1", help="Address to serve local miners on"),
+    port: int = typer.Option(3643, help="Port to serve local miners on"),
+    batch_ms: float = typer.Option(
+        0.0, help="Wait this long after a share to send more shares with it"
+    ),
+    notify_timeout: float = typer.Option(
+        None,
+        help="Seconds without a job before switching pools (600 by default), 0 never",
+    ),
+):
+    """Serve local miners over a single connection to the Stratum pool."""
+    from tuna import proxy as stratum_proxy
+
+    config = settings()
+    connection = connect(config, notify_timeout=notify_timeout)
+
+    logger.info(f"tuna-py {__version__} proxy")
+    logger.info(f"Stratum Target: {config.stratum_host}:{config.stratum_port}")
+    logger.info(f"Serving miners on: {host}:{port}")
+
+    asyncio.run(stratum_proxy.serve(connection, host, port, batch_ms / 1000))
+
+
+@app.command()
+def solo(
+    state_file: Path = typer.Option(
+        None, help="A file with the CBOR hex of the StateV2 datum"
+    ),
+    state_url: str = typer.Option(
+        None, help="A local state service with GET /state and POST /solution"
+    ),
+    backend: str = typer.Option(
+        None, help=f"Hashing backend, one of {list(backends.BACKENDS)}"
+    ),
+    nloops: int = 4096,
+    workers: int = os.cpu_count(),
+    poll: float = typer.Option(1.0, help="Seconds between reads of the state"),
+    solutions: Path = typer.Option(
+        "solutions.jsonl", help="Append solutions to this file as JSON lines"
+    ),
+):
+    """Mine the block target of the chain state without a pool."""
+    from tuna import solo as solo_mining
+
+    if (state_file is None) == (state_url is None):
+        raise typer.BadParameter("Give one of --state-file or --state-url")
+    if state_file is not None:
+        source = solo_mining.FileStateSource(str(state_file))
+    else:
+        source = solo_mining.HttpStateSource(state_url)
+
+    miner = backends.select(backend, workers)
+    logger.info(f"tuna-py {__version__} solo")
+    logger.info(f"State: {source.name}")
+    logger.info(f"Address: {account().address.encode()}")
+    logger.info(f"Backend: {miner.name}")
+
+    solo_miner = solo_mining.SoloMiner(source, miner, nloops, poll, str(solutions))
+    asyncio.run(solo_miner.run())
+
+
+if __name__ == "__main__":
+    app()
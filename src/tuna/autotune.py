@@ -0,0 +1,145 @@
+"""Adjusts the batch size and submit difficulty while mining.
+
+The batch size (nloops) is scaled so a batch takes about `batch_seconds`, using moving
+averages of the batch time and batch size, so larger (more accurate) batches weigh
+more than small ones dominated by the fixed cost of a batch. The submit difficulty is kept at or above both
+the configured minimum and the pool difficulty, and is raised when the expected number
+of nonces per batch would fill the result buffer of a native backend (which drops any
+nonce past the cap).
+"""
+
+import logging
+import time
+from dataclasses import dataclass
+from dataclasses import field
+
+from tuna.utils import Target
+
+logger = logging.getLogger("tuna.autotune")
+
+# Weight of the newest batch in the moving averages
+SMOOTHING = 0.3
+
+# Only resize when the batch time is off by more than this fraction, so the batch size
+# does not jitter around the target
+TOLERANCE = 0.25
+
+# Keep the expected nonces per batch below this fraction of the result buffer, nonces
+# per batch vary (Poisson), so a batch expected to be half full can still overflow
+BUFFER_FILL = 0.25
+
+
+@dataclass
+class Adjustment:
+    """A change of batch size or submit difficulty."""
+
+    time: float
+    nloops: int
+    difficulty: int
+    reason: str
+
+
+@dataclass
+class Autotuner:
+    nloops: int
+    difficulty: int
+    batch_seconds: float = 1.5
+    max_nonces: int | None = None
+    min_nloops: int = 1
+    max_nloops: int = 1 << 20
+
+    # The configured submit difficulty is the lowest the tuner goes
+    min_difficulty: int = field(init=False)
+    average_seconds: float | None = field(default=None, init=False)
+    average_nloops: float | None = field(default=None, init=False)
+    adjustments: list[Adjustment] = field(default_factory=list, init=False)
+
+    def __post_init__(self):
+        self.min_difficulty = self.difficulty
+
+    @property
+    def loop_seconds(self) -> float | None:
+        """Estimated time per loop."""
+        if self.average_seconds is None:
+            return None
+        return self.average_seconds / self.average_nloops
+
+    @property
+    def target(self) -> Target:
+        return Target(self.difficulty)
+
+    def expected_nonces(self, hashes: int, difficulty: int) -> float:
+        """Expected number of hashes in a batch that meet a difficulty."""
+        return hashes * Target(difficulty).target_number / (1 << (16 + 4 * difficulty))
+
+    def adjust(self, nloops: int, difficulty: int, reason: str):
+        changes = []
+        if nloops != self.nloops:
+            changes.append(f"nloops {self.nloops} -> {nloops}")
+        if difficulty != self.difficulty:
+            changes.append(f"difficulty {self.difficulty} -> {difficulty}")
+        if not changes:
+            return
+        logger.info(f"Autotune: {', '.join(changes)} ({reason})")
+        self.nloops = nloops
+        self.difficulty = difficulty
+        self.adjustments.append(Adjustment(time.time(), nloops, difficulty, reason))
+
+    def record(
+        self,
+        seconds: float,
+        hashes: int,
+        nonces: int,
+        pool_difficulty: int | None = None,
+    ):
+        """Update the settings from a finished batch of the current `nloops`."""
+        reasons = []
+
+        # A native batch stops early once its buffer is full, so its time is not
+        # representative of the batch size
+        full = self.max_nonces is not None and nonces >= self.max_nonces
+        if full:
+            reasons.append(f"{nonces} nonces filled the buffer")
+        elif self.average_seconds is None:
+            self.average_seconds = seconds
+            self.average_nloops = self.nloops
+        else:
+            self.average_seconds += SMOOTHING * (seconds - self.average_seconds)
+            self.average_nloops += SMOOTHING * (self.nloops - self.average_nloops)
+
+        # Batch size, toward the target time
+        nloops = self.nloops
+        if (
+            self.loop_seconds is not None
+            and abs(seconds - self.batch_seconds) > TOLERANCE * self.batch_seconds
+        ):
+            nloops = round(self.batch_seconds / self.loop_seconds)
+            nloops = max(self.min_nloops, min(self.max_nloops, nloops))
+            if not full:
+                reasons.append(f"batch took {seconds:0.3f}s")
+
+        # Submit difficulty, never below the configured minimum or the pool (rounded
+        # down, pools may send a fractional difficulty)
+        floor = max(self.min_difficulty, int(pool_difficulty or 0))
+        difficulty = max(self.difficulty, floor)
+        if self.max_nonces is None:
+            difficulty = floor
+        else:
+            # Lowest difficulty that keeps the next batch well under the buffer cap
+            batch_hashes = hashes / self.nloops * nloops
+            cap = BUFFER_FILL * self.max_nonces
+            while self.expected_nonces(batch_hashes, difficulty) > cap:
+                difficulty += 1
+            while (
+                difficulty > floor
+                and self.expected_nonces(batch_hashes, difficulty - 1) <= cap
+            ):
+                difficulty -= 1
+
+        if difficulty != self.difficulty:
+            if difficulty == floor and pool_difficulty is not None:
+                reasons.append(f"pool difficulty {pool_difficulty}")
+            elif self.max_nonces is not None:
+                reasons.append(f"expected nonces per batch, cap {self.max_nonces}")
+
+        self.adjust(nloops, difficulty, ", ".join(reasons))
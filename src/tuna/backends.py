@@ -0,0 +1,397 @@
+import asyncio
+import logging
+import sys
+import time
+from concurrent.futures import Executor
+from dataclasses import asdict
+from dataclasses import dataclass
+from typing import AsyncIterator
+from typing import Iterable
+
+from tuna import cpu
+from tuna.jobs import CancelToken
+from tuna.nonces import NATIVE_BLOCK
+from tuna.nonces import NonceAllocator
+from tuna.nonces import NonceRange
+from tuna.utils import Target
+from tuna.utils import get_hash
+
+try:
+    from tuna.gpu_library import mine_cuda
+
+    HAS_GPU = True
+except ModuleNotFoundError:
+    HAS_GPU = False
+
+try:
+    from tuna.cpu_library import HASHES_PER_LOOP
+    from tuna.cpu_library import cpu_threads
+    from tuna.cpu_library import mine_cpu
+
+    HAS_NATIVE = True
+except ModuleNotFoundError:
+    HAS_NATIVE = False
+
+logger = logging.getLogger("tuna.backends")
+
+# Number of hashes per loop for the CUDA miner (block size * grid size)
+MAGIC_HASH_NUMBER = 256 * 32 * 32
+
+# Hashes per worker per loop for the python CPU miners, so the default nloops gives a
+# batch of roughly a second on a single core
+CPU_HASH_NUMBER = 256
+
+# Size of the nonce result buffer of the native miners, nonces past it are dropped
+MAX_NATIVE_NONCES = 10
+
+# Most leading zeros the native miners search, their 16 byte difficulty has no room
+# for more (MAX_LEADING_ZEROS in cpu.cpp and main.cu)
+MAX_NATIVE_ZEROS = 26
+
+# Hashes between checks for a cancelled batch in the single process CPU backends
+SUB_BATCH = 64 * CPU_HASH_NUMBER
+
+# Datum used to calibrate the backends, a real TargetState so the hash cost is the same
+CALIBRATION_DATUM = bytes.fromhex(
+    "d8799f500c1ba0d2f6d40300ee5b75c4ac0700005820c113b5d664e99fb7cd67bb5f66dab1a0e459196cde00e266757e46c1f274c47d1a12c730a0194ebf582000000004bb09871d46b848df66d8fa3f796e4de95c751b699103eee89cd35d9007199864ff"
+)
+CALIBRATION_WINDOW = slice(8, 20)
+
+# Calibration target, high enough that no nonce is ever found
+CALIBRATION_TARGET = Target(MAX_NATIVE_ZEROS)
+
+BACKENDS: dict[str, type["Backend"]] = {}
+
+
+def register(backend: type["Backend"]) -> type["Backend"]:
+    """Class decorator that adds a backend to the registry."""
+    BACKENDS[backend.name] = backend
+    return backend
+
+
+class Backend:
+    """Base class for hashing backends.
+
+    A backend searches a batch of nonces in the extra nonce window of a datum and
+    returns every window value (as hex) whose hash meets the target.
+    """
+
+    name: str = ""
+
+    # True if the backend stops early on a cancelled token and reports its progress
+    cancellable: bool = False
+
+    # Most nonces a batch can return, None if there is no limit
+    max_nonces: int | None = None
+
+    @classmethod
+    def available(cls) -> bool:
+        return True
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.shutdown()
+
+    def start(self):
+        pass
+
+    def shutdown(self):
+        pass
+
+    def hashes(self, nloops: int) -> int:
+        """Number of hashes in a batch of `nloops`."""
+        raise NotImplementedError
+
+    def allocate(
+        self, allocator: NonceAllocator, job_id: str, nloops: int
+    ) -> NonceRange:
+        """Reserve the nonces of the next batch, the batch starts at `range.start`."""
+        return allocator.allocate(job_id, self.hashes(nloops))
+
+    def mine(
+        self,
+        datum: bytes,
+        window: slice,
+        target: Target,
+        nloops: int,
+        cancel: CancelToken | None = None,
+    ) -> Iterable[str]:
+        """Search a batch of nonces, return the window values that meet the target."""
+        raise NotImplementedError
+
+
+def sub_batches(count: int, cancel: CancelToken | None = None):
+    """Split a batch into (offset, size) sub-batches, stopping when cancelled."""
+    for offset in range(0, count, SUB_BATCH):
+        if cancel is not None and cancel.cancelled:
+            return
+        size = min(SUB_BATCH, count - offset)
+        yield offset, size
+        if cancel is not None:
+            cancel.add(size)
+
+
+@register
+class HashlibBackend(Backend):
+    """Single process hashlib loop."""
+
+    name = "hashlib"
+    cancellable = True
+
+    def hashes(self, nloops: int) -> int:
+        return nloops * CPU_HASH_NUMBER
+
+    def mine(
+        self,
+        datum: bytes,
+        window: slice,
+        target: Target,
+        nloops: int,
+        cancel: CancelToken | None = None,
+    ) -> Iterable[str]:
+        start = int.from_bytes(datum[window])
+        for offset, size in sub_batches(self.hashes(nloops), cancel):
+            yield from cpu.search(datum, window, start + offset, size, target.threshold)
+
+
+@register
+class ProcessBackend(Backend):
+    """Hashlib loop spread over a pool of worker processes."""
+
+    name = "process"
+    cancellable = True
+
+    def __init__(self, workers: int | None = None):
+        self.miner = cpu.CPUMiner(workers)
+
+    def start(self):
+        self.miner.start()
+
+    def shutdown(self):
+        self.miner.shutdown()
+
+    def hashes(self, nloops: int) -> int:
+        return nloops * CPU_HASH_NUMBER * self.miner.workers
+
+    def mine(
+        self,
+        datum: bytes,
+        window: slice,
+        target: Target,
+        nloops: int,
+        cancel: CancelToken | None = None,
+    ) -> Iterable[str]:
+        return self.miner.mine(
+            datum, window, target.threshold, self.hashes(nloops), cancel
+        )
+
+
+class NativeBackend(Backend):
+    """Base for the compiled miners, which only take the number of leading zeros.
+
+    The returned nonces cover bytes 4-20 of the datum, they are cut down to the window
+    and checked against the full target. Targets past `MAX_NATIVE_ZEROS` are searched
+    at that many zeros. The miners set datum bytes 8-12 (thread) and 16-20 (increment)
+    themselves and keep bytes 12-16 of the datum, so each batch gets its own block of
+    nonces.
+
+    An extra nonce 1 longer than 4 bytes (a worker behind the tuna proxy) reaches into
+    the thread bytes, the miners keep those bytes and put the thread number after them.
+    """
+
+    max_nonces = MAX_NATIVE_NONCES
+
+    def allocate(
+        self, allocator: NonceAllocator, job_id: str, nloops: int
+    ) -> NonceRange:
+        # Only datum bytes 12-16 select the nonces, the miner fills in the rest
+        return allocator.allocate(job_id, NATIVE_BLOCK, align=NATIVE_BLOCK)
+
+    def zeros(self, target: Target) -> int:
+        return min(target.leading_zeros, MAX_NATIVE_ZEROS)
+
+    def filter(self, datum: bytes, window: slice, target: Target, nonces: list[str]):
+        payload = bytearray(datum)
+        found = []
+        for nonce in nonces:
+            payload[4:20] = bytes.fromhex(nonce)
+            if target.check(get_hash(payload)):
+                found.append(payload[window].hex())
+        return found
+
+
+@register
+class CPULibraryBackend(NativeBackend):
+    """Native multithreaded CPU miner (cpu_library), it stops a cancelled batch at the
+    next loop of each thread.
+    """
+
+    name = "native"
+    cancellable = True
+
+    @classmethod
+    def available(cls) -> bool:
+        return HAS_NATIVE
+
+    def hashes(self, nloops: int) -> int:
+        return HASHES_PER_LOOP * cpu_threads() * nloops
+
+    def mine(
+        self,
+        datum: bytes,
+        window: slice,
+        target: Target,
+        nloops: int,
+        cancel: CancelToken | None = None,
+    ) -> Iterable[str]:
+        keep = max(window.start - 8, 0)
+        if keep > 3:
+            raise ValueError(f"The native miner needs datum bytes 11-12, window {window}")
+
+        # The miner polls byte 0 and writes the hashes it did to bytes 8-16
+        state = bytearray(16) if cancel is None else cancel.native
+        nonces = mine_cpu(datum, self.zeros(target), nloops, state, keep)
+        if cancel is not None:
+            cancel.add(int.from_bytes(state[8:16], sys.byteorder))
+        return self.filter(datum, window, target, nonces)
+
+
+@register
+class CudaBackend(NativeBackend):
+    """CUDA miner (gpu_library)."""
+
+    name = "cuda"
+
+    @classmethod
+    def available(cls) -> bool:
+        return HAS_GPU
+
+    def hashes(self, nloops: int) -> int:
+        return MAGIC_HASH_NUMBER * nloops
+
+    def mine(
+        self,
+        datum: bytes,
+        window: slice,
+        target: Target,
+        nloops: int,
+        cancel: CancelToken | None = None,
+    ) -> Iterable[str]:
+        # The thread bits that do not fit after the kept bytes go to datum byte 19
+        keep = max(window.start - 8, 0)
+        if keep > 2:
+            raise ValueError(f"The CUDA miner needs datum bytes 10-12, window {window}")
+        nonces = mine_cuda(datum, self.zeros(target), nloops, keep)
+        return self.filter(datum, window, target, nonces)
+
+
+async def run(
+    backend: Backend,
+    datum: bytes,
+    window: slice,
+    target: Target,
+    nloops: int,
+    executor: Executor | None = None,
+    cancel: CancelToken | None = None,
+) -> AsyncIterator[str]:
+    """Run a batch in an executor, yielding nonces as the backend produces them."""
+    loop = asyncio.get_running_loop()
+
+    nonces = await loop.run_in_executor(
+        executor, lambda: iter(backend.mine(datum, window, target, nloops, cancel))
+    )
+
+    done = object()
+    while (nonce := await loop.run_in_executor(executor, next, nonces, done)) is not done:
+        yield nonce
+
+
+@dataclass
+class Calibration:
+    """Result of calibrating a backend."""
+
+    backend: str
+    nloops: int
+    hashes: int
+    seconds: float
+
+    @property
+    def hashrate(self) -> float:
+        return self.hashes / self.seconds
+
+    def to_dict(self) -> dict:
+        return asdict(self) | {"hashrate": self.hashrate}
+
+
+# Results of the last calibration, fastest first
+calibration: list[Calibration] = []
+
+
+def create(name: str, workers: int | None = None) -> Backend:
+    """Create a backend by name."""
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown backend {name}, choose from {list(BACKENDS)}")
+    backend = BACKENDS[name]
+    if not backend.available():
+        raise ValueError(f"Backend {name} is not available on this machine")
+    if backend is ProcessBackend:
+        return backend(workers)
+    return backend()
+
+
+def available() -> list[str]:
+    """Names of the backends that can run on this machine."""
+    return [name for name, backend in BACKENDS.items() if backend.available()]
+
+
+def measure(backend: Backend, seconds: float = 0.25, max_nloops: int = 4096):
+    """Time batches of doubling size until one takes at least `seconds`."""
+    nloops = 1
+    while True:
+        start = time.perf_counter()
+        list(
+            backend.mine(
+                CALIBRATION_DATUM, CALIBRATION_WINDOW, CALIBRATION_TARGET, nloops
+            )
+        )
+        elapsed = time.perf_counter() - start
+        if elapsed >= seconds or nloops >= max_nloops:
+            return Calibration(backend.name, nloops, backend.hashes(nloops), elapsed)
+        nloops *= 2
+
+
+def calibrate(
+    names: list[str] | None = None, workers: int | None = None, seconds: float = 0.25
+) -> list[Calibration]:
+    """Measure the hash rate of each available backend, fastest first."""
+    results = []
+    for name in names or available():
+        with create(name, workers) as backend:
+            # Warm up, so process pools and GPU contexts are not part of the timing
+            list(
+                backend.mine(CALIBRATION_DATUM, CALIBRATION_WINDOW, CALIBRATION_TARGET, 1)
+            )
+            result = measure(backend, seconds)
+        logger.info(
+            f"Calibration: {name:<8} {result.hashrate / 10 ** 6:0.3f} Mh/s "
+            + f"({result.hashes} hashes in {result.seconds:0.3f}s)"
+        )
+        results.append(result)
+
+    results.sort(key=lambda r: r.hashrate, reverse=True)
+    calibration[:] = results
+
+    return results
+
+
+def select(name: str | None = None, workers: int | None = None) -> Backend:
+    """Create the named backend, or calibrate and pick the fastest one."""
+    if name is None:
+        results = calibrate(workers=workers)
+        name = results[0].backend
+        logger.info(f"Selected fastest backend: {name}")
+
+    return create(name, workers)
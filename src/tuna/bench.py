@@ -0,0 +1,317 @@
+"""Benchmark suite, run with `python -m tuna bench`.
+
+Every benchmark returns a dict of plain numbers so the results can be saved as JSON and
+compared across versions and hosts.
+"""
+
+import asyncio
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from dataclasses import replace
+from typing import Callable
+
+from tuna import __version__
+from tuna import backends
+from tuna import codec
+from tuna import cpu
+from tuna import jobs
+from tuna import metrics
+from tuna import miner
+from tuna.mock import MockPool
+from tuna.mock import job_datum
+from tuna.stratum import LineFramer
+from tuna.stratum import Share
+from tuna.stratum import Stratum
+from tuna.stratum import dumps
+from tuna.datums import TargetState
+from tuna.utils import Target
+from tuna.utils import get_hash
+
+logger = logging.getLogger("tuna.bench")
+
+EXTRA_NONCE_1 = bytes.fromhex("0c1ba0d2")
+WINDOW = slice(8, 20)
+
+# Hashes per call in the search benchmarks
+SEARCH_SIZE = 1 << 14
+
+# Submit responses per notify in the recorded message stream
+SHARES_PER_JOB = 4
+
+# Cold import time of these modules in a fresh interpreter, with a budget in seconds for
+# the ones that should stay light
+IMPORT_BUDGETS = {
+    "tuna.config": 0.05,
+    "tuna.stratum": None,
+    "tuna.__main__": 0.2,
+}
+
+
+def rate(fn: Callable, seconds: float) -> dict:
+    """Call `fn` in doubling rounds until a round takes `seconds`, return calls/s."""
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        elapsed = time.perf_counter() - start
+        if elapsed >= seconds:
+            return {"calls": number, "seconds": elapsed, "rate": number / elapsed}
+        number *= 2
+
+
+def datum() -> bytes:
+    return codec.encode(replace(job_datum(1), nonce=EXTRA_NONCE_1 + bytes(12)))
+
+
+def bench_hash(seconds: float) -> dict:
+    """Double SHA-256 of a datum, one call per hash."""
+    payload = datum()
+    return rate(lambda: get_hash(payload), seconds)
+
+
+def bench_search(seconds: float) -> dict:
+    """CPU nonce search in a single thread, in hashes per second."""
+    payload = datum()
+    target = Target(32)
+    result = rate(
+        lambda: cpu.search(payload, WINDOW, 0, SEARCH_SIZE, target.threshold), seconds
+    )
+    result["rate"] *= SEARCH_SIZE
+    return result
+
+
+def bench_codec(seconds: float) -> dict:
+    """TargetState encode and decode, with tuna.codec and with pycardano."""
+    target = TargetState.from_cbor(datum())
+    payload = datum()
+    return {
+        "codec_encode": rate(lambda: codec.encode(target), seconds),
+        "codec_decode": rate(lambda: codec.decode(payload), seconds),
+        "pycardano_encode": rate(target.to_cbor, seconds),
+        "pycardano_decode": rate(lambda: TargetState.from_cbor(payload), seconds),
+    }
+
+
+def recorded_stream(jobs: int) -> tuple[bytes, int]:
+    """A pool message stream, a subscribe reply followed by `jobs` rounds of
+    set_difficulty, notify and submit responses. Returns the stream and message count.
+    """
+    messages = [{"id": 1, "result": [[], EXTRA_NONCE_1.hex(), 12], "error": None}]
+    share_id = 3
+    for job in range(1, jobs + 1):
+        messages.append({"id": 0, "method": "mining.set_difficulty", "params": [8]})
+        messages.append(
+            {
+                "id": 0,
+                "method": "mining.notify",
+                "params": [f"{job:08x}", codec.encode(job_datum(job)).hex()],
+            }
+        )
+        for _ in range(SHARES_PER_JOB):
+            messages.append({"id": share_id, "result": True, "error": None})
+            share_id += 1
+
+    return b"".join(dumps(m) + b"\n" for m in messages), len(messages)
+
+
+def bench_framer(seconds: float, jobs: int = 5000) -> dict:
+    """Line framing and JSON decoding, with reads that split messages anywhere."""
+    stream, count = recorded_stream(jobs)
+
+    results = {}
+    for size in [64, 1460, 65536]:
+
+        def frame():
+            framer = LineFramer()
+            for i in range(0, len(stream), size):
+                framer.feed(stream[i : i + size])
+
+        result = rate(frame, seconds)
+        result["rate"] *= count
+        results[f"read_{size}"] = result
+    return results
+
+
+async def _dispatch(stream: bytes, jobs: int, strict: bool = False) -> float:
+    conn = Stratum("127.0.0.1", 0, "addr", "worker", "", strict=strict)
+    conn.reconnect = False
+    conn.reader = asyncio.StreamReader()
+    conn.reader.feed_data(stream)
+    conn.reader.feed_eof()
+
+    # Unbounded, so the benchmark does not measure dropping messages
+    conn.messages = asyncio.Queue()
+
+    for share_id in range(3, 3 + jobs * SHARES_PER_JOB):
+        conn.shares[share_id] = Share(share_id, "", "", {})
+
+    start = time.perf_counter()
+    try:
+        await conn.listen()
+    except ConnectionError:
+        pass
+    return time.perf_counter() - start
+
+
+def bench_dispatch(seconds: float, jobs: int = 5000) -> dict:
+    """Parse and dispatch of a recorded message stream by `Stratum.listen`.
+
+    Measured with the default dispatch and in strict mode (pydantic validation).
+    """
+    stream, count = recorded_stream(jobs)
+
+    results = {}
+    for mode, strict in [("fast", False), ("strict", True)]:
+        rounds = 0
+        elapsed = 0.0
+        while elapsed < seconds:
+            elapsed += asyncio.run(_dispatch(stream, jobs, strict))
+            rounds += 1
+
+        results[mode] = {
+            "messages": rounds * count,
+            "seconds": elapsed,
+            "rate": rounds * count / elapsed,
+            "us_per_message": 10**6 * elapsed / (rounds * count),
+        }
+    return results
+
+
+def import_time(module: str) -> float:
+    """Seconds to import `module` in a new interpreter."""
+    code = (
+        "import time; start = time.perf_counter(); "
+        f"import {module}; print(time.perf_counter() - start)"
+    )
+    # The same import path as this interpreter, tuna may not be installed
+    env = os.environ | {"PYTHONPATH": os.pathsep.join(p for p in sys.path if p)}
+    result = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True, env=env
+    )
+    return float(result.stdout)
+
+
+def bench_import(seconds: float, runs: int = 3) -> dict:
+    """Cold start, the import time of the modules in `IMPORT_BUDGETS`."""
+    results = {}
+    for module, budget in IMPORT_BUDGETS.items():
+        times = []
+        start = time.perf_counter()
+        while len(times) < runs or time.perf_counter() - start < seconds:
+            times.append(import_time(module))
+
+        result = {
+            "runs": len(times),
+            "min_ms": 1000 * min(times),
+            "median_ms": 1000 * statistics.median(times),
+        }
+        if budget is not None:
+            result["budget_ms"] = 1000 * budget
+            result["within_budget"] = statistics.median(times) <= budget
+        results[module] = result
+    return results
+
+
+async def _end_to_end(
+    backend: backends.Backend,
+    seconds: float,
+    nloops: int,
+    difficulty: int,
+    notify_interval: float,
+) -> dict:
+    # The pool difficulty matches the submit difficulty, so no share is filtered
+    pool = MockPool(notify_interval=notify_interval, difficulty=difficulty)
+    async with pool:
+        conn = Stratum(pool.host, pool.port, "addr", "worker", "")
+        try:
+            await asyncio.wait_for(
+                miner.mine(conn, backend, Target(difficulty), nloops), seconds
+            )
+        except asyncio.TimeoutError:
+            pass
+
+    stats = conn.share_stats
+    batches = metrics.metrics.backends.get(backend.name, metrics.BackendMetrics())
+    return {
+        "backend": backend.name,
+        "seconds": seconds,
+        "hashes": batches.hashes,
+        "hashrate": batches.hashrate,
+        "batches": batches.batches,
+        "jobs": pool.job,
+        "shares_submitted": stats.submitted,
+        "shares_accepted": stats.accepted,
+        "shares_stale": stats.stale,
+        "share_latency": stats.mean_latency,
+        "job_switches": jobs.metrics.switches,
+        "job_switch_latency": jobs.metrics.mean_switch_latency,
+        "wasted_hashes": jobs.metrics.wasted_hashes,
+    }
+
+
+def bench_end_to_end(
+    name: str,
+    seconds: float,
+    nloops: int,
+    difficulty: int,
+    workers: int | None = None,
+) -> dict:
+    """Mine against a local mock pool that sends a new job every `seconds / 4`."""
+
+    # Start from empty counters for every run
+    metrics.metrics = metrics.Metrics()
+    jobs.metrics = jobs.JobMetrics()
+
+    backend = backends.create(name, workers)
+    return asyncio.run(
+        _end_to_end(backend, seconds, nloops, difficulty, notify_interval=seconds / 4)
+    )
+
+
+def run(
+    seconds: float = 1.0,
+    names: list[str] | None = None,
+    nloops: int = 16,
+    difficulty: int = 4,
+    workers: int | None = None,
+) -> dict:
+    """Run every benchmark, the end to end run once per backend."""
+    results = {
+        "tuna": __version__,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "time": time.time(),
+        "seconds": seconds,
+        "results": {},
+    }
+
+    benchmarks = {
+        "hash": bench_hash,
+        "search": bench_search,
+        "codec": bench_codec,
+        "framer": bench_framer,
+        "dispatch": bench_dispatch,
+        "import": bench_import,
+    }
+    for name, benchmark in benchmarks.items():
+        logger.info(f"Running benchmark: {name}")
+        results["results"][name] = benchmark(seconds)
+
+    end_to_end = {}
+    for name in names or backends.available():
+        logger.info(f"Running benchmark: end_to_end ({name})")
+        # Long enough for a few job switches
+        end_to_end[name] = bench_end_to_end(
+            name, max(4 * seconds, 2.0), nloops, difficulty, workers
+        )
+    results["results"]["end_to_end"] = end_to_end
+
+    return results
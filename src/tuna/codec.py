@@ -0,0 +1,158 @@
+"""Fast CBOR encoding and decoding of TargetState.
+
+pycardano serializes PlutusData through a generic CBOR encoder, which is slow for the
+hot loop. TargetState always has the same 7 fields, so it can be written and read
+directly:
+
+    d8 79           tag 121 (constructor 0)
+    9f              indefinite length array
+    50 <16 bytes>   nonce
+    58 1c <28>      miner
+    ...             block_number, current_hash, leading_zeros, target_number, epoch_time
+    ff              end of array
+
+The nonce is always the first field, so it always starts at byte 4 of the datum.
+"""
+
+from dataclasses import fields
+
+from tuna.datums import TargetState
+
+HEADER = bytes.fromhex("d8799f")
+BREAK = b"\xff"
+
+# Offset of the nonce in an encoded TargetState
+NONCE_OFFSET = 4
+
+# pycardano splits byte strings longer than this into chunks
+MAX_BYTES = 64
+
+FIELDS = [f.name for f in fields(TargetState)]
+
+
+def _head(major: int, value: int) -> bytes:
+    """CBOR item head, a major type and its argument in the shortest form."""
+    if value < 24:
+        return bytes([major << 5 | value])
+    elif value < 1 << 8:
+        return bytes([major << 5 | 24, value])
+    elif value < 1 << 16:
+        return bytes([major << 5 | 25]) + value.to_bytes(2)
+    elif value < 1 << 32:
+        return bytes([major << 5 | 26]) + value.to_bytes(4)
+    elif value < 1 << 64:
+        return bytes([major << 5 | 27]) + value.to_bytes(8)
+    raise ValueError(f"Value too large for the fast TargetState codec: {value}")
+
+
+def _encode_field(value: bytes | int) -> bytes:
+    if isinstance(value, bytes):
+        if len(value) > MAX_BYTES:
+            raise ValueError("Byte string too long for the fast TargetState codec")
+        return _head(2, len(value)) + value
+    elif value < 0:
+        return _head(1, -1 - value)
+    return _head(0, value)
+
+
+def encode(target: TargetState) -> bytes:
+    """Encode a TargetState, the same bytes as `target.to_cbor()`."""
+    return (
+        HEADER
+        + b"".join(_encode_field(getattr(target, name)) for name in FIELDS)
+        + BREAK
+    )
+
+
+def _decode_field(data: bytes, offset: int) -> tuple[bytes | int, int]:
+    initial = data[offset]
+    major = initial >> 5
+    info = initial & 0x1F
+    offset += 1
+
+    if info < 24:
+        value = info
+    elif info <= 27:
+        size = 1 << (info - 24)
+        value = int.from_bytes(data[offset : offset + size])
+        offset += size
+    else:
+        raise ValueError(f"Unsupported CBOR item 0x{initial:02x} in TargetState")
+
+    if major == 0:
+        return value, offset
+    elif major == 1:
+        return -1 - value, offset
+    elif major == 2:
+        return bytes(data[offset : offset + value]), offset + value
+    raise ValueError(f"Unsupported CBOR major type {major} in TargetState")
+
+
+def decode(data: bytes) -> TargetState:
+    """Decode an encoded TargetState, the same as `TargetState.from_cbor(data)`."""
+    if data[:2] != HEADER[:2]:
+        raise ValueError("Not a TargetState, expected constructor 0")
+
+    # Accept both indefinite (pycardano) and definite length arrays
+    if data[2] == 0x9F:
+        indefinite = True
+    elif data[2] == 0x80 | len(FIELDS):
+        indefinite = False
+    else:
+        raise ValueError("Not a TargetState, expected an array of 7 fields")
+
+    offset = 3
+    values = []
+    for _ in FIELDS:
+        value, offset = _decode_field(data, offset)
+        values.append(value)
+
+    if indefinite and data[offset : offset + 1] != BREAK:
+        raise ValueError("Not a TargetState, too many fields")
+
+    return TargetState(*values)
+
+
+class DatumTemplate:
+    """A job's TargetState, encoded once, with the nonce patched in place.
+
+    `window` is the extra nonce 2 part of the nonce, the part a miner is free to change.
+    """
+
+    buffer: bytearray
+    window: slice
+
+    def __init__(self, target: TargetState, extra_nonce_1: bytes):
+        self.buffer = bytearray(encode(target))
+        self.view = memoryview(self.buffer)
+
+        nonce_size = len(target.nonce)
+        self.window = slice(
+            NONCE_OFFSET + len(extra_nonce_1), NONCE_OFFSET + nonce_size
+        )
+        self.size = self.window.stop - self.window.start
+
+        self.view[NONCE_OFFSET : NONCE_OFFSET + len(extra_nonce_1)] = extra_nonce_1
+
+    @property
+    def nonce(self) -> int:
+        """The extra nonce 2 currently in the datum."""
+        return int.from_bytes(self.view[self.window])
+
+    @nonce.setter
+    def nonce(self, value: int):
+        self.view[self.window] = (value % (1 << (8 * self.size))).to_bytes(self.size)
+
+    def patch(self, nonce: str | bytes) -> bytes:
+        """Write an extra nonce 2 into the datum and return a snapshot of it."""
+        if isinstance(nonce, str):
+            nonce = bytes.fromhex(nonce)
+        self.view[self.window] = nonce
+        return bytes(self.buffer)
+
+    def datum(self) -> bytes:
+        """Snapshot of the encoded datum with the current nonce."""
+        return bytes(self.buffer)
+
+    def target(self) -> TargetState:
+        return decode(self.buffer)
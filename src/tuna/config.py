@@ -1,45 +1,126 @@
+"""Settings from the environment and `.env`, loaded on first use.
+
+Importing this module reads nothing: `settings()` (or `account()`, without the pool
+settings) reads the environment once, the wallet is only derived from `SEED` when the
+address is first needed, and the preview contract UTxOs (with their Plutus scripts) are
+only built by `preview()`.
+"""
+
 import os
+from dataclasses import dataclass
+from functools import cache
+from functools import cached_property
 
 from dotenv import load_dotenv
-from pycardano import Address
-from pycardano import ExtendedSigningKey
-from pycardano import HDWallet
-from pycardano import Network
-from pycardano import PlutusData
-from pycardano import PlutusV2Script
-from pycardano import TransactionId
-from pycardano import TransactionInput
-from pycardano import TransactionOutput
-from pycardano import UTxO
-from pycardano import Value
-
-load_dotenv()
-
-if os.environ.get("SEED", "") != "":
-
-    wallet = HDWallet.from_mnemonic(os.environ["SEED"])
-
-    SPEND_KEY = ExtendedSigningKey.from_hdwallet(
-        wallet.derive_from_path("m/1852'/1815'/0'/0/0"),
-    )
-    STAKE_KEY = ExtendedSigningKey.from_hdwallet(
-        wallet.derive_from_path("m/1852'/1815'/0'/2/0"),
-    )
-    ADDRESS = Address(
-        SPEND_KEY.to_verification_key().hash(),
-        STAKE_KEY.to_verification_key().hash(),
-        network=Network.TESTNET,
-    )
-elif os.environ.get("ADDRESS", None) is not None:
-    ADDRESS = Address.decode(os.environ["ADDRESS"])
-
-STRATUM_PASSWORD = os.environ["STRATUM_PASSWORD"]
-STRATUM_HOST = os.environ["STRATUM_HOST"]
-STRATUM_WORKER = os.environ["STRATUM_WORKER"]
-STRATUM_PORT = int(os.environ["STRATUM_PORT"])
-
-CONFIG = {
-    "preview": {
+
+
+@dataclass
+class Account:
+    """The miner's address, all that mining without a pool needs from the settings."""
+
+    # Either a seed phrase (needed to submit to the contract) or a bech32 address
+    seed: str | None = None
+    address_bech32: str | None = None
+
+    @classmethod
+    def from_env(cls) -> "Account":
+        load_dotenv()
+        return cls(
+            seed=os.environ.get("SEED") or None,
+            address_bech32=os.environ.get("ADDRESS"),
+        )
+
+    @cached_property
+    def wallet(self):
+        from pycardano import HDWallet
+
+        if self.seed is None:
+            raise ValueError("SEED is not set")
+        return HDWallet.from_mnemonic(self.seed)
+
+    @cached_property
+    def spend_key(self):
+        from pycardano import ExtendedSigningKey
+
+        return ExtendedSigningKey.from_hdwallet(
+            self.wallet.derive_from_path("m/1852'/1815'/0'/0/0"),
+        )
+
+    @cached_property
+    def stake_key(self):
+        from pycardano import ExtendedSigningKey
+
+        return ExtendedSigningKey.from_hdwallet(
+            self.wallet.derive_from_path("m/1852'/1815'/0'/2/0"),
+        )
+
+    @cached_property
+    def address(self):
+        from pycardano import Address
+        from pycardano import Network
+
+        if self.seed is not None:
+            return Address(
+                self.spend_key.to_verification_key().hash(),
+                self.stake_key.to_verification_key().hash(),
+                network=Network.TESTNET,
+            )
+        elif self.address_bech32 is not None:
+            return Address.decode(self.address_bech32)
+        raise ValueError("Either SEED or ADDRESS must be set")
+
+
+@dataclass(kw_only=True)
+class Settings(Account):
+    stratum_host: str
+    stratum_port: int
+    stratum_worker: str
+    stratum_password: str
+
+    # Backup pools, comma separated host:port
+    stratum_pools: str = ""
+
+    @classmethod
+    def from_env(cls) -> "Settings":
+        load_dotenv()
+        return cls(
+            stratum_host=os.environ["STRATUM_HOST"],
+            stratum_port=int(os.environ["STRATUM_PORT"]),
+            stratum_worker=os.environ["STRATUM_WORKER"],
+            stratum_password=os.environ["STRATUM_PASSWORD"],
+            stratum_pools=os.environ.get("STRATUM_POOLS", ""),
+            seed=os.environ.get("SEED") or None,
+            address_bech32=os.environ.get("ADDRESS"),
+        )
+
+
+@cache
+def settings() -> Settings:
+    """The settings of this process, read from the environment on the first call."""
+    return Settings.from_env()
+
+
+@cache
+def account() -> Account:
+    """The address settings only, read from the environment on the first call.
+
+    Unlike `settings()` this does not need the `STRATUM_*` variables.
+    """
+    return Account.from_env()
+
+
+@cache
+def preview() -> dict:
+    """Contract address and reference UTxOs on the preview network."""
+    from pycardano import Address
+    from pycardano import PlutusV2Script
+    from pycardano import TransactionId
+    from pycardano import TransactionInput
+    from pycardano import TransactionOutput
+    from pycardano import UTxO
+    from pycardano import Value
+
+    return {
         "address": "addr_test1wpwadl46nw6m80lqls3a4pgelmtm4z7980vr3d77clzzy6sfgnzsr",
         "spend": UTxO(
             input=TransactionInput(
@@ -84,4 +165,23 @@ CONFIG = {
             ),
         ),
     }
+
+
+# The module level names of earlier versions, resolved on first access
+_SETTINGS = {
+    "STRATUM_HOST": "stratum_host",
+    "STRATUM_PORT": "stratum_port",
+    "STRATUM_WORKER": "stratum_worker",
+    "STRATUM_PASSWORD": "stratum_password",
+    "ADDRESS": "address",
+    "SPEND_KEY": "spend_key",
+    "STAKE_KEY": "stake_key",
 }
+
+
+def __getattr__(name: str):
+    if name in _SETTINGS:
+        return getattr(settings(), _SETTINGS[name])
+    elif name == "CONFIG":
+        return {"preview": preview()}
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
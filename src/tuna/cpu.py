@@ -0,0 +1,114 @@
+import logging
+import os
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import wait
+from hashlib import sha256
+from typing import Iterator
+
+from tuna.jobs import CancelToken
+
+logger = logging.getLogger("tuna.cpu")
+
+# Number of sub-ranges each worker gets per batch, so nonces stream back before the
+# whole batch is finished and a cancelled batch stops after at most one sub-range
+CHUNKS_PER_WORKER = 16
+
+# How often to check for a cancelled batch while waiting on the workers
+CANCEL_INTERVAL = 0.02
+
+
+def search(
+    datum: bytes, window: slice, start: int, count: int, difficulty: bytes
+) -> list[str]:
+    """Hash `count` nonces starting at `start`, return the ones below `difficulty`."""
+    size = window.stop - window.start
+    prefix = sha256(datum[: window.start])
+    suffix = datum[window.stop :]
+
+    nonces = []
+    for nonce in range(start, start + count):
+        nonce_bytes = nonce.to_bytes(size)
+        first_hash = prefix.copy()
+        first_hash.update(nonce_bytes)
+        first_hash.update(suffix)
+        if sha256(first_hash.digest()).digest() < difficulty:
+            nonces.append(nonce_bytes.hex())
+
+    return nonces
+
+
+class CPUMiner:
+    """Mine on all cores, each worker process searches a disjoint nonce range."""
+
+    workers: int
+    executor: ProcessPoolExecutor | None = None
+
+    def __init__(self, workers: int | None = None):
+        self.workers = workers or os.cpu_count() or 1
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.shutdown()
+
+    def start(self):
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(self.workers)
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+            self.executor = None
+
+    def mine(
+        self,
+        datum: bytes,
+        window: slice,
+        difficulty: bytes,
+        count: int,
+        cancel: CancelToken | None = None,
+    ) -> Iterator[str]:
+        """Search `count` nonces after the one in the datum window.
+
+        The range is split evenly over the workers and nonces are yielded as soon as
+        the sub-range that found them is done. Sub-ranges that have not started yet are
+        dropped when `cancel` is cancelled.
+        """
+        self.start()
+
+        start = int.from_bytes(datum[window])
+        chunks = self.workers * CHUNKS_PER_WORKER
+        chunk_size = -(-count // chunks)
+
+        futures = {
+            self.executor.submit(
+                search,
+                datum,
+                window,
+                start + offset,
+                min(chunk_size, count - offset),
+                difficulty,
+            ): min(chunk_size, count - offset)
+            for offset in range(0, count, chunk_size)
+        }
+
+        pending = set(futures)
+        try:
+            while pending:
+                if cancel is not None and cancel.cancelled:
+                    break
+                done, pending = wait(
+                    pending, timeout=CANCEL_INTERVAL, return_when=FIRST_COMPLETED
+                )
+                for future in done:
+                    if cancel is not None:
+                        cancel.add(futures[future])
+                    yield from future.result()
+        finally:
+            # Sub-ranges that are already running can not be stopped, count them too
+            for future in pending:
+                if not future.cancel() and cancel is not None:
+                    cancel.add(futures[future])
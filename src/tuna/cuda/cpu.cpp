@@ -0,0 +1,205 @@
+// CPU only version of mine_cuda, built from the same sha256.c without CUDA.
+//
+// Every thread hashes its own slice of the nonce space using the same nonce layout as
+// the CUDA kernel:
+//   nonce[0] = unique pool part nonce (taken from the datum)
+//   nonce[1] = thread number, after the first `keep` bytes that are taken from the datum
+//              (a longer extra nonce 1, like the worker slot of the tuna proxy)
+//   nonce[2] = block nonce (taken from the datum, allocated per batch by tuna.nonces)
+//   nonce[3] = increment nonce
+//
+// A batch can be cancelled through an optional writable buffer: the threads stop at the
+// next loop once its first byte is set, and the number of hashes done is written to
+// bytes 8-16 (native endian) when the buffer is large enough.
+
+#include <atomic>
+#include <cstring>
+#include <iomanip>
+#include <mutex>
+#include <sstream>
+#include <stdexcept>
+#include <string>
+#include <thread>
+#include <vector>
+
+extern "C" {
+	#include "sha256.h"
+}
+
+#include <pybind11/pybind11.h>
+#include <pybind11/stl.h>
+
+namespace py = pybind11;
+
+// Number of hashes per thread per loop, so the same nloops gives a similar batch time
+// as the python CPU miner
+#define HASHES_PER_LOOP	256
+
+// Same size as the CUDA result buffer, 10 nonces of 4 words
+#define MAX_NONCES		10
+
+// Most leading zeros that fit the 16 byte difficulty, with room for the target number
+#define MAX_LEADING_ZEROS	26
+
+// Same as set_tuna_difficulty, but correct for an odd number of leading zeros
+void set_cpu_difficulty(unsigned char *difficulty, unsigned short difficulty_number, unsigned int leading_zeros) {
+	memset(difficulty, 0, 16);
+	if (leading_zeros > MAX_LEADING_ZEROS) {
+		// Nothing is below an all zero difficulty
+		return;
+	}
+
+	int byte_location = leading_zeros / 2;
+	if (leading_zeros % 2 == 0) {
+		difficulty[byte_location] = difficulty_number / 256;
+		difficulty[byte_location + 1] = difficulty_number % 256;
+	} else {
+		difficulty[byte_location] = difficulty_number / 4096;
+		difficulty[byte_location + 1] = (difficulty_number / 16) % 256;
+		difficulty[byte_location + 2] = (difficulty_number % 16) * 16;
+	}
+}
+
+void mine_thread(
+	const std::string &data,
+	const unsigned char *difficulty,
+	unsigned int thread_nonce,
+	unsigned int keep,
+	unsigned long NLOOPS,
+	std::vector<std::string> &output,
+	std::mutex &output_lock,
+	std::atomic<bool> &full,
+	const volatile unsigned char *cancel,
+	std::atomic<unsigned long long> &hashes
+) {
+	std::vector<unsigned char> datum(data.begin(), data.end());
+	unsigned char hash[32];
+	SHA256_CTX ctx;
+
+	unsigned long count = NLOOPS * HASHES_PER_LOOP;
+	memcpy(&datum[8 + keep], &thread_nonce, 4 - keep);
+
+	unsigned long loop;
+	for (loop = 0; loop < count; ++loop) {
+		// Stop early once the batch is cancelled, or the result buffer is full and more
+		// nonces would be dropped
+		if (loop % HASHES_PER_LOOP == 0 && (full || (cancel != nullptr && *cancel))) {
+			break;
+		}
+
+		unsigned int increment = (unsigned int) loop;
+		memcpy(&datum[16], &increment, 4);
+
+		sha256_init(&ctx);
+		sha256_update(&ctx, datum.data(), datum.size());
+		sha256_final(&ctx, hash);
+		sha256_init(&ctx);
+		sha256_update(&ctx, hash, 32);
+		sha256_final(&ctx, hash);
+
+		if (memcmp(hash, difficulty, 16) < 0) {
+			std::stringstream stream;
+			for (int i = 4; i < 20; ++i) {
+				stream << std::setfill('0') << std::setw(2) << std::hex << (unsigned int) datum[i];
+			}
+
+			std::lock_guard<std::mutex> guard(output_lock);
+			if (output.size() < MAX_NONCES) {
+				output.push_back(stream.str());
+			}
+			if (output.size() >= MAX_NONCES) {
+				full = true;
+			}
+		}
+	}
+
+	hashes += loop;
+}
+
+unsigned int cpu_threads() {
+	unsigned int threads = std::thread::hardware_concurrency();
+	return threads == 0 ? 1 : threads;
+}
+
+std::vector<std::string> mine_cpu(py::bytes datum, unsigned int zeros, unsigned long NLOOPS, py::object cancel, unsigned int keep) {
+	const std::string data(datum);
+
+	if (keep > 3) {
+		throw std::invalid_argument("keep must leave at least one byte for the thread number");
+	}
+	// Threads past the ones that fit in the remaining bytes would repeat nonces
+	unsigned int threads_count = cpu_threads();
+	if (keep == 3 && threads_count > 256) {
+		threads_count = 256;
+	}
+
+	// Keep the buffer exported until the threads are done with it
+	py::buffer_info cancel_info;
+	unsigned char *cancel_buffer = nullptr;
+	size_t cancel_size = 0;
+	if (!cancel.is_none()) {
+		cancel_info = py::buffer(cancel).request(true);
+		cancel_buffer = (unsigned char *) cancel_info.ptr;
+		cancel_size = (size_t) cancel_info.size * cancel_info.itemsize;
+	}
+
+	std::vector<std::string> output;
+	if (data.length() < 20) {
+		return output;
+	}
+
+	//Decodes and stores the difficulty in a 16-byte array for convenience
+	unsigned char difficulty[16];
+	set_cpu_difficulty(difficulty, 65535, zeros);
+
+	std::mutex output_lock;
+	std::atomic<bool> full(false);
+	std::atomic<unsigned long long> hashes(0);
+
+	{
+		// Hash without holding the GIL so the Stratum threads keep running
+		py::gil_scoped_release release;
+
+		std::vector<std::thread> threads;
+		for (unsigned int i = 0; i < threads_count; ++i) {
+			threads.emplace_back(
+				mine_thread,
+				std::cref(data),
+				difficulty,
+				i,
+				keep,
+				NLOOPS,
+				std::ref(output),
+				std::ref(output_lock),
+				std::ref(full),
+				cancel_size > 0 ? cancel_buffer : nullptr,
+				std::ref(hashes)
+			);
+		}
+		for (auto &thread : threads) {
+			thread.join();
+		}
+	}
+
+	if (cancel_size >= 16) {
+		unsigned long long done = hashes;
+		memcpy(cancel_buffer + 8, &done, 8);
+	}
+
+	return output;
+}
+
+PYBIND11_MODULE(cpu_library, m) {
+	m.doc() = "Fortuna miner...for cpu."; // optional module docstring
+
+	m.attr("HASHES_PER_LOOP") = HASHES_PER_LOOP;
+
+	m.def("mine_cpu", &mine_cpu, py::arg("datum"), py::arg("zeros"), py::arg("nloops"), py::arg("cancel") = py::none(), py::arg("keep") = 0, R"pbdoc(
+		Mine using all cpu cores, same arguments and output as mine_cuda, with an optional
+		cancel buffer and the number of datum bytes after byte 8 to keep.
+	)pbdoc");
+
+	m.def("cpu_threads", &cpu_threads, R"pbdoc(
+		Number of threads used by mine_cpu.
+	)pbdoc");
+}
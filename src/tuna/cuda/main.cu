@@ -5,6 +5,7 @@
 #include <stdbool.h>
 #include <stdint.h>
 #include <random>
+#include <stdexcept>
 
 #include "cuPrintf.cu"
 #include "cuPrintf.cuh"
@@ -50,6 +51,9 @@ namespace py = pybind11;
 #define GDIMY	1
 #endif
 
+// Most leading zeros that fit the 16 byte difficulty, with room for the target number
+#define MAX_LEADING_ZEROS	26
+
 __global__ void kernel_sha256d(unsigned int *nr, void *debug);
 
 
@@ -57,6 +61,8 @@ __constant__ unsigned char device_data[105];
 __constant__ unsigned char device_difficulty[16];
 __constant__ unsigned long device_msg_len;
 __constant__ unsigned long nloops;
+// Bytes at the start of the thread nonce taken from the datum, see mine_cuda
+__constant__ unsigned int device_keep = 0;
 
 inline void gpuAssert(cudaError_t code, char *file, int line, bool abort)
 {
@@ -212,12 +218,16 @@ unsigned char * get_file_data(char * fname, unsigned long * MSG_SIZE) {
 
 
 
-unsigned char * set_tuna_difficulty(unsigned short difficulty_number, unsigned char leading_zeros) {
+unsigned char * set_tuna_difficulty(unsigned short difficulty_number, unsigned int leading_zeros) {
 	int i;
 	unsigned char * difficulty = (unsigned char *) malloc(sizeof(unsigned char) * 16);
 	for(i=0; i<16; i++) {
 		difficulty[i] = 0;
 	}
+	if (leading_zeros > MAX_LEADING_ZEROS) {
+		// Past the end of the buffer, nothing is below an all zero difficulty
+		return difficulty;
+	}
 
 	int byte_location = leading_zeros / 2;
     if (leading_zeros % 2 == 0) {
@@ -730,9 +740,17 @@ __global__ void kernel_sha256d(unsigned int *nonce, void *debug) {
 	}
 	__syncthreads();
 
-	// Set the local nonce
+	// Set the local nonce, the thread number goes after the kept bytes of nonce[1] and
+	// the high thread bits that no longer fit there into the top byte of nonce[3]
+	unsigned int thread = NONCE_VAL;
+	unsigned int high = 0;
 	ctx.nonce[0] = nonce[0];
-	ctx.nonce[1] = NONCE_VAL;
+	if (device_keep == 0) {
+		ctx.nonce[1] = thread;
+	} else {
+		ctx.nonce[1] = (nonce[1] & ((1u << (8 * device_keep)) - 1)) | (thread << (8 * device_keep));
+		high = thread >> (32 - 8 * device_keep);
+	}
 	ctx.nonce[2] = nonce[2];
 	ctx.nonce[3] = nonce[3];
 	#else
@@ -768,7 +786,7 @@ __global__ void kernel_sha256d(unsigned int *nonce, void *debug) {
 	for (int loop = 0; loop < NLOOPS; loop ++) {
 
 		#ifndef VERIFY_HASH
-		ctx.nonce[3] = 2 * loop;
+		ctx.nonce[3] = (high << 24) | (2 * loop);
 		#endif
 
 		ctx.data.word[0] = shared_data.word[0];
@@ -930,10 +948,19 @@ __global__ void kernel_sha256d(unsigned int *nonce, void *debug) {
 }
 
 #ifndef VERIFY_HASH
-std::vector<std::string> mine_cuda(py::bytes datum, unsigned int zeros, unsigned long NLOOPS) {
+std::vector<std::string> mine_cuda(py::bytes datum, unsigned int zeros, unsigned long NLOOPS, unsigned int keep) {
 	const std::string data(datum);
 	unsigned long MSG_SIZE = data.length();
 
+	// The 2^18 thread numbers need 3 bytes, with `keep` bytes of nonce[1] taken the bits
+	// that do not fit go to the top byte of the increment nonce
+	if (keep > 2) {
+		throw std::invalid_argument("keep must leave two bytes for the thread number");
+	}
+	if (keep > 0 && 2 * NLOOPS >= (1ul << 24)) {
+		throw std::invalid_argument("nloops must be below 2^23 when keeping datum bytes");
+	}
+
 	dim3 DimGrid(GDIMX,GDIMY);
 	dim3 DimBlock(BDIMX,1);
 
@@ -948,11 +975,11 @@ std::vector<std::string> mine_cuda(py::bytes datum, unsigned int zeros, unsigned
 	memset(device_nonce, 0, sizeof(unsigned int) * 40);
 
 	// Initialize host nonce
-	std::mt19937 mt{ std::random_device{}() };
-	host_nonce[0] = *((unsigned int *) (data.data() + 4)); // unique pool part nonce
-	host_nonce[1] = 0; 									   // grid location nonce
-	host_nonce[2] = mt();								   // random nonce
-	host_nonce[3] = 0;									   // increment nonce
+	host_nonce[0] = *((unsigned int *) (data.data() + 4));  // unique pool part nonce
+	host_nonce[1] = *((unsigned int *) (data.data() + 8));  // grid location nonce, after
+	                                                        // the first `keep` bytes
+	host_nonce[2] = *((unsigned int *) (data.data() + 12)); // block nonce, per batch
+	host_nonce[3] = 0;									    // increment nonce
 
 	// Send nonce to device
 	CUDA_SAFE_CALL(cudaMalloc((void **) &device_nonce, 40 * sizeof(unsigned int)));
@@ -966,6 +993,7 @@ std::vector<std::string> mine_cuda(py::bytes datum, unsigned int zeros, unsigned
 	CUDA_SAFE_CALL(cudaMemcpyToSymbol(device_difficulty, &difficulty[0], 16));
 	CUDA_SAFE_CALL(cudaMemcpyToSymbol(device_msg_len, &MSG_SIZE, 4));
 	CUDA_SAFE_CALL(cudaMemcpyToSymbol(nloops, &NLOOPS, 4));
+	CUDA_SAFE_CALL(cudaMemcpyToSymbol(device_keep, &keep, 4));
 
 	//Launch Kernel
 	kernel_sha256d<<<DimGrid, DimBlock>>>(device_nonce, (void *) d_debug);
@@ -998,8 +1026,8 @@ std::vector<std::string> mine_cuda(py::bytes datum, unsigned int zeros, unsigned
 PYBIND11_MODULE(gpu_library, m) {
     m.doc() = "Fortuna miner...for cuda."; // optional module docstring
 
-    m.def("mine_cuda", &mine_cuda, R"pbdoc(
-        Mine using cuda.
+    m.def("mine_cuda", &mine_cuda, py::arg("datum"), py::arg("zeros"), py::arg("nloops"), py::arg("keep") = 0, R"pbdoc(
+        Mine using cuda, keeping the given number of datum bytes after byte 8.
     )pbdoc");
 }
 #endif
\ No newline at end of file
@@ -1,6 +1,6 @@
 from dataclasses import dataclass
 
-from tuna.config import ADDRESS
+from tuna.config import account
 
 from pycardano import PlutusData
 
@@ -34,7 +34,7 @@ class StateV2(PlutusData):
 
         return TargetState(
             nonce=bytes.fromhex("00000000"),
-            miner=ADDRESS.payment_part.payload,
+            miner=account().address.payment_part.payload,
             epoch_time=self.epoch_time,
             block_number=self.block_number,
             current_hash=self.current_hash,
@@ -0,0 +1,226 @@
+"""Append-only binary log of mining events, for analysis after the fact.
+
+Every event is a fixed size record written into a memory mapped file, so logging one is
+two `struct.pack_into` calls and costs a couple of microseconds:
+
+    header  magic (8 bytes), record count (8 bytes)
+    record  time (8), kind (1), status (1), padding (2), job (4), a (8), b (8), data (16)
+
+`job` numbers the jobs in the order they arrived (the job id itself is in the data of
+the JOB event), and the meaning of `a`, `b`, `status` and `data` depends on the kind:
+
+    JOB             a: pool difficulty      b: block leading zeros  data: job id
+    BATCH_START     a: nloops               b: first nonce
+    BATCH_END       a: hashes               b: nonces found         status: 1 if cancelled
+    NONCE           b: nonce length         status: 1 if valid      data: nonce
+    SHARE_SUBMITTED a: share id             b: nonce length         data: nonce
+    SHARE_RESULT    a: share id             b: latency (us)         status: SHARE_STATUS
+
+The count in the header is written after each record, so a reader never sees a partly
+written record. The file grows in steps of `GROW` records.
+"""
+
+import csv
+import logging
+import mmap
+import os
+import struct
+import time
+from enum import IntEnum
+
+from tuna.stratum import ShareStatus
+
+try:
+    import numpy as np
+
+    HAS_NUMPY = True
+except ModuleNotFoundError:
+    HAS_NUMPY = False
+
+logger = logging.getLogger("tuna.events")
+
+MAGIC = b"TUNAEVNT"
+HEADER = struct.Struct("<8sQ")
+COUNT = struct.Struct("<Q")
+RECORD = struct.Struct("<dBBxxIQQ16s")
+
+# Records added each time the file is full, ~1.5 MB
+GROW = 1 << 15
+
+FIELDS = ["time", "kind", "status", "job", "a", "b", "data"]
+
+
+class Event(IntEnum):
+    JOB = 1
+    BATCH_START = 2
+    BATCH_END = 3
+    NONCE = 4
+    SHARE_SUBMITTED = 5
+    SHARE_RESULT = 6
+
+
+SHARE_STATUS = {
+    ShareStatus.pending: 0,
+    ShareStatus.accepted: 1,
+    ShareStatus.rejected: 2,
+    ShareStatus.stale: 3,
+}
+
+if HAS_NUMPY:
+    DTYPE = np.dtype(
+        {
+            "names": FIELDS,
+            "formats": ["<f8", "u1", "u1", "<u4", "<u8", "<u8", "S16"],
+            "offsets": [0, 8, 9, 12, 16, 24, 32],
+            "itemsize": RECORD.size,
+        }
+    )
+
+
+class EventLog:
+    """Writes events to `path`, appending to the events already in it."""
+
+    path: str
+    map: mmap.mmap
+
+    def __init__(self, path: str):
+        self.path = path
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        self.job = 0
+
+        size = os.fstat(self.fd).st_size
+        if size < HEADER.size:
+            os.ftruncate(self.fd, HEADER.size + GROW * RECORD.size)
+            self.map = mmap.mmap(self.fd, 0)
+            HEADER.pack_into(self.map, 0, MAGIC, 0)
+            self.count = 0
+        else:
+            self.map = mmap.mmap(self.fd, 0)
+            magic, self.count = HEADER.unpack_from(self.map, 0)
+            if magic != MAGIC:
+                self.close()
+                raise ValueError(f"{path} is not an event log")
+            # Continue the job numbers of the previous run
+            if self.count > 0:
+                last = HEADER.size + (self.count - 1) * RECORD.size
+                self.job = RECORD.unpack_from(self.map, last)[3]
+        self.capacity = (len(self.map) - HEADER.size) // RECORD.size
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        if self.fd is None:
+            return
+        self.map.flush()
+        self.map.close()
+        os.close(self.fd)
+        self.fd = None
+
+    def grow(self):
+        self.map.close()
+        os.ftruncate(self.fd, HEADER.size + (self.capacity + GROW) * RECORD.size)
+        self.map = mmap.mmap(self.fd, 0)
+        self.capacity += GROW
+
+    def emit(
+        self,
+        kind: Event,
+        a: int = 0,
+        b: int = 0,
+        status: int = 0,
+        data: bytes = b"",
+    ):
+        if self.count == self.capacity:
+            self.grow()
+        RECORD.pack_into(
+            self.map,
+            HEADER.size + self.count * RECORD.size,
+            time.time(),
+            kind,
+            status,
+            self.job,
+            a,
+            b,
+            data,
+        )
+        self.count += 1
+        COUNT.pack_into(self.map, 8, self.count)
+
+    def new_job(self, job_id: str, difficulty: int | None, leading_zeros: int):
+        self.job += 1
+        # Pools may send a fractional difficulty, the validator rounds it down too
+        self.emit(Event.JOB, int(difficulty or 0), leading_zeros, data=job_id.encode())
+
+    def batch_start(self, nloops: int, nonce: int):
+        self.emit(Event.BATCH_START, nloops, nonce & 0xFFFFFFFFFFFFFFFF)
+
+    def batch_end(self, hashes: int, nonces: int, cancelled: bool):
+        self.emit(Event.BATCH_END, hashes, nonces, int(cancelled))
+
+    def nonce(self, nonce: str, valid: bool):
+        data = bytes.fromhex(nonce)
+        self.emit(Event.NONCE, 0, len(data), int(valid), data)
+
+    def share_submitted(self, share_id: int, nonce: str):
+        data = bytes.fromhex(nonce)
+        self.emit(Event.SHARE_SUBMITTED, share_id, len(data), data=data)
+
+    def share_result(self, share_id: int, status: ShareStatus, latency: float | None):
+        latency = 0 if latency is None else int(10**6 * latency)
+        self.emit(Event.SHARE_RESULT, share_id, latency, SHARE_STATUS[status])
+
+
+def read(path: str) -> list[tuple]:
+    """The events of a log as tuples of `FIELDS`."""
+    with open(path, "rb") as file:
+        data = file.read()
+    magic, count = HEADER.unpack_from(data, 0)
+    if magic != MAGIC:
+        raise ValueError(f"{path} is not an event log")
+    return [
+        RECORD.unpack_from(data, HEADER.size + i * RECORD.size) for i in range(count)
+    ]
+
+
+def to_numpy(path: str) -> "np.ndarray":
+    """The events of a log as a structured array with the fields in `FIELDS`."""
+    if not HAS_NUMPY:
+        raise RuntimeError("Reading events into arrays needs numpy")
+    with open(path, "rb") as file:
+        data = file.read()
+    magic, count = HEADER.unpack_from(data, 0)
+    if magic != MAGIC:
+        raise ValueError(f"{path} is not an event log")
+    return np.frombuffer(data, DTYPE, count, HEADER.size).copy()
+
+
+def to_npy(path: str, output: str) -> int:
+    """Save the events of a log as a structured NumPy array, return the count."""
+    events = to_numpy(path)
+    np.save(output, events)
+    return len(events)
+
+
+def to_csv(path: str, output: str) -> int:
+    """Write the events of a log to a CSV file, return the number of events."""
+    events = read(path)
+    with open(output, "w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(FIELDS)
+        for event in events:
+            time_, kind, status, job, a, b, data = event
+            # Job ids are text, nonces are bytes
+            if kind == Event.JOB:
+                data = data.rstrip(b"\0").decode("utf-8", "replace")
+            elif kind in (Event.NONCE, Event.SHARE_SUBMITTED):
+                data = data[:b].hex()
+            else:
+                data = ""
+            writer.writerow(
+                [f"{time_:0.6f}", Event(kind).name, status, job, a, b, data]
+            )
+    return len(events)
@@ -0,0 +1,97 @@
+import asyncio
+import logging
+import threading
+from dataclasses import dataclass
+
+logger = logging.getLogger("tuna.jobs")
+
+
+class CancelToken:
+    """Cancels a running batch when the job it is hashing for is replaced.
+
+    It is cancelled from the event loop and read by the hashing threads, backends check
+    it between sub-batches and report the hashes they finished with `add`. The native
+    miners poll the first byte of `native` instead, without holding the GIL.
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self.hashes = 0
+        self.native = bytearray(16)
+
+    def cancel(self):
+        self.native[0] = 1
+        self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def add(self, hashes: int):
+        with self._lock:
+            self.hashes += hashes
+
+
+async def cancel_on_notify(event: asyncio.Event, token: CancelToken):
+    """Cancel `token` as soon as `event` (a new job) is set."""
+    await event.wait()
+    token.cancel()
+
+
+@dataclass
+class JobMetrics:
+    """Cost of switching jobs.
+
+    The switch latency is the time from a notify arriving to the running batch
+    stopping, and wasted hashes are the hashes spent on a job after it was replaced.
+    The start latency is the time from a notify arriving to the first batch of the new
+    job starting.
+    """
+
+    switches: int = 0
+    switch_latency: float = 0.0
+    max_switch_latency: float = 0.0
+    wasted_hashes: int = 0
+    wasted_batches: int = 0
+
+    starts: int = 0
+    start_latency: float = 0.0
+    max_start_latency: float = 0.0
+
+    @property
+    def mean_switch_latency(self) -> float:
+        return self.switch_latency / self.switches if self.switches else 0.0
+
+    @property
+    def mean_start_latency(self) -> float:
+        return self.start_latency / self.starts if self.starts else 0.0
+
+    def record_start(self, notified: float, started: float):
+        """Record the first batch of a job starting at `started`."""
+        latency = max(started - notified, 0.0)
+        self.starts += 1
+        self.start_latency += latency
+        self.max_start_latency = max(self.max_start_latency, latency)
+
+    def record(self, notified: float, started: float, finished: float, hashes: int):
+        """Record a batch that was interrupted by a notify at `notified`."""
+        latency = max(finished - notified, 0.0)
+        self.switches += 1
+        self.switch_latency += latency
+        self.max_switch_latency = max(self.max_switch_latency, latency)
+
+        # Assume the hashes were spread evenly over the batch
+        if finished > started:
+            wasted = int(hashes * min(latency / (finished - started), 1.0))
+            self.wasted_hashes += wasted
+            if wasted > 0:
+                self.wasted_batches += 1
+
+        logger.debug(
+            f"Job switch: latency={1000 * latency:0.1f}ms, "
+            + f"wasted={self.wasted_hashes} hashes"
+        )
+
+
+metrics = JobMetrics()
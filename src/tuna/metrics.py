@@ -0,0 +1,316 @@
+"""Prometheus metrics for the miner.
+
+The hash loop records one observation per batch, everything else (shares, job switches,
+reconnects) is read from the objects that already count it when the endpoint is
+scraped, so collecting adds nothing to the hashing path.
+"""
+
+import asyncio
+import bisect
+import logging
+import time
+from collections import deque
+
+from tuna import jobs
+from tuna.autotune import Autotuner
+from tuna.stratum import Stratum
+from tuna.validator import ShareValidator
+
+logger = logging.getLogger("tuna.metrics")
+
+# Seconds of batches used for the rolling hash rate
+HASHRATE_WINDOW = 60.0
+
+BATCH_SECONDS_BUCKETS = [0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0]
+BATCH_NONCES_BUCKETS = [0, 1, 2, 5, 10, 20, 40]
+
+
+class Histogram:
+    """Cumulative histogram in the Prometheus format."""
+
+    def __init__(self, buckets: list[float]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, name: str, labels: str = "") -> list[str]:
+        lines = []
+        total = 0
+        for bound, count in zip(self.buckets + ["+Inf"], self.counts):
+            total += count
+            lines.append(f'{name}_bucket{{{labels}le="{bound}"}} {total}')
+        suffix = f"{{{labels.rstrip(',')}}}" if labels else ""
+        lines.append(f"{name}_sum{suffix} {self.sum}")
+        lines.append(f"{name}_count{suffix} {self.count}")
+        return lines
+
+
+class BackendMetrics:
+    """Batch counters for a single backend."""
+
+    def __init__(self):
+        self.hashes = 0
+        self.batches = 0
+        self.nonces = 0
+        self.batch_seconds = Histogram(BATCH_SECONDS_BUCKETS)
+        self.batch_nonces = Histogram(BATCH_NONCES_BUCKETS)
+
+        # (end time, seconds, hashes) of recent batches
+        self.recent: deque[tuple[float, float, int]] = deque()
+
+    def record(self, seconds: float, hashes: int, nonces: int):
+        now = time.monotonic()
+        self.hashes += hashes
+        self.batches += 1
+        self.nonces += nonces
+        self.batch_seconds.observe(seconds)
+        self.batch_nonces.observe(nonces)
+
+        self.recent.append((now, seconds, hashes))
+        while self.recent and self.recent[0][0] < now - HASHRATE_WINDOW:
+            self.recent.popleft()
+
+    @property
+    def hashrate(self) -> float:
+        """Hashes per second of hashing time over the last HASHRATE_WINDOW."""
+        seconds = sum(r[1] for r in self.recent)
+        return sum(r[2] for r in self.recent) / seconds if seconds > 0 else 0.0
+
+
+class Metrics:
+    """All miner metrics, rendered in the Prometheus text format."""
+
+    tuner: Autotuner | None = None
+    validator: ShareValidator | None = None
+
+    def __init__(self):
+        self.backends: dict[str, BackendMetrics] = {}
+        self.started = time.time()
+
+    def record_batch(self, backend: str, seconds: float, hashes: int, nonces: int):
+        """Record a finished (or cancelled) batch."""
+        if backend not in self.backends:
+            self.backends[backend] = BackendMetrics()
+        self.backends[backend].record(seconds, hashes, nonces)
+
+    def render(self, conn: Stratum | None = None) -> str:
+        lines = []
+
+        def metric(name: str, kind: str, help: str, samples: list[str]):
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(samples)
+
+        metric(
+            "tuna_start_time_seconds",
+            "gauge",
+            "Unix time the miner started.",
+            [f"tuna_start_time_seconds {self.started}"],
+        )
+
+        backends = list(self.backends.items())
+        metric(
+            "tuna_hashrate",
+            "gauge",
+            f"Hashes per second over the last {HASHRATE_WINDOW:g}s.",
+            [f'tuna_hashrate{{backend="{n}"}} {b.hashrate}' for n, b in backends],
+        )
+        metric(
+            "tuna_hashes_total",
+            "counter",
+            "Hashes computed.",
+            [f'tuna_hashes_total{{backend="{n}"}} {b.hashes}' for n, b in backends],
+        )
+        metric(
+            "tuna_batches_total",
+            "counter",
+            "Hashing batches run.",
+            [f'tuna_batches_total{{backend="{n}"}} {b.batches}' for n, b in backends],
+        )
+        metric(
+            "tuna_nonces_found_total",
+            "counter",
+            "Nonces found that meet the submit difficulty.",
+            [f'tuna_nonces_found_total{{backend="{n}"}} {b.nonces}' for n, b in backends],
+        )
+        metric(
+            "tuna_batch_duration_seconds",
+            "histogram",
+            "Wall time of a hashing batch.",
+            [
+                line
+                for n, b in backends
+                for line in b.batch_seconds.render(
+                    "tuna_batch_duration_seconds", f'backend="{n}",'
+                )
+            ],
+        )
+        metric(
+            "tuna_batch_nonces",
+            "histogram",
+            "Nonces found per hashing batch.",
+            [
+                line
+                for n, b in backends
+                for line in b.batch_nonces.render("tuna_batch_nonces", f'backend="{n}",')
+            ],
+        )
+
+        switches = jobs.metrics
+        metric(
+            "tuna_job_switches_total",
+            "counter",
+            "Batches interrupted by a new job.",
+            [f"tuna_job_switches_total {switches.switches}"],
+        )
+        metric(
+            "tuna_job_switch_latency_seconds_total",
+            "counter",
+            "Time from a notify to the running batch stopping, summed.",
+            [f"tuna_job_switch_latency_seconds_total {switches.switch_latency}"],
+        )
+        metric(
+            "tuna_job_switch_latency_seconds_max",
+            "gauge",
+            "Longest time from a notify to the running batch stopping.",
+            [f"tuna_job_switch_latency_seconds_max {switches.max_switch_latency}"],
+        )
+        metric(
+            "tuna_job_start_latency_seconds_total",
+            "counter",
+            "Time from a notify to the first batch of the new job starting, summed.",
+            [f"tuna_job_start_latency_seconds_total {switches.start_latency}"],
+        )
+        metric(
+            "tuna_job_starts_total",
+            "counter",
+            "Jobs that started hashing.",
+            [f"tuna_job_starts_total {switches.starts}"],
+        )
+        metric(
+            "tuna_wasted_hashes_total",
+            "counter",
+            "Estimated hashes spent on jobs that were already replaced.",
+            [f"tuna_wasted_hashes_total {switches.wasted_hashes}"],
+        )
+
+        if self.tuner is not None:
+            metric(
+                "tuna_nloops",
+                "gauge",
+                "Loops per batch set by the autotuner.",
+                [f"tuna_nloops {self.tuner.nloops}"],
+            )
+            metric(
+                "tuna_submit_difficulty",
+                "gauge",
+                "Submit difficulty set by the autotuner.",
+                [f"tuna_submit_difficulty {self.tuner.difficulty}"],
+            )
+            metric(
+                "tuna_autotune_adjustments_total",
+                "counter",
+                "Changes made by the autotuner.",
+                [f"tuna_autotune_adjustments_total {len(self.tuner.adjustments)}"],
+            )
+
+        if self.validator is not None:
+            checked = self.validator.stats
+            metric(
+                "tuna_shares_filtered_total",
+                "counter",
+                "Shares dropped before submitting, by reason.",
+                [
+                    f'tuna_shares_filtered_total{{reason="invalid"}} {checked.invalid}',
+                    f'tuna_shares_filtered_total{{reason="below_pool"}} {checked.below_pool}',
+                    f'tuna_shares_filtered_total{{reason="duplicate"}} {checked.duplicate}',
+                ],
+            )
+            metric(
+                "tuna_block_shares_total",
+                "counter",
+                "Shares that also meet the block difficulty.",
+                [f"tuna_block_shares_total {checked.blocks}"],
+            )
+
+        if conn is not None:
+            stats = conn.share_stats
+            metric(
+                "tuna_shares_total",
+                "counter",
+                "Shares by outcome, submitted counts every share sent.",
+                [
+                    f'tuna_shares_total{{status="submitted"}} {stats.submitted}',
+                    f'tuna_shares_total{{status="accepted"}} {stats.accepted}',
+                    f'tuna_shares_total{{status="rejected"}} {stats.rejected}',
+                    f'tuna_shares_total{{status="stale"}} {stats.stale}',
+                ],
+            )
+            metric(
+                "tuna_share_latency_seconds_total",
+                "counter",
+                "Round trip time of answered shares, summed.",
+                [f"tuna_share_latency_seconds_total {stats.latency}"],
+            )
+            metric(
+                "tuna_share_latency_seconds_max",
+                "gauge",
+                "Longest round trip time of an answered share.",
+                [f"tuna_share_latency_seconds_max {stats.max_latency}"],
+            )
+            metric(
+                "tuna_stratum_reconnects_total",
+                "counter",
+                "Connections to the Stratum server after the first.",
+                [f"tuna_stratum_reconnects_total {max(conn.connects - 1, 0)}"],
+            )
+            if conn.difficulty is not None:
+                metric(
+                    "tuna_pool_difficulty",
+                    "gauge",
+                    "Difficulty set by the pool.",
+                    [f"tuna_pool_difficulty {conn.difficulty}"],
+                )
+
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+async def serve(
+    port: int, conn: Stratum | None = None, host: str = "127.0.0.1"
+) -> asyncio.Server:
+    """Serve the metrics over HTTP, any path returns the Prometheus text."""
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            # Only the request line matters, skip the headers
+            await reader.readline()
+            while await reader.readline() not in (b"\r\n", b"\n", b""):
+                pass
+
+            body = metrics.render(conn).encode("utf-8")
+            writer.write(
+                b"HTTP/1.1 200 OK\r\n"
+                + b"Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                + f"Content-Length: {len(body)}\r\n".encode("utf-8")
+                + b"Connection: close\r\n\r\n"
+                + body
+            )
+            await writer.drain()
+        except ConnectionError as e:
+            logger.debug(f"Error serving metrics: {e}")
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, host, port)
+    logger.info(f"Serving metrics on http://{host}:{port}/metrics")
+
+    return server
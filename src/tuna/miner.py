@@ -0,0 +1,230 @@
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from tuna import backends
+from tuna import codec
+from tuna import jobs
+from tuna import metrics
+from tuna.autotune import Autotuner
+from tuna.events import EventLog
+from tuna.nonces import NonceAllocator
+from tuna.validator import ShareValidator
+from tuna.utils import Target
+from tuna.utils import get_hash
+from tuna.stratum import Share
+from tuna.stratum import ShareStatus
+from tuna.stratum import Stratum
+from tuna.stratum import StratumMethod
+
+logger = logging.getLogger("tuna.miner")
+
+
+async def mine(
+    connection: Stratum,
+    miner: backends.Backend,
+    target: Target,
+    nloops: int,
+    metrics_port: int | None = None,
+    metrics_host: str = "127.0.0.1",
+    tuner: Autotuner | None = None,
+    checkpoint: str | None = None,
+    events: EventLog | None = None,
+):
+
+    # Hashing runs on its own thread so the event loop keeps handling Stratum traffic
+    executor = ThreadPoolExecutor(1, thread_name_prefix="tuna-hash")
+    validator = ShareValidator()
+
+    async with connection as conn:
+
+        server = None
+        if metrics_port is not None:
+            metrics.metrics.tuner = tuner
+            metrics.metrics.validator = validator
+            server = await metrics.serve(metrics_port, conn, metrics_host)
+
+        await conn.subscribe()
+        await conn.authorize()
+
+        with miner, NonceAllocator(checkpoint) as allocator:
+            try:
+                await hash_loop(
+                    conn,
+                    miner,
+                    target,
+                    nloops,
+                    executor,
+                    allocator,
+                    validator,
+                    tuner,
+                    events,
+                )
+            finally:
+                executor.shutdown(wait=True, cancel_futures=True)
+                if server is not None:
+                    server.close()
+
+
+async def hash_loop(
+    conn: Stratum,
+    miner: backends.Backend,
+    target: Target,
+    nloops: int,
+    executor: ThreadPoolExecutor,
+    allocator: NonceAllocator,
+    validator: ShareValidator,
+    tuner: Autotuner | None = None,
+    events: EventLog | None = None,
+):
+
+    submit_count = 0
+    hash_count = 0
+    start = time.time()
+    next_hash_time = start + 10
+    job_id = None
+    template = None
+    started_job = None
+    while True:
+
+        while not conn.messages.empty():
+            message = conn.messages.get_nowait()
+            if hasattr(message, "method"):
+                logger.debug(message)
+
+                if message.method == StratumMethod.notify:
+                    # The connection was lost after this job arrived, wait for the
+                    # next one instead of waking up for this one again
+                    if conn.target is None:
+                        conn.notified.clear()
+                        continue
+                    logger.info(
+                        f"New job: {conn.job_id}, ({hash_count/(10 ** 6 * (time.time() - start)):0.3f} Mh/s, submissions={submit_count}, time={time.time() - start:0.3f}s),"
+                    )
+                    stats = conn.share_stats
+                    logger.info(
+                        f"Shares: submitted={stats.submitted}, accepted={stats.accepted}, rejected={stats.rejected}, stale={stats.stale}, latency={1000 * stats.mean_latency:0.1f}ms"
+                    )
+                    if jobs.metrics.switches > 0:
+                        logger.info(
+                            f"Job switch latency: {1000 * jobs.metrics.mean_switch_latency:0.1f}ms (max {1000 * jobs.metrics.max_switch_latency:0.1f}ms), wasted hashes: {jobs.metrics.wasted_hashes}"
+                        )
+                    if validator.stats.filtered > 0:
+                        logger.info(
+                            f"Filtered shares: invalid={validator.stats.invalid}, below_pool={validator.stats.below_pool}, duplicate={validator.stats.duplicate}"
+                        )
+                    logger.info(f"Difficulty: {conn.difficulty}")
+                    job_id = conn.job_id
+                    template = None
+                    validator.new_job(
+                        job_id, conn.target.leading_zeros, conn.target.target_number
+                    )
+                    if events is not None:
+                        events.new_job(
+                            job_id, conn.difficulty, conn.target.leading_zeros
+                        )
+                    conn.notified.clear()
+                    submit_count = 0
+                    hash_count = 0
+                    start = time.time()
+                    next_hash_time = start + 10
+                elif message.method == StratumMethod.difficulty:
+                    logger.debug(f"New difficulty: {conn.difficulty}")
+            elif isinstance(message, Share):
+                if events is not None:
+                    events.share_result(message.id, message.status, message.latency)
+                if message.status == ShareStatus.accepted:
+                    logger.debug(
+                        f"Successfully submitted nonce! ({1000 * message.latency:0.1f}ms)"
+                    )
+                else:
+                    logger.error(
+                        f"Error submitting nonce ({message.status.value}): {message.error}"
+                    )
+
+        # Raise any error from the listener or sender, e.g. a closed connection
+        for task in [conn.thread, conn.sender]:
+            if task.done():
+                task.result()
+
+        # Wait for the first job (or the listener failing)
+        if conn.target is None:
+            waiter = asyncio.ensure_future(conn.notified.wait())
+            await asyncio.wait(
+                [waiter, conn.thread], return_when=asyncio.FIRST_COMPLETED
+            )
+            waiter.cancel()
+            continue
+
+        # Encode the job once, batches only patch the nonce
+        if template is None:
+            template = codec.DatumTemplate(conn.target, conn.extra_nonce_1)
+        window = template.window
+
+        # Stop the batch as soon as a new job arrives
+        cancel = jobs.CancelToken()
+        watcher = asyncio.create_task(jobs.cancel_on_notify(conn.notified, cancel))
+
+        # Every batch gets nonces no other batch (or restart) has searched for this job
+        nonce_range = miner.allocate(
+            allocator, f"{conn.extra_nonce_1.hex()}:{job_id}", nloops
+        )
+        template.nonce = nonce_range.start
+
+        logger.debug(f"Starting {miner.name} hashing...")
+        batch_start = time.perf_counter()
+        if started_job != job_id:
+            jobs.metrics.record_start(conn.notify_time, batch_start)
+            started_job = job_id
+        if events is not None:
+            events.batch_start(nloops, nonce_range.start)
+        nonces = backends.run(
+            miner, template.datum(), window, target, nloops, executor, cancel
+        )
+
+        # Some backends stream nonces as they are found, so check the job for each
+        found = 0
+        async for nonce in nonces:
+            found += 1
+            if job_id != conn.job_id:
+                continue
+            hsh = get_hash(template.patch(nonce))
+            valid = validator.check(nonce, hsh, target, conn.difficulty)
+            if events is not None:
+                events.nonce(nonce, valid)
+            if not valid:
+                continue
+            logger.info(
+                f"Submitting nonce: {nonce}, hash={hsh.hex()}, address={conn.address}, worker={conn.worker}"
+            )
+            share = conn.submit_nonce(nonce)
+            if events is not None:
+                events.share_submitted(share.id, nonce)
+            submit_count += 1
+
+        watcher.cancel()
+        batch_end = time.perf_counter()
+        hashes = cancel.hashes if miner.cancellable else miner.hashes(nloops)
+        hash_count += hashes
+        metrics.metrics.record_batch(
+            miner.name, batch_end - batch_start, hashes, found
+        )
+        if events is not None:
+            events.batch_end(hashes, found, job_id != conn.job_id)
+
+        if job_id != conn.job_id:
+            jobs.metrics.record(conn.notify_time, batch_start, batch_end, hashes)
+            logger.debug(f"Cancelled {miner.name} hashing for new job")
+            continue
+
+        logger.debug(f"Finished {miner.name} hashing!")
+
+        if time.time() > next_hash_time:
+            next_hash_time += 10
+            logger.info(f"{hash_count/(10 ** 6 * (time.time() - start)):0.3f} Mh/s")
+
+        if tuner is not None:
+            tuner.record(batch_end - batch_start, hashes, found, conn.difficulty)
+            nloops = tuner.nloops
+            target = tuner.target
@@ -0,0 +1,280 @@
+"""Local stand-ins for a Stratum pool and the chain state, for benchmarks and tests.
+
+`MockPool` answers subscribe and authorize, sends set_difficulty and a notify to each
+miner that authorizes, sends a new job every `notify_interval` seconds, and accepts every
+submitted share (answered with the request id of the share).
+
+`StateServer` serves a `StateV2` datum over HTTP for solo mining, and advances it like
+the chain would when it is sent a valid solution.
+"""
+
+import asyncio
+import json
+import logging
+import time
+from dataclasses import replace
+
+from tuna import codec
+from tuna.datums import StateV2
+from tuna.datums import TargetState
+from tuna.stratum import dumps
+from tuna.stratum import loads
+from tuna.utils import Target
+from tuna.utils import get_hash
+
+logger = logging.getLogger("tuna.mock")
+
+
+def job_datum(job: int) -> TargetState:
+    """An arbitrary but valid TargetState for job number `job`."""
+    return TargetState(
+        nonce=bytes(16),
+        miner=bytes(28),
+        block_number=job,
+        current_hash=job.to_bytes(32),
+        leading_zeros=8,
+        target_number=65535,
+        epoch_time=100,
+    )
+
+
+class MockPool:
+
+    host: str
+    port: int
+    server: asyncio.Server | None = None
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        extra_nonce_1: bytes = bytes.fromhex("0c1ba0d2"),
+        extra_nonce_2_size: int = 12,
+        difficulty: int = 8,
+        notify_interval: float | None = None,
+    ):
+        self.host = host
+        self.port = port
+        self.extra_nonce_1 = extra_nonce_1
+        self.extra_nonce_2_size = extra_nonce_2_size
+        self.difficulty = difficulty
+        self.notify_interval = notify_interval
+
+        self.job = 0
+        self.writers: list[asyncio.StreamWriter] = []
+        self.received: list[dict] = []
+        self.submits: list[dict] = []
+        self.notify_times: list[float] = []
+        self.notifier: asyncio.Task | None = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def start(self):
+        """Start listening, port 0 picks a free port."""
+        self.server = await asyncio.start_server(self.handle, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        if self.notify_interval is not None:
+            self.notifier = asyncio.create_task(self.notify_loop())
+
+    async def close(self):
+        if self.notifier is not None:
+            self.notifier.cancel()
+        for writer in self.writers:
+            writer.close()
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        self.writers = []
+
+    def notify_message(self) -> dict:
+        return {
+            "id": 0,
+            "method": "mining.notify",
+            "params": [f"{self.job:08x}", codec.encode(job_datum(self.job)).hex()],
+        }
+
+    async def send(self, writer: asyncio.StreamWriter, message: dict):
+        writer.write(dumps(message) + b"\n")
+        await writer.drain()
+
+    async def notify(self):
+        """Send a new job to every authorized miner."""
+        self.job += 1
+        self.notify_times.append(time.perf_counter())
+        message = self.notify_message()
+        for writer in list(self.writers):
+            try:
+                await self.send(writer, message)
+            except ConnectionError:
+                self.writers.remove(writer)
+
+    async def notify_loop(self):
+        while True:
+            await asyncio.sleep(self.notify_interval)
+            await self.notify()
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while line := await reader.readline():
+                message = loads(line)
+                self.received.append(message)
+                await self.dispatch(writer, message)
+        except ConnectionError as e:
+            logger.debug(f"Miner disconnected: {e}")
+        finally:
+            if writer in self.writers:
+                self.writers.remove(writer)
+            writer.close()
+
+    async def dispatch(self, writer: asyncio.StreamWriter, message: dict):
+        method = message.get("method")
+        if method == "mining.subscribe":
+            await self.send(
+                writer,
+                {
+                    "id": message["id"],
+                    "result": [
+                        [],
+                        self.extra_nonce_1.hex(),
+                        self.extra_nonce_2_size,
+                    ],
+                    "error": None,
+                },
+            )
+        elif method == "mining.authorize":
+            await self.send(writer, {"id": message["id"], "result": True, "error": None})
+            await self.send(
+                writer,
+                {"id": 0, "method": "mining.set_difficulty", "params": [self.difficulty]},
+            )
+            if self.job == 0:
+                self.job = 1
+                self.notify_times.append(time.perf_counter())
+            await self.send(writer, self.notify_message())
+            self.writers.append(writer)
+        elif method == "mining.submit":
+            self.submits.append(message)
+            await self.send(writer, {"id": message["id"], "result": True, "error": None})
+
+
+def genesis_state(leading_zeros: int = 4, target_number: int = 65535) -> StateV2:
+    """An arbitrary first state with an easy block difficulty."""
+    return StateV2(
+        block_number=0,
+        current_hash=bytes(32),
+        leading_zeros=leading_zeros,
+        target_number=target_number,
+        epoch_time=0,
+        current_posix_time=int(1000 * time.time()),
+        merkle_root=bytes(32),
+    )
+
+
+class StateServer:
+    """Serves `GET /state` (the CBOR hex of the state) and `POST /solution`.
+
+    A solution is a JSON object with the hex `datum` that was hashed. It is accepted if
+    the datum is for the current block and its hash meets the block target, and the
+    state then advances to the next block with the solution's hash.
+    """
+
+    host: str
+    port: int
+    server: asyncio.Server | None = None
+
+    def __init__(self, state: StateV2, host: str = "127.0.0.1", port: int = 0):
+        self.state = state
+        self.host = host
+        self.port = port
+        self.accepted: list[dict] = []
+        self.rejected: list[dict] = []
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def start(self):
+        """Start listening, port 0 picks a free port."""
+        self.server = await asyncio.start_server(self.handle, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+
+    def advance(self, current_hash: bytes):
+        """Move to the next block, as if a solution with this hash was minted."""
+        self.state = replace(
+            self.state,
+            block_number=self.state.block_number + 1,
+            current_hash=current_hash,
+            current_posix_time=int(1000 * time.time()),
+        )
+
+    def solve(self, solution: dict) -> bool:
+        """Check a solution against the current state, advance if it is valid."""
+        try:
+            datum = bytes.fromhex(solution["datum"])
+            target = codec.decode(datum)
+        except (KeyError, ValueError) as e:
+            logger.debug(f"Invalid solution {solution}: {e}")
+            return False
+
+        hsh = get_hash(datum)
+        state = self.state
+        if (
+            target.block_number != state.block_number
+            or target.current_hash != state.current_hash
+            or not Target(state.leading_zeros, state.target_number).check(hsh)
+        ):
+            return False
+
+        self.advance(hsh)
+        return True
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            method, path, _ = (await reader.readline()).decode("utf-8").split(" ", 2)
+            length = 0
+            while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                name, _, value = line.decode("utf-8").partition(":")
+                if name.strip().lower() == "content-length":
+                    length = int(value)
+            body = await reader.readexactly(length) if length else b""
+
+            status = "200 OK"
+            if method == "GET" and path == "/state":
+                response = self.state.to_cbor_hex().encode("utf-8")
+            elif method == "POST" and path == "/solution":
+                solution = json.loads(body)
+                accepted = self.solve(solution)
+                (self.accepted if accepted else self.rejected).append(solution)
+                response = json.dumps({"accepted": accepted}).encode("utf-8")
+            else:
+                status = "404 Not Found"
+                response = b""
+
+            writer.write(
+                f"HTTP/1.1 {status}\r\n".encode("utf-8")
+                + f"Content-Length: {len(response)}\r\n".encode("utf-8")
+                + b"Connection: close\r\n\r\n"
+                + response
+            )
+            await writer.drain()
+        except (ConnectionError, ValueError) as e:
+            logger.debug(f"Error serving state: {e}")
+        finally:
+            writer.close()
@@ -0,0 +1,157 @@
+"""Collision free nonce ranges, persisted across restarts.
+
+The allocator keeps a cursor per job and hands out ranges of the extra nonce 2 window by
+moving the cursor forward, so no two batches (or worker processes sharing the
+checkpoint file) ever search the same nonces for a job. The cursors are kept in a small
+memory mapped file:
+
+    header  magic (8 bytes), sequence (8 bytes)
+    slot    job key (32 bytes), cursor (16 bytes, big endian), sequence (8 bytes)
+
+There are `SLOTS` slots, a new job takes the least recently used one. The cursor is
+written before a range is handed out, so a miner restarted during a batch skips the
+rest of that range instead of hashing it again.
+"""
+
+import logging
+import mmap
+import os
+import struct
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass
+from hashlib import sha256
+
+try:
+    import fcntl
+
+    HAS_FCNTL = True
+except ModuleNotFoundError:
+    HAS_FCNTL = False
+
+logger = logging.getLogger("tuna.nonces")
+
+MAGIC = b"TUNANONC"
+HEADER = struct.Struct("<8sQ")
+SLOT = struct.Struct("<32s16sQ")
+SLOTS = 16
+SIZE = HEADER.size + SLOTS * SLOT.size
+
+# Native miners set datum bytes 16-20 (an increment, the low 4 bytes of the window) and
+# bytes 8-12 (the thread) themselves, only bytes 12-16 come from the datum. A native
+# batch takes a whole block of 2**32 nonces and the allocator never reaches the nonces
+# of threads other than the first.
+NATIVE_BLOCK = 1 << 32
+
+
+@dataclass(frozen=True)
+class NonceRange:
+    start: int
+    count: int
+
+    @property
+    def stop(self) -> int:
+        return self.start + self.count
+
+
+def job_key(job_id: str) -> bytes:
+    key = job_id.encode("utf-8")
+    if len(key) > 32:
+        key = sha256(key).digest()
+    return key.ljust(32, b"\0")
+
+
+class NonceAllocator:
+    """Hands out disjoint nonce ranges per job, optionally checkpointed to `path`.
+
+    Allocation is safe across threads, and across processes sharing the same file.
+    """
+
+    path: str | None
+    map: mmap.mmap
+
+    def __init__(self, path: str | None = None, size: int = 12):
+        self.path = path
+        self.limit = 1 << (8 * size)
+        self.lock = threading.Lock()
+        self.fd = None
+
+        if path is None:
+            self.map = mmap.mmap(-1, SIZE)
+        else:
+            self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+            if os.fstat(self.fd).st_size < SIZE:
+                os.ftruncate(self.fd, SIZE)
+            self.map = mmap.mmap(self.fd, SIZE)
+
+        with self.locked():
+            magic, _ = HEADER.unpack_from(self.map, 0)
+            if magic != MAGIC:
+                if magic.strip(b"\0"):
+                    logger.warning(f"Resetting invalid nonce checkpoint {path}")
+                self.map[:] = bytes(SIZE)
+                HEADER.pack_into(self.map, 0, MAGIC, 0)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        self.map.close()
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    @contextmanager
+    def locked(self):
+        """Hold the thread lock, and the file lock when there is a checkpoint file."""
+        with self.lock:
+            if HAS_FCNTL and self.fd is not None:
+                fcntl.flock(self.fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if HAS_FCNTL and self.fd is not None:
+                    fcntl.flock(self.fd, fcntl.LOCK_UN)
+
+    def _find(self, key: bytes) -> tuple[int, int]:
+        """Slot offset and cursor of a job, a fresh least recently used slot if new."""
+        oldest = None
+        for i in range(SLOTS):
+            offset = HEADER.size + i * SLOT.size
+            slot_key, cursor, sequence = SLOT.unpack_from(self.map, offset)
+            if slot_key == key:
+                return offset, int.from_bytes(cursor)
+            if oldest is None or sequence < oldest[1]:
+                oldest = (offset, sequence)
+        return oldest[0], 0
+
+    def allocate(self, job_id: str, count: int, align: int = 1) -> NonceRange:
+        """Reserve the next `count` nonces of a job, starting at a multiple of `align`."""
+        key = job_key(job_id)
+        with self.locked():
+            magic, sequence = HEADER.unpack_from(self.map, 0)
+            offset, cursor = self._find(key)
+
+            start = -(-cursor // align) * align
+            if start + count > self.limit:
+                raise ValueError(f"Nonce space exhausted for job {job_id}")
+
+            sequence += 1
+            HEADER.pack_into(self.map, 0, magic, sequence)
+            SLOT.pack_into(
+                self.map, offset, key, (start + count).to_bytes(16), sequence
+            )
+
+        return NonceRange(start, count)
+
+    def consumed(self, job_id: str) -> int:
+        """Nonces handed out for a job so far (the job's cursor)."""
+        with self.locked():
+            return self._find(job_key(job_id))[1]
+
+    def flush(self):
+        self.map.flush()
+
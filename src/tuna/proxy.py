@@ -0,0 +1,247 @@
+"""Stratum proxy, many local miners on one upstream pool connection.
+
+The proxy holds a single upstream `Stratum` session and serves the same mining.*
+protocol to local workers. Each worker gets its own slice of the upstream extra nonce 2:
+the first `prefix_size` bytes are fixed to the worker's slot and are appended to the
+extra nonce 1 the worker sees, so workers never search the same nonces.
+
+    upstream:   extra_nonce_1 | extra_nonce_2 (12 bytes)
+    worker 5:   extra_nonce_1 + 0005 | extra_nonce_2 (10 bytes)
+
+Notify and set_difficulty are sent to every worker, and shares are forwarded upstream
+with the worker's prefix added back to the nonce. Answers are routed back to the
+worker under its own request id.
+"""
+
+import asyncio
+import logging
+
+from tuna.stratum import Share
+from tuna.stratum import ShareStatus
+from tuna.stratum import Stratum
+from tuna.stratum import StratumMessage
+from tuna.stratum import StratumMethod
+from tuna.stratum import StratumSubscribed
+from tuna.stratum import dumps
+from tuna.stratum import loads
+
+logger = logging.getLogger("tuna.proxy")
+
+# Bytes of extra nonce 2 reserved for the worker slot, 65536 workers
+PREFIX_SIZE = 2
+
+
+class Worker:
+    """A downstream miner connected to the proxy."""
+
+    slot: int
+    prefix: bytes
+    writer: asyncio.StreamWriter
+    authorized: bool = False
+    name: str = ""
+
+    def __init__(self, slot: int, prefix_size: int, writer: asyncio.StreamWriter):
+        self.slot = slot
+        self.prefix = slot.to_bytes(prefix_size)
+        self.writer = writer
+
+    async def send(self, message: dict):
+        self.writer.write(dumps(message) + b"\n")
+        await self.writer.drain()
+
+
+class Proxy:
+
+    upstream: Stratum
+    host: str
+    port: int
+    server: asyncio.Server | None = None
+
+    def __init__(
+        self,
+        upstream: Stratum,
+        host: str = "127.0.0.1",
+        port: int = 3643,
+        prefix_size: int = PREFIX_SIZE,
+    ):
+        self.upstream = upstream
+        self.host = host
+        self.port = port
+        self.prefix_size = prefix_size
+
+        self.workers: dict[int, Worker] = {}
+
+        # Upstream share id to the worker and the request id it used
+        self.pending: dict[int, tuple[Worker, int]] = {}
+
+        # Set once the upstream subscription gave us the extra nonces
+        self.subscribed = asyncio.Event()
+        self.notify: dict | None = None
+        self.difficulty: dict | None = None
+
+    async def start(self):
+        """Start serving workers, port 0 picks a free port."""
+        self.server = await asyncio.start_server(self.handle, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        logger.info(f"Proxy listening on {self.host}:{self.port}")
+
+    async def close(self):
+        for worker in list(self.workers.values()):
+            worker.writer.close()
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+
+    def allocate(self, writer: asyncio.StreamWriter) -> Worker:
+        """Give a new worker the lowest free slot."""
+        slot = next(i for i in range(len(self.workers) + 1) if i not in self.workers)
+        if slot >= 1 << (8 * self.prefix_size):
+            raise ConnectionError("No free worker slots")
+        worker = Worker(slot, self.prefix_size, writer)
+        self.workers[slot] = worker
+        return worker
+
+    async def broadcast(self, message: dict):
+        for worker in list(self.workers.values()):
+            if not worker.authorized:
+                continue
+            try:
+                await worker.send(message)
+            except ConnectionError as e:
+                logger.debug(f"Error sending to worker {worker.slot}: {e}")
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        worker = self.allocate(writer)
+        logger.info(f"Worker {worker.slot} connected")
+        try:
+            while line := await reader.readline():
+                try:
+                    message = loads(line)
+                except ValueError as e:
+                    logger.debug(f"Error decoding worker message {line}: {e}")
+                    continue
+                await self.dispatch(worker, message)
+        except ConnectionError as e:
+            logger.debug(f"Worker {worker.slot} disconnected: {e}")
+        finally:
+            logger.info(f"Worker {worker.slot} ({worker.name}) disconnected")
+            del self.workers[worker.slot]
+            writer.close()
+
+    async def dispatch(self, worker: Worker, message: dict):
+        method = message.get("method")
+        if method == StratumMethod.subscribe.value:
+            await self.subscribed.wait()
+            upstream = self.upstream
+            await worker.send(
+                {
+                    "id": message.get("id"),
+                    "result": [
+                        [],
+                        (upstream.extra_nonce_1 + worker.prefix).hex(),
+                        len(upstream.extra_nonce_2) - self.prefix_size,
+                    ],
+                    "error": None,
+                }
+            )
+        elif method == StratumMethod.authorize.value:
+            worker.name = message["params"][0]
+            worker.authorized = True
+            await worker.send({"id": message.get("id"), "result": True, "error": None})
+            if self.difficulty is not None:
+                await worker.send(self.difficulty)
+            if self.notify is not None:
+                await worker.send(self.notify)
+        elif method == StratumMethod.submit.value:
+            _, job_id, nonce = message["params"]
+            share = self.upstream.submit_nonce(worker.prefix.hex() + nonce, job_id)
+            self.pending[share.id] = (worker, message.get("id"))
+        else:
+            logger.debug(f"Unknown worker message: {message}")
+
+    def resubscribed(self):
+        """The upstream reconnected with a new extra nonce 1, workers must resubscribe.
+
+        Workers are disconnected so they reconnect and get the new extra nonce 1, their
+        pending shares were recorded as stale by the upstream.
+        """
+        logger.warning(f"Upstream resubscribed, disconnecting {len(self.workers)} workers")
+        self.notify = None
+        for worker in list(self.workers.values()):
+            worker.writer.close()
+
+    async def answer(self, share: Share):
+        """Send the pool's answer for a forwarded share to its worker."""
+        if share.id not in self.pending:
+            return
+        worker, request_id = self.pending.pop(share.id)
+        if self.workers.get(worker.slot) is not worker:
+            return
+        try:
+            await worker.send(
+                {
+                    "id": request_id,
+                    "result": share.status == ShareStatus.accepted,
+                    "error": share.error,
+                }
+            )
+        except ConnectionError as e:
+            logger.debug(f"Error answering worker {worker.slot}: {e}")
+
+    async def run(self):
+        """Relay upstream messages to the workers until the upstream fails."""
+        upstream = self.upstream
+        while True:
+            getter = asyncio.ensure_future(upstream.messages.get())
+            await asyncio.wait(
+                [getter, upstream.thread, upstream.sender],
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            for task in [upstream.thread, upstream.sender]:
+                if task.done():
+                    getter.cancel()
+                    task.result()
+            message = await getter
+
+            if isinstance(message, StratumSubscribed):
+                if self.subscribed.is_set():
+                    self.resubscribed()
+                self.subscribed.set()
+            elif isinstance(message, StratumMessage):
+                relay = {
+                    "id": message.id,
+                    "method": message.method.value,
+                    "params": message.params,
+                }
+                if message.method == StratumMethod.notify:
+                    logger.info(f"New job: {message.job}, {len(self.workers)} workers")
+                    self.notify = relay
+                elif message.method == StratumMethod.difficulty:
+                    self.difficulty = relay
+                await self.broadcast(relay)
+            elif isinstance(message, Share):
+                await self.answer(message)
+            else:
+                logger.debug(message)
+
+
+async def serve(
+    upstream: Stratum,
+    host: str = "127.0.0.1",
+    port: int = 3643,
+    batch_delay: float = 0.0,
+):
+    """Connect upstream and serve workers until the upstream connection fails."""
+    upstream.batch_delay = batch_delay
+
+    async with upstream as conn:
+        proxy = Proxy(conn, host, port)
+        await proxy.start()
+
+        await conn.subscribe()
+        await conn.authorize()
+
+        try:
+            await proxy.run()
+        finally:
+            await proxy.close()
@@ -0,0 +1,42 @@
+"""Pydantic models of the Stratum messages, used by `Stratum` in strict mode.
+
+The client normally dispatches on the raw JSON, in strict mode every message is
+validated against these models first, which is slower but rejects malformed messages
+with a clear error.
+"""
+
+from pydantic import BaseModel
+
+from tuna.stratum import StratumMethod
+
+
+class StratumError(BaseModel):
+    code: int
+    message: str
+    data: dict
+
+
+class StratumAuthorized(BaseModel):
+    id: int
+    result: bool | None = None
+    error: dict | list | None = None
+
+
+class StratumMessage(BaseModel):
+    id: int | None = None
+    method: StratumMethod
+    params: list
+
+
+class StratumSubscribed(BaseModel):
+    id: int
+    result: list
+
+
+def validate(message: dict) -> BaseModel:
+    """Validate a raw message, raises pydantic.ValidationError if it is malformed."""
+    if message.get("method") is not None:
+        return StratumMessage.model_validate(message)
+    elif message.get("id") == 1:
+        return StratumSubscribed.model_validate(message)
+    return StratumAuthorized.model_validate(message)
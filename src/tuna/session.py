@@ -0,0 +1,251 @@
+"""Record the messages of a pool session and replay them to the miner.
+
+A recording is a gzip compressed file of the messages the pool sent, with the time
+each one arrived:
+
+    header  magic (8 bytes), start time (8 bytes, unix seconds)
+    record  offset (8 bytes, seconds since the start), length (4 bytes), JSON message
+
+Records are flushed as they are written, so a recording cut short by a crash can still
+be read up to its last complete record.
+
+`ReplayPool` serves a recording to a miner as a local pool, the subscribe reply,
+set_difficulty and notify messages are sent at their recorded times (optionally sped
+up), and shares are accepted only for the current job, so the replay shows the stale
+shares, job start latency and wasted batches the miner would have had on that traffic.
+"""
+
+import asyncio
+import gzip
+import logging
+import struct
+import time
+from collections.abc import Iterator
+
+from tuna import backends
+from tuna import jobs
+from tuna import metrics
+from tuna import miner
+from tuna.mock import MockPool
+from tuna.stratum import Stratum
+from tuna.stratum import StratumMethod
+from tuna.stratum import dumps
+from tuna.stratum import loads
+from tuna.utils import Target
+
+logger = logging.getLogger("tuna.session")
+
+MAGIC = b"TUNASESS"
+HEADER = struct.Struct("<8sd")
+RECORD = struct.Struct("<dI")
+
+# Messages the replay pool sends to the miner, answers are generated for its requests
+REPLAYED = {StratumMethod.notify.value, StratumMethod.difficulty.value}
+
+
+class Recorder:
+    """Appends received messages with their arrival time to a recording."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.file = gzip.open(path, "wb")
+        self.start = time.perf_counter()
+        self.count = 0
+        self.file.write(HEADER.pack(MAGIC, time.time()))
+        self.file.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def record(self, message: dict):
+        data = dumps(message)
+        offset = time.perf_counter() - self.start
+        self.file.write(RECORD.pack(offset, len(data)) + data)
+        self.file.flush()
+        self.count += 1
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+            logger.info(f"Recorded {self.count} messages to {self.path}")
+
+
+def read(path: str) -> Iterator[tuple[float, dict]]:
+    """The (offset, message) records of a recording, up to the last complete one."""
+    with gzip.open(path, "rb") as file:
+        magic, _ = HEADER.unpack(file.read(HEADER.size))
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a session recording")
+        while True:
+            try:
+                header = file.read(RECORD.size)
+                if len(header) < RECORD.size:
+                    return
+                offset, length = RECORD.unpack(header)
+                data = file.read(length)
+            except EOFError:
+                logger.warning(f"Recording {path} is truncated")
+                return
+            if len(data) < length:
+                logger.warning(f"Recording {path} is truncated")
+                return
+            yield offset, loads(data)
+
+
+class ReplayPool(MockPool):
+    """A local pool that sends the messages of a recording at their recorded times."""
+
+    def __init__(
+        self,
+        path: str,
+        speed: float = 1.0,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ):
+        super().__init__(host, port)
+        self.speed = speed
+
+        self.messages: list[tuple[float, dict]] = []
+        subscribed = False
+        for offset, message in read(path):
+            if message.get("method") in REPLAYED:
+                self.messages.append((offset, message))
+            elif not subscribed and message.get("id") == 1 and message.get("result"):
+                _, extra_nonce_1, extra_nonce_2_size = message["result"]
+                self.extra_nonce_1 = bytes.fromhex(extra_nonce_1)
+                self.extra_nonce_2_size = extra_nonce_2_size
+                subscribed = True
+
+        if not self.messages:
+            raise ValueError(f"{path} has no jobs to replay")
+
+        # Replay from the first job or difficulty, not from the connection
+        first = self.messages[0][0]
+        self.messages = [(offset - first, message) for offset, message in self.messages]
+
+        self.job_id: str | None = None
+        self.stale = 0
+        self.player: asyncio.Task | None = None
+        self.finished = asyncio.Event()
+
+    @property
+    def duration(self) -> float:
+        """Seconds the replay takes at its speed."""
+        return self.messages[-1][0] / self.speed
+
+    async def close(self):
+        if self.player is not None:
+            self.player.cancel()
+        await super().close()
+
+    async def play(self, writer: asyncio.StreamWriter):
+        start = time.perf_counter()
+        for offset, message in self.messages:
+            delay = start + offset / self.speed - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if message["method"] == StratumMethod.notify.value:
+                self.job += 1
+                self.job_id = message["params"][0]
+                self.notify_times.append(time.perf_counter())
+            await self.send(writer, message)
+        self.finished.set()
+
+    async def dispatch(self, writer: asyncio.StreamWriter, message: dict):
+        method = message.get("method")
+        if method == StratumMethod.authorize.value:
+            await self.send(writer, {"id": message["id"], "result": True, "error": None})
+            # One miner at a time, a reconnecting miner gets the replay from the start
+            if self.player is not None:
+                self.player.cancel()
+            self.player = asyncio.create_task(self.play(writer))
+        elif method == StratumMethod.submit.value:
+            self.submits.append(message)
+            if message["params"][1] == self.job_id:
+                answer = {"id": message["id"], "result": True, "error": None}
+            else:
+                self.stale += 1
+                answer = {
+                    "id": message["id"],
+                    "result": False,
+                    "error": [21, "Stale share, job not found", None],
+                }
+            await self.send(writer, answer)
+        else:
+            await super().dispatch(writer, message)
+
+
+async def _replay(
+    pool: ReplayPool,
+    backend: backends.Backend,
+    nloops: int,
+    difficulty: int,
+    drain: float,
+) -> Stratum:
+    async with pool:
+        conn = Stratum(pool.host, pool.port, "addr", "worker", "", notify_timeout=None)
+        conn.reconnect = False
+        task = asyncio.create_task(miner.mine(conn, backend, Target(difficulty), nloops))
+        finished = asyncio.ensure_future(pool.finished.wait())
+        await asyncio.wait([task, finished], return_when=asyncio.FIRST_COMPLETED)
+
+        # Let the last job run and its shares be answered
+        if not task.done():
+            await asyncio.sleep(drain)
+        task.cancel()
+        finished.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+    return conn
+
+
+def replay(
+    path: str,
+    name: str | None = None,
+    speed: float = 1.0,
+    nloops: int = 4096,
+    difficulty: int = 8,
+    workers: int | None = None,
+    drain: float = 2.0,
+) -> dict:
+    """Mine a recorded session with a backend, return the job switching results."""
+    metrics.metrics = metrics.Metrics()
+    jobs.metrics = jobs.JobMetrics()
+
+    backend = backends.select(name, workers)
+    pool = ReplayPool(path, speed)
+    logger.info(
+        f"Replaying {path} ({len(pool.messages)} messages, {pool.duration:0.1f}s) "
+        + f"with {backend.name}"
+    )
+    conn = asyncio.run(_replay(pool, backend, nloops, difficulty, drain))
+
+    stats = conn.share_stats
+    batches = metrics.metrics.backends.get(backend.name, metrics.BackendMetrics())
+    switches = jobs.metrics
+    return {
+        "recording": path,
+        "backend": backend.name,
+        "speed": speed,
+        "nloops": nloops,
+        "difficulty": difficulty,
+        "jobs": pool.job,
+        "hashes": batches.hashes,
+        "batches": batches.batches,
+        "shares_submitted": stats.submitted,
+        "shares_accepted": stats.accepted,
+        "shares_stale": stats.stale,
+        "stale_rate": stats.stale / stats.answered if stats.answered else 0.0,
+        "first_hash_latency": switches.mean_start_latency,
+        "max_first_hash_latency": switches.max_start_latency,
+        "job_switch_latency": switches.mean_switch_latency,
+        "wasted_hashes": switches.wasted_hashes,
+        "wasted_batch_fraction": (
+            switches.wasted_batches / batches.batches if batches.batches else 0.0
+        ),
+    }
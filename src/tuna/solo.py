@@ -0,0 +1,344 @@
+"""Solo mining, searching the block target of the chain state without a pool.
+
+The current `StateV2` datum comes from a `StateSource`, a file (`FileStateSource`) or a
+local service (`HttpStateSource`), and new sources only need to implement `fetch` (and
+`submit`, if they can take solutions). The source is polled while hashing, and a new
+state cancels the running batch at once.
+
+Every batch searches the `TargetState` built from the state against the full block
+difficulty (leading zeros and target number). The nonce is a random 4 byte prefix, so
+several solo miners never search the same nonces, followed by 12 bytes that are handed
+out in disjoint ranges like the extra nonce 2 of a pool job.
+
+A solution is logged, appended to the solutions file as a JSON line and given to the
+source. Building and submitting the mint transaction is left to the source (or whatever
+reads the solutions file), after a solution the miner waits for the state to advance.
+A source that rejects the solution has the miner search on for another one, and one that
+can not be reached gets the solution again at the next poll.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from dataclasses import replace
+
+from tuna import backends
+from tuna import codec
+from tuna import jobs
+from tuna import metrics
+from tuna.datums import StateV2
+from tuna.nonces import NonceAllocator
+from tuna.utils import Target
+from tuna.utils import get_hash
+
+logger = logging.getLogger("tuna.solo")
+
+# Seconds between state polls
+POLL_INTERVAL = 1.0
+
+# Bytes of the nonce that are random per miner, the rest is searched
+PREFIX_SIZE = 4
+NONCE_SIZE = 16
+
+
+@dataclass
+class Solution:
+    """A nonce whose datum hash meets the block target of a state."""
+
+    state: StateV2
+    nonce: bytes
+    hash: bytes
+    datum: bytes
+    time: float
+
+    def to_dict(self) -> dict:
+        return {
+            "block_number": self.state.block_number,
+            "current_hash": self.state.current_hash.hex(),
+            "nonce": self.nonce.hex(),
+            "hash": self.hash.hex(),
+            "datum": self.datum.hex(),
+            "time": self.time,
+        }
+
+
+def state_key(state: StateV2) -> str:
+    return f"{state.block_number}:{state.current_hash.hex()}"
+
+
+class StateSource:
+    """Where the chain state comes from."""
+
+    name: str = "state"
+
+    # Whether `submit` hands solutions on, otherwise they are only in the solutions file
+    submits: bool = False
+
+    async def fetch(self) -> StateV2:
+        """The current state, raises if it can not be read."""
+        raise NotImplementedError
+
+    async def submit(self, solution: Solution) -> bool:
+        """Hand a solution on, True if it was accepted."""
+        return False
+
+
+class FileStateSource(StateSource):
+    """Reads the CBOR hex of a `StateV2` datum from a file, whenever it changes."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.name = path
+        self._mtime: int | None = None
+        self._state: StateV2 | None = None
+
+    async def fetch(self) -> StateV2:
+        mtime = os.stat(self.path).st_mtime_ns
+        if mtime != self._mtime:
+            with open(self.path) as file:
+                self._state = StateV2.from_cbor(file.read().strip())
+            self._mtime = mtime
+        return self._state
+
+
+class HttpStateSource(StateSource):
+    """A local state service, `GET {url}/state` returns the CBOR hex of the datum and
+    `POST {url}/solution` takes a solution as JSON.
+    """
+
+    submits = True
+
+    def __init__(self, url: str, timeout: float = 5.0):
+        self.url = url.rstrip("/")
+        self.name = self.url
+        self.timeout = timeout
+
+    def _request(self, path: str, body: dict | None = None) -> bytes:
+        data = None if body is None else json.dumps(body).encode("utf-8")
+        request = urllib.request.Request(self.url + path, data=data)
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            return response.read()
+
+    async def fetch(self) -> StateV2:
+        loop = asyncio.get_running_loop()
+        body = await loop.run_in_executor(None, self._request, "/state")
+        return StateV2.from_cbor(body.decode("utf-8").strip())
+
+    async def submit(self, solution: Solution) -> bool:
+        loop = asyncio.get_running_loop()
+        body = await loop.run_in_executor(
+            None, self._request, "/solution", solution.to_dict()
+        )
+        return bool(json.loads(body).get("accepted"))
+
+
+class SoloMiner:
+    """Hashes the current state of a source until it finds a solution."""
+
+    source: StateSource
+    state: StateV2 | None = None
+
+    # Set when the state changes, cleared when the miner picks up the new state
+    changed: asyncio.Event
+    changed_time: float | None = None
+
+    def __init__(
+        self,
+        source: StateSource,
+        miner: backends.Backend,
+        nloops: int,
+        poll: float = POLL_INTERVAL,
+        solutions: str | None = None,
+    ):
+        self.source = source
+        self.miner = miner
+        self.nloops = nloops
+        self.poll = poll
+        self.solutions_path = solutions
+        self.prefix = os.urandom(PREFIX_SIZE)
+
+        self.changed = asyncio.Event()
+        self.solved: str | None = None
+        self.solutions: list[Solution] = []
+
+        # A solution the source could not be reached for, submitted again at each poll
+        self.pending: Solution | None = None
+
+    def update(self, state: StateV2) -> bool:
+        """Take a state, True if it differs from the current one."""
+        if self.state is not None and state_key(state) == state_key(self.state):
+            return False
+        logger.info(
+            f"New state: block {state.block_number}, "
+            + f"difficulty {state.leading_zeros}/{state.target_number}"
+        )
+        self.state = state
+        self.changed_time = time.perf_counter()
+        self.changed.set()
+        return True
+
+    async def refresh(self) -> bool:
+        """Poll the source once, True if the state changed."""
+        try:
+            return self.update(await self.source.fetch())
+        except (OSError, ValueError) as e:
+            logger.warning(f"Error reading the state from {self.source.name}: {e}")
+            return False
+
+    async def watch(self):
+        while True:
+            await self.refresh()
+            if self.pending is not None:
+                if state_key(self.pending.state) == state_key(self.state):
+                    await self.submit(self.pending)
+                else:
+                    self.pending = None
+            await asyncio.sleep(self.poll)
+
+    async def found(self, solution: Solution):
+        logger.info(
+            f"Solution for block {solution.state.block_number}: "
+            + f"nonce={solution.nonce.hex()}, hash={solution.hash.hex()}"
+        )
+        self.solutions.append(solution)
+        if self.solutions_path is not None:
+            with open(self.solutions_path, "a") as file:
+                file.write(json.dumps(solution.to_dict()) + "\n")
+        await self.submit(solution)
+
+    async def submit(self, solution: Solution):
+        """Give a solution to the source, the state is solved once it is taken."""
+        key = state_key(solution.state)
+        if not self.source.submits:
+            self.solved = key
+            return
+
+        try:
+            accepted = await self.source.submit(solution)
+        except (OSError, ValueError) as e:
+            logger.warning(
+                f"Error submitting the solution to {self.source.name}, "
+                + f"retrying at the next poll: {e}"
+            )
+            self.pending = solution
+            return
+
+        self.pending = None
+        if not accepted:
+            logger.warning(
+                f"Solution for block {solution.state.block_number} rejected by "
+                + f"{self.source.name}, searching on"
+            )
+            return
+        logger.info(f"Solution accepted by {self.source.name}")
+        self.solved = key
+
+        # Pick up the next state without waiting for the next poll
+        await self.refresh()
+
+    async def run(self):
+        executor = ThreadPoolExecutor(1, thread_name_prefix="tuna-hash")
+        watcher = asyncio.create_task(self.watch())
+        try:
+            with self.miner, NonceAllocator() as allocator:
+                await self.hash_loop(executor, allocator)
+        finally:
+            watcher.cancel()
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    async def hash_loop(self, executor: ThreadPoolExecutor, allocator: NonceAllocator):
+        key = None
+        template = None
+        target = None
+        hash_count = 0
+        start = time.time()
+        next_hash_time = start + 10
+        while True:
+
+            # Wait for a state, or for a solved state to advance
+            if self.state is None or state_key(self.state) == self.solved:
+                await self.changed.wait()
+
+            if self.changed.is_set():
+                self.changed.clear()
+                state = self.state
+                key = state_key(state)
+                nonce = self.prefix + bytes(NONCE_SIZE - PREFIX_SIZE)
+                template = codec.DatumTemplate(
+                    replace(state.target(), nonce=nonce), self.prefix
+                )
+                target = Target(state.leading_zeros, state.target_number)
+                started = False
+
+            if key == self.solved:
+                continue
+
+            cancel = jobs.CancelToken()
+            canceller = asyncio.create_task(jobs.cancel_on_notify(self.changed, cancel))
+
+            nonce_range = self.miner.allocate(allocator, key, self.nloops)
+            template.nonce = nonce_range.start
+
+            batch_start = time.perf_counter()
+            if not started:
+                jobs.metrics.record_start(self.changed_time, batch_start)
+                started = True
+            nonces = backends.run(
+                self.miner,
+                template.datum(),
+                template.window,
+                target,
+                self.nloops,
+                executor,
+                cancel,
+            )
+
+            found = 0
+            try:
+                async for nonce in nonces:
+                    found += 1
+                    if self.changed.is_set() or key == self.solved:
+                        continue
+                    datum = template.patch(nonce)
+                    hsh = get_hash(datum)
+                    if not target.check(hsh):
+                        logger.warning(f"Backend returned an invalid nonce: {nonce}")
+                        continue
+                    await self.found(
+                        Solution(
+                            state,
+                            datum[codec.NONCE_OFFSET : codec.NONCE_OFFSET + NONCE_SIZE],
+                            hsh,
+                            datum,
+                            time.time(),
+                        )
+                    )
+            except asyncio.CancelledError:
+                # Stop the batch, shutting the executor down waits for it to finish
+                canceller.cancel()
+                cancel.cancel()
+                raise
+
+            canceller.cancel()
+            batch_end = time.perf_counter()
+            hashes = (
+                cancel.hashes if self.miner.cancellable else self.miner.hashes(self.nloops)
+            )
+            metrics.metrics.record_batch(
+                self.miner.name, batch_end - batch_start, hashes, found
+            )
+            if self.changed.is_set():
+                jobs.metrics.record(self.changed_time, batch_start, batch_end, hashes)
+                logger.debug(f"Cancelled {self.miner.name} hashing for a new state")
+
+            hash_count += hashes
+            if time.time() > next_hash_time:
+                logger.info(f"{hash_count / (10 ** 6 * (time.time() - start)):0.3f} Mh/s")
+                hash_count = 0
+                start = time.time()
+                next_hash_time = start + 10
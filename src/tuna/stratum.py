@@ -1,21 +1,56 @@
 # Modified fromhttps://gist.github.com/mgpai22/ce655ca194b2dee54e189d995b681ea0
 
+import asyncio
+import itertools
 import json
 import logging
-import socket
-from concurrent.futures import Future
-from concurrent.futures import ThreadPoolExecutor
-from threading import Lock
-from dataclasses import replace
+import time
+from dataclasses import dataclass
+from dataclasses import field
 from enum import Enum
+from typing import Callable
 
-from pydantic import BaseModel
-from pydantic import ValidationError
-
+from tuna import codec
 from tuna.datums import TargetState
 
+try:
+    import orjson
+
+    loads = orjson.loads
+    dumps = orjson.dumps
+except ModuleNotFoundError:
+    loads = json.loads
+
+    def dumps(message) -> bytes:
+        return json.dumps(message).encode("utf-8")
+
+
 logger = logging.getLogger("tuna.stratum")
 
+# Maximum number of unprocessed messages, when full the oldest share result or response
+# is dropped, jobs and difficulty changes are always kept
+MAX_MESSAGES = 256
+
+# Largest line the framer buffers before giving up on it, notifies are ~300 bytes
+MAX_LINE = 64 * 1024
+
+# Seconds to wait for a pool to accept a connection, when probing and connecting
+CONNECT_TIMEOUT = 5.0
+
+# Delay before the second reconnect attempt (the first is immediate), doubled after
+# every failed attempt up to the maximum
+RECONNECT_DELAY = 0.5
+MAX_RECONNECT_DELAY = 30.0
+
+# Switch to another pool if the current one sends no job for this long
+NOTIFY_TIMEOUT = 600.0
+
+# Errors of a handler reading a message with missing or mistyped fields
+MALFORMED = (AttributeError, IndexError, KeyError, TypeError, ValueError)
+
+# A share the pool has not answered for this long is recorded as stale
+SHARE_TIMEOUT = 60.0
+
 
 class StratumMethod(Enum):
     subscribe = "mining.subscribe"
@@ -25,22 +60,18 @@ class StratumMethod(Enum):
     submit = "mining.submit"
 
 
-class StratumError(BaseModel):
-    code: int
-    message: str
-    data: dict
+class StratumMessage:
+    """A request from the server (notify, set_difficulty)."""
 
+    __slots__ = ("id", "method", "params")
 
-class StratumAuthorized(BaseModel):
-    id: int
-    result: bool | None = None
-    error: dict | None = None
-
+    def __init__(self, id: int | None, method: StratumMethod, params: list):
+        self.id = id
+        self.method = method
+        self.params = params
 
-class StratumMessage(BaseModel):
-    id: int
-    method: StratumMethod
-    params: list
+    def __repr__(self):
+        return f"StratumMessage(id={self.id}, method={self.method}, params={self.params})"
 
     @property
     def job(self):
@@ -50,17 +81,172 @@ class StratumMessage(BaseModel):
     @property
     def block(self):
         if self.method == StratumMethod.notify:
-            return TargetState.from_cbor(self.params[1])
+            return codec.decode(bytes.fromhex(self.params[1]))
 
     @block.setter
     def block(self, value: TargetState):
         if self.method == StratumMethod.notify:
-            self.params[1] = value.to_cbor_hex()
+            self.params[1] = codec.encode(value).hex()
 
 
-class StratumSubscribed(BaseModel):
+class StratumSubscribed:
+    """The answer to mining.subscribe."""
+
+    __slots__ = ("id", "result")
+
+    def __init__(self, id: int, result: list):
+        self.id = id
+        self.result = result
+
+    def __repr__(self):
+        return f"StratumSubscribed(id={self.id}, result={self.result})"
+
+
+class StratumAuthorized:
+    """Any other answer, normally to mining.authorize."""
+
+    __slots__ = ("id", "result", "error")
+
+    def __init__(self, id: int | None, result=None, error=None):
+        self.id = id
+        self.result = result
+        self.error = error
+
+    def __repr__(self):
+        return (
+            f"StratumAuthorized(id={self.id}, result={self.result}, error={self.error})"
+        )
+
+
+class ShareStatus(Enum):
+    pending = "pending"
+    accepted = "accepted"
+    rejected = "rejected"
+    stale = "stale"
+
+
+@dataclass
+class Share:
+    """A submitted nonce, tracked until the pool answers it."""
+
     id: int
-    result: list
+    job_id: str
+    nonce: str
+    message: dict = field(repr=False)
+    queued: float = field(default_factory=time.perf_counter)
+    sent: float | None = None
+    latency: float | None = None
+    status: ShareStatus = ShareStatus.pending
+    error: dict | list | None = None
+
+
+@dataclass
+class ShareStats:
+    """Counts and round trip latency of submitted shares."""
+
+    submitted: int = 0
+    accepted: int = 0
+    rejected: int = 0
+    stale: int = 0
+    latency: float = 0.0
+    max_latency: float = 0.0
+
+    @property
+    def answered(self) -> int:
+        return self.accepted + self.rejected + self.stale
+
+    @property
+    def mean_latency(self) -> float:
+        return self.latency / self.answered if self.answered else 0.0
+
+    def record(self, share: Share):
+        if share.status == ShareStatus.accepted:
+            self.accepted += 1
+        elif share.status == ShareStatus.stale:
+            self.stale += 1
+        else:
+            self.rejected += 1
+        if share.latency is not None:
+            self.latency += share.latency
+            self.max_latency = max(self.max_latency, share.latency)
+
+
+def parse_pools(pools: str, default_port: int | None = None) -> list[tuple[str, int]]:
+    """Parse a comma separated list of host:port pool endpoints, a host without a port
+    uses `default_port`.
+    """
+    endpoints = []
+    for pool in pools.split(","):
+        pool = pool.strip()
+        if not pool:
+            continue
+        host, _, port = pool.rpartition(":")
+        if not host:
+            if default_port is None:
+                raise ValueError(f"Pool {pool!r} has no port, use host:port")
+            host, port = pool, default_port
+        try:
+            endpoints.append((host, int(port)))
+        except ValueError:
+            raise ValueError(f"Pool {pool!r} has an invalid port, use host:port")
+    return endpoints
+
+
+async def probe(host: str, port: int, timeout: float = CONNECT_TIMEOUT) -> float | None:
+    """Seconds to open a TCP connection to a pool, None if it is unreachable."""
+    start = time.perf_counter()
+    try:
+        _, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+    except (OSError, asyncio.TimeoutError) as e:
+        logger.debug(f"Pool {host}:{port} is unreachable: {e}")
+        return None
+    latency = time.perf_counter() - start
+    writer.close()
+    try:
+        await writer.wait_closed()
+    except (ConnectionError, OSError):
+        pass
+    return latency
+
+
+class LineFramer:
+    """Splits a stream of bytes into newline delimited JSON messages.
+
+    Bytes after the last newline are kept until the rest of the line arrives, so a
+    message split over several reads is never lost, and a line that fails to parse is
+    dropped on its own.
+    """
+
+    buffer: bytearray
+
+    def __init__(self, max_line: int = MAX_LINE):
+        self.buffer = bytearray()
+        self.max_line = max_line
+
+    def feed(self, data: bytes) -> list[dict]:
+        """Add received bytes, return all messages that are now complete."""
+        self.buffer += data
+
+        end = self.buffer.rfind(b"\n")
+        if end < 0:
+            if len(self.buffer) > self.max_line:
+                logger.warning(f"Dropping {len(self.buffer)} bytes without a newline")
+                self.buffer.clear()
+            return []
+
+        lines = self.buffer[:end].split(b"\n")
+        # Deleting from the front of a bytearray does not copy the remainder
+        del self.buffer[: end + 1]
+
+        messages = []
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                messages.append(loads(line))
+            except ValueError as e:
+                logger.debug(f"Error decoding message {bytes(line)}: {e}")
+        return messages
 
 
 class Stratum:
@@ -70,16 +256,43 @@ class Stratum:
     address: str
     worker: str
     password: str
-    
-    # Lock to make sure job updates are properly coordinated
-    job_lock: Lock = Lock()
 
-    sock: socket.socket | None = None
+    reader: asyncio.StreamReader | None = None
+    writer: asyncio.StreamWriter | None = None
+    framer: LineFramer
+
+    messages: asyncio.Queue
+
+    # Shares waiting to be sent, and sent shares waiting for an answer by request id
+    outbound: asyncio.Queue
+    shares: dict[int, Share]
+    share_stats: ShareStats
+    sender: asyncio.Task | None = None
+
+    # Seconds to wait after the first queued share for more to send with it
+    batch_delay: float = 0.0
+
+    # Seconds until an unanswered share is given up on
+    share_timeout: float = SHARE_TIMEOUT
+
+    # Set when a new job arrives, cleared by the miner when it picks up the job
+    notified: asyncio.Event
+    notify_time: float | None = None
 
-    messages: list[StratumMessage, StratumAuthorized, StratumSubscribed] = []
+    thread: asyncio.Task | None = None
 
-    executor: ThreadPoolExecutor | None = None
-    thread: Future | None = None
+    # Pool endpoints, the configured host first, the fastest reachable one is used
+    pools: list[tuple[str, int]]
+    latencies: dict[tuple[str, int], float | None]
+
+    # Reconnect (to the fastest reachable pool) when the connection drops, and switch
+    # pools when the current one sends no job for `notify_timeout` seconds
+    reconnect: bool = True
+    notify_timeout: float | None = NOTIFY_TIMEOUT
+    last_notify: float
+
+    # Number of successful connections, anything after the first is a reconnect
+    connects: int = 0
 
     job_id: str | None = None
     target: TargetState | None = None
@@ -87,82 +300,200 @@ class Stratum:
     reset: bool = True
     extra_nonce_1: bytes | None
 
+    # Validate every message with the pydantic models in tuna.schema
+    strict: bool = False
+
+    # A tuna.session.Recorder that received messages are written to
+    recorder = None
+
+    # Handlers for server requests by method, and for answers by request id
+    methods: dict[str, Callable[[dict], None]]
+    responses: dict[int, Callable[[dict], None]]
+
     count = 0
 
-    def __init__(self, host: str, port: int, address: str, worker: str, password: str):
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        address: str,
+        worker: str,
+        password: str,
+        strict: bool = False,
+        pools: list[tuple[str, int]] | None = None,
+        notify_timeout: float | None = NOTIFY_TIMEOUT,
+    ):
 
         self.host = host
         self.port = int(port)
         self.address = address
         self.worker = worker
         self.password = password
+        self.strict = strict
+        self.notify_timeout = notify_timeout
+
+        self.pools = [(host, self.port)]
+        for pool in pools or []:
+            if pool not in self.pools:
+                self.pools.append(pool)
+        self.latencies = {}
+
+        self.methods = {
+            StratumMethod.notify.value: self.on_notify,
+            StratumMethod.difficulty.value: self.on_difficulty,
+        }
+        self.responses = {1: self.on_subscribed}
+
+        self.framer = LineFramer()
+        self.messages = asyncio.Queue()
 
-    def __enter__(self):
-        self.connect()
+        # Request ids 1 and 2 are used by subscribe and authorize
+        self.ids = itertools.count(3)
+        self.outbound = asyncio.Queue()
+        self.shares = {}
+        self.share_stats = ShareStats()
+        self.notified = asyncio.Event()
+        self.last_notify = time.perf_counter()
+
+    async def __aenter__(self):
+        await self.connect()
         self.start_loop()
         return self
 
-    def __exit__(self, exc_type, exc_val, exc_tb):
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        if self.thread is not None:
+            logger.error("SHUTDOWN: Stopping listener...")
+            for task in [self.thread, self.sender]:
+                task.cancel()
+                try:
+                    await task
+                except (asyncio.CancelledError, Exception):
+                    pass
+            self.thread = None
+            self.sender = None
         logger.error("SHUTDOWN: Disconnecting from Stratum...")
-        self.disconnect()
-        if self.executor is not None:
-            logger.error("SHUTDOWN: Shutting down executor...")
-            self.thread.cancel()
-            self.executor.shutdown(wait=True)
+        await self.disconnect()
         logger.error("SHUTDOWN: Exiting.")
 
-    def connect(self):
-        """Connect to Stratum server"""
-        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.sock.settimeout(1)
-        self.sock.connect((self.host, self.port))
-
-    def disconnect(self):
-        self.sock.close()
-        self.sock = None
+    async def connect(self, avoid: tuple[str, int] | None = None):
+        """Connect to the fastest reachable pool, `avoid` is only used as a last resort.
+
+        Raises ConnectionError if no pool accepts the connection.
+        """
+        pools = self.pools
+        if len(pools) > 1:
+            latencies = await asyncio.gather(*[probe(*pool) for pool in pools])
+            self.latencies = dict(zip(pools, latencies))
+            for pool, latency in self.latencies.items():
+                if latency is not None:
+                    logger.debug(f"Pool {pool[0]}:{pool[1]}: {1000 * latency:0.1f}ms")
+
+            # Unreachable pools last, they may be back by now
+            pools = sorted(
+                pools,
+                key=lambda pool: (
+                    pool == avoid,
+                    self.latencies[pool] is None,
+                    self.latencies[pool] or 0.0,
+                ),
+            )
+
+        errors = []
+        for host, port in pools:
+            try:
+                self.reader, self.writer = await asyncio.wait_for(
+                    asyncio.open_connection(host, port), CONNECT_TIMEOUT
+                )
+            except (OSError, asyncio.TimeoutError) as e:
+                errors.append(f"{host}:{port} ({e!r})")
+                continue
+            if (host, port) != (self.host, self.port):
+                logger.info(f"Switching to pool {host}:{port}")
+            self.host = host
+            self.port = port
+            break
+        else:
+            raise ConnectionError(f"Could not connect to any pool: {', '.join(errors)}")
+
+        self.framer = LineFramer()
+        self.last_notify = time.perf_counter()
+        self.connects += 1
+
+    async def resume(self, avoid: tuple[str, int] | None = None):
+        """Reconnect with backoff, then subscribe and authorize again.
+
+        Shares of the lost session can no longer be answered and are recorded as stale,
+        and the current job is dropped until the new session sends one.
+        """
+        await self.disconnect()
+        self.job_id = None
+        self.target = None
+        for share in list(self.shares.values()):
+            self.drop_share(share, "Stale share, connection lost")
+
+        delay = RECONNECT_DELAY
+        while True:
+            try:
+                await self.connect(avoid)
+                await self.subscribe()
+                await self.authorize()
+                return
+            except (ConnectionError, OSError) as e:
+                logger.warning(f"Reconnect failed, retrying in {delay:0.1f}s: {e}")
+                await self.disconnect()
+            await asyncio.sleep(delay)
+            delay = min(2 * delay, MAX_RECONNECT_DELAY)
+
+    async def disconnect(self):
+        if self.writer is None:
+            return
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except (ConnectionError, OSError):
+            pass
+        self.reader = None
+        self.writer = None
 
-    def send(self, message):
+    async def send(self, message):
         """Send a message to the server"""
-        message_data = json.dumps(message).encode("utf-8")
+        message_data = dumps(message)
         if len(message_data) > 1024:  # Ensure payload size is within limits
             raise ValueError("Payload size exceeds limit")
-        thread = self.executor.submit(self.sock.sendall, message_data + b"\n")
-        thread.result()
+        self.writer.write(message_data + b"\n")
+        await self.writer.drain()
 
-    def receive(self) -> list[dict] | None:
-        """Receive a message from the server"""
-        buffer = b""
+    async def receive(self) -> list[dict] | None:
+        """Receive all complete messages, None if the connection was closed"""
         try:
-            while b"\n" not in buffer:
-                chunk = self.sock.recv(4096)
-                if not chunk:
-                    break
-                buffer += chunk
-            if not buffer:
-                return None
-            messages = buffer.split(b"\n")
-            responses = [json.loads(msg.decode("utf-8")) for msg in messages if msg]
-            return responses
-        except (json.JSONDecodeError, socket.timeout, socket.error) as e:
+            chunk = await self.reader.read(65536)
+        except (ConnectionError, OSError) as e:
             logger.debug(f"Error receiving message: {e}")
             return None
+        if not chunk:
+            return None
+        return self.framer.feed(chunk)
 
-    def subscribe(self):
+    async def subscribe(self):
         """Subscribe to mining notifications"""
         message = {"id": 1, "method": "mining.subscribe", "params": [""]}
-        self.send(message)
+        await self.send(message)
 
-    def authorize(self):
+    async def authorize(self):
         """Authorize the miner."""
         message = {
             "id": 2,
             "method": "mining.authorize",
             "params": ["{}.{}".format(self.address, self.worker) if self.worker != "" else self.address, self.password],
         }
-        self.send(message)
+        await self.send(message)
+
+    def submit_nonce(self, nonce, job_id: str | None = None) -> Share:
+        """Queue a nonce for submission, without waiting for it to be sent.
 
-    def submit_nonce(self, nonce):
-        """Submit a nonce."""
+        The nonce is submitted for the current job unless `job_id` is given.
+        """
+        job_id = self.job_id if job_id is None else job_id
         self.count += 1
         if self.count % 20 == 19:
             address = str(self.address)
@@ -171,50 +502,214 @@ class Stratum:
             self.worker = address[-8:]
             logger.info("Fee submission: Submitting hash for Elder Millenial...")
         message = {
-            "id": 3,
+            "id": next(self.ids),
             "method": "mining.submit",
-            "params": [".".join(a for a in [self.address, self.worker] if a != ""), self.job_id, nonce],
+            "params": [".".join(a for a in [self.address, self.worker] if a != ""), job_id, nonce],
         }
         if self.count % 20 == 19:
             self.address = address
             self.worker = worker
-        self.send(message)
-        
 
-    def listen(self):
+        share = Share(id=message["id"], job_id=job_id, nonce=nonce, message=message)
+        self.shares[share.id] = share
+        self.share_stats.submitted += 1
+        self.outbound.put_nowait(share)
 
-        while True:
-            messages = self.receive()
+        return share
 
-            if messages is not None:
+    async def send_shares(self):
+        """Write queued shares, everything queued since the last write goes at once."""
+
+        while True:
+            shares = [await self.outbound.get()]
+            if self.batch_delay > 0:
+                await asyncio.sleep(self.batch_delay)
+            while not self.outbound.empty():
+                shares.append(self.outbound.get_nowait())
+
+            # Shares of a lost session were already recorded as stale
+            shares = [share for share in shares if share.status == ShareStatus.pending]
+            if not shares:
+                continue
+            # Queued while reconnecting, their job is gone with the session
+            if self.writer is None:
+                for share in shares:
+                    self.drop_share(share, "Stale share, not sent, connection lost")
+                continue
+
+            now = time.perf_counter()
+            try:
+                for share in shares:
+                    share.sent = now
+                    self.writer.write(dumps(share.message) + b"\n")
+                await self.writer.drain()
+            except (ConnectionError, OSError) as e:
+                # The listener notices the closed connection and reconnects
+                logger.debug(f"Error sending shares: {e}")
+
+    def drop_share(self, share: Share, reason: str):
+        """Record a share that will not be answered as stale."""
+        self.shares.pop(share.id, None)
+        share.status = ShareStatus.stale
+        share.error = [21, reason, None]
+        self.share_stats.record(share)
+        self.queue(share)
+
+    def expire_shares(self):
+        """Give up on shares the pool has not answered within `share_timeout`."""
+        deadline = time.perf_counter() - self.share_timeout
+        for share in list(self.shares.values()):
+            if (share.sent or share.queued) < deadline:
+                self.drop_share(share, "Stale share, no answer from the pool")
+
+    def share_result(self, message: dict):
+        """Match a submit response to its share and record the outcome."""
+        share = self.shares.pop(message["id"])
+        share.latency = time.perf_counter() - (share.sent or share.queued)
+        share.error = message.get("error")
+
+        if message.get("result"):
+            share.status = ShareStatus.accepted
+        elif share.job_id != self.job_id or "stale" in str(share.error).lower():
+            share.status = ShareStatus.stale
+        else:
+            share.status = ShareStatus.rejected
+
+        self.share_stats.record(share)
+        self.queue(share)
+
+    def queue(self, message):
+        """Queue a message for the miner.
+
+        When the queue is full the oldest share result or response (the new message
+        included) is dropped. Jobs and difficulty changes are never dropped, if nothing
+        else is queued the queue grows past `MAX_MESSAGES`.
+        """
+        if self.messages.qsize() < MAX_MESSAGES:
+            self.messages.put_nowait(message)
+            return
+
+        queued = [self.messages.get_nowait() for _ in range(self.messages.qsize())]
+        queued.append(message)
+        for index, item in enumerate(queued):
+            if isinstance(item, (Share, StratumAuthorized)):
+                logger.warning(f"Message queue full, dropping: {queued.pop(index)}")
+                break
+        for item in queued:
+            self.messages.put_nowait(item)
+
+    # Handlers read everything they need from the message before changing any state, so
+    # a malformed message raises without leaving half of it applied
+
+    def on_notify(self, message: dict):
+        params = message["params"]
+        job_id = params[0]
+
+        # Decode once, the miner builds its datum template from this
+        target = codec.decode(bytes.fromhex(params[1]))
+        target.nonce = self.extra_nonce_1 + self.extra_nonce_2
+
+        self.queue(StratumMessage(message.get("id"), StratumMethod.notify, params))
+        self.job_id = job_id
+        self.target = target
+
+        self.notify_time = time.perf_counter()
+        self.last_notify = self.notify_time
+        self.notified.set()
+
+    def on_difficulty(self, message: dict):
+        params = message["params"]
+        difficulty = params[0]
+        self.queue(StratumMessage(message.get("id"), StratumMethod.difficulty, params))
+        self.difficulty = difficulty
+
+    def on_subscribed(self, message: dict):
+        result = message["result"]
+        extra_nonce_1 = bytes.fromhex(result[1])
+        extra_nonce_2 = bytes.fromhex("00" * result[2])
+        self.queue(StratumSubscribed(message["id"], result))
+        self.extra_nonce_1 = extra_nonce_1
+        self.extra_nonce_2 = extra_nonce_2
+
+    def on_response(self, message: dict):
+        self.queue(
+            StratumAuthorized(
+                message.get("id"), message.get("result"), message.get("error")
+            )
+        )
+
+    def dispatch(self, message: dict):
+        """Route a message on its method, or for answers on its request id."""
+        if self.strict:
+            from tuna.schema import validate
+
+            validate(message)
+
+        method = message.get("method")
+        if method is not None:
+            handler = self.methods.get(method)
+            if handler is None:
+                logger.debug(f"Unhandled method {method}: {message}")
+                return
+            handler(message)
+            return
+
+        request_id = message.get("id")
+        if request_id in self.shares:
+            self.share_result(message)
+        else:
+            self.responses.get(request_id, self.on_response)(message)
+
+    async def read(self):
+        """Dispatch messages until the connection closes or the pool stops notifying."""
+        while True:
+            timeout = None
+            if self.notify_timeout is not None:
+                timeout = self.last_notify + self.notify_timeout - time.perf_counter()
+                timeout = max(timeout, 0.0)
+
+            try:
+                async with asyncio.timeout(timeout):
+                    messages = await self.receive()
+            except asyncio.TimeoutError:
+                raise asyncio.TimeoutError(
+                    f"No job from {self.host}:{self.port} for {self.notify_timeout}s"
+                )
+
+            if messages is None:
+                raise ConnectionError("Stratum server closed the connection")
+
+            if self.recorder is not None:
                 for message in messages:
-                    try:
-                        if message["id"] in [2, 4]:
-                            self.messages.append(
-                                StratumAuthorized.model_validate(message)
-                            )
-                        else:
-                            m = StratumMessage.model_validate(message)
-                            self.messages.append(m)
-                            if m.method == StratumMethod.difficulty:
-                                self.difficulty = m.params[0]
-                            elif m.method == StratumMethod.notify:
-                                with self.job_lock:
-                                    self.job_id = m.job
-                                    m.block = replace(
-                                        m.block,
-                                        nonce=self.extra_nonce_1 + self.extra_nonce_2,
-                                    )
-                                    self.target = m.block
-                    except ValidationError:
-                        m = StratumSubscribed.model_validate(message)
-                        self.messages.append(StratumSubscribed.model_validate(message))
-                        self.extra_nonce_1 = bytes.fromhex(m.result[1])
-                        self.extra_nonce_2 = bytes.fromhex("00" * m.result[2])
+                    self.recorder.record(message)
+
+            for message in messages:
+                try:
+                    self.dispatch(message)
+                except MALFORMED as e:
+                    # Dropped on its own, like a line that is not JSON
+                    logger.warning(f"Dropping malformed message {message}: {e!r}")
+            if self.shares:
+                self.expire_shares()
+
+    async def listen(self):
+
+        while True:
+            try:
+                await self.read()
+            except ConnectionError as e:
+                if not self.reconnect:
+                    raise
+                logger.warning(f"{e}, reconnecting")
+                await self.resume()
+            except asyncio.TimeoutError as e:
+                if not self.reconnect:
+                    raise ConnectionError(str(e)) from e
+                logger.warning(f"{e}, switching pools")
+                await self.resume(avoid=(self.host, self.port))
 
     def start_loop(self):
 
-        if self.executor is None:
-            self.executor = ThreadPoolExecutor(2)
+        self.thread = asyncio.create_task(self.listen())
+        self.sender = asyncio.create_task(self.send_shares())
 
-        self.thread = self.executor.submit(self.listen)
\ No newline at end of file
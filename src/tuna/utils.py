@@ -1,3 +1,5 @@
+from dataclasses import dataclass
+from dataclasses import field
 from hashlib import sha256
 
 
@@ -10,6 +12,31 @@ def get_hash(payload: bytes):
     return second_hash
 
 
+def get_difficulty(leading_zeros: int, target_number: int = 65535) -> bytes:
+    """Hash threshold for a difficulty, any hash that sorts below it is a winner.
+
+    This is the python equivalent of `set_tuna_difficulty` in the CUDA miner, extended
+    to the full 32 byte hash so digests can be compared directly.
+    """
+    return (target_number << (240 - 4 * leading_zeros)).to_bytes(32)
+
+
+@dataclass
+class Target:
+    """A compiled difficulty, leading zeros and target number plus the hash threshold."""
+
+    leading_zeros: int
+    target_number: int = 65535
+    threshold: bytes = field(init=False, repr=False)
+
+    def __post_init__(self):
+        self.threshold = get_difficulty(self.leading_zeros, self.target_number)
+
+    def check(self, hsh: bytes) -> bool:
+        """True if the hash meets this target."""
+        return hsh < self.threshold
+
+
 if __name__ == "__main__":
     print(
         get_hash(
@@ -0,0 +1,127 @@
+"""Checks shares before they are submitted.
+
+A share is dropped if its hash does not meet the submit target (a backend bug), if it
+does not meet the pool's current difficulty (the pool would reject it), or if the same
+nonce was already submitted for the job. Duplicates are found with a fixed size Bloom
+filter that is cleared on every new job, a false positive drops a valid share, so the
+filter is sized for a negligible rate at any realistic number of shares per job.
+"""
+
+import logging
+import struct
+from dataclasses import dataclass
+from hashlib import blake2b
+
+from tuna.utils import Target
+
+logger = logging.getLogger("tuna.validator")
+
+# 1 MB of bits and 7 hashes, ~2e-8 false positives after 100k shares in a job
+BLOOM_BITS = 1 << 23
+BLOOM_HASHES = 7
+
+_INDICES = struct.Struct(f"<{BLOOM_HASHES}I")
+
+
+class BloomFilter:
+    """Probabilistic set of byte strings, no false negatives."""
+
+    def __init__(self, bits: int = BLOOM_BITS):
+        self.size = bits
+        self.bits = bytearray(bits // 8)
+        self.count = 0
+
+    def clear(self):
+        self.bits = bytearray(self.size // 8)
+        self.count = 0
+
+    def _indices(self, item: bytes) -> list[int]:
+        digest = blake2b(item, digest_size=_INDICES.size).digest()
+        return [i % self.size for i in _INDICES.unpack(digest)]
+
+    def add(self, item: bytes) -> bool:
+        """Add an item, return True if it was (probably) already present."""
+        present = True
+        for index in self._indices(item):
+            byte, bit = divmod(index, 8)
+            if not self.bits[byte] & (1 << bit):
+                present = False
+                self.bits[byte] |= 1 << bit
+        if not present:
+            self.count += 1
+        return present
+
+
+@dataclass
+class ValidatorStats:
+    """Counts of checked shares and why they were dropped."""
+
+    checked: int = 0
+    passed: int = 0
+    invalid: int = 0
+    below_pool: int = 0
+    duplicate: int = 0
+
+    # Shares that also meet the block difficulty of the datum
+    blocks: int = 0
+
+    @property
+    def filtered(self) -> int:
+        return self.invalid + self.below_pool + self.duplicate
+
+
+class ShareValidator:
+
+    job_id: str | None = None
+    block_target: Target | None = None
+
+    def __init__(self, bits: int = BLOOM_BITS):
+        self.seen = BloomFilter(bits)
+        self.stats = ValidatorStats()
+        self._pool_targets: dict[int, Target] = {}
+
+    def new_job(self, job_id: str, leading_zeros: int, target_number: int):
+        """Forget the submitted nonces and take the block target of the new job."""
+        self.job_id = job_id
+        self.block_target = Target(leading_zeros, target_number)
+        self.seen.clear()
+
+    def pool_target(self, difficulty: int | None) -> Target | None:
+        if difficulty is None:
+            return None
+        if difficulty not in self._pool_targets:
+            self._pool_targets[difficulty] = Target(int(difficulty))
+        return self._pool_targets[difficulty]
+
+    def check(
+        self,
+        nonce: str,
+        hsh: bytes,
+        target: Target,
+        pool_difficulty: int | None = None,
+    ) -> bool:
+        """True if the share with this nonce and hash should be submitted."""
+        self.stats.checked += 1
+
+        if not target.check(hsh):
+            self.stats.invalid += 1
+            logger.warning(f"Dropping invalid share: {nonce}, hash={hsh.hex()}")
+            return False
+
+        pool_target = self.pool_target(pool_difficulty)
+        if pool_target is not None and not pool_target.check(hsh):
+            self.stats.below_pool += 1
+            logger.debug(f"Dropping share below pool difficulty: {nonce}")
+            return False
+
+        if self.seen.add(bytes.fromhex(nonce)):
+            self.stats.duplicate += 1
+            logger.debug(f"Dropping duplicate share: {nonce}")
+            return False
+
+        if self.block_target is not None and self.block_target.check(hsh):
+            self.stats.blocks += 1
+            logger.info(f"Share meets the block difficulty: {nonce}")
+
+        self.stats.passed += 1
+        return True
@@ -0,0 +1,74 @@
+import time
+
+from tuna import backends
+from tuna.autotune import TOLERANCE
+from tuna.autotune import Autotuner
+from tuna.backends import CALIBRATION_DATUM
+from tuna.backends import CALIBRATION_WINDOW
+
+
+def test_nloops_converges_on_the_cpu_backend():
+    tuner = Autotuner(nloops=2, difficulty=4, batch_seconds=0.1)
+    times = []
+    with backends.create("hashlib") as backend:
+        for _ in range(12):
+            start = time.perf_counter()
+            nonces = list(
+                backend.mine(
+                    CALIBRATION_DATUM, CALIBRATION_WINDOW, tuner.target, tuner.nloops
+                )
+            )
+            seconds = time.perf_counter() - start
+            times.append(seconds)
+            tuner.record(seconds, backend.hashes(tuner.nloops), len(nonces))
+
+    # The first batches are far too short, the last ones close to the target
+    assert tuner.nloops > 2
+    assert times[0] < 0.1 * (1 - TOLERANCE)
+    assert all(abs(t - 0.1) < 2 * TOLERANCE * 0.1 for t in times[-3:])
+    assert tuner.adjustments[0].nloops > 2
+    # Without a result buffer the difficulty stays at the configured one
+    assert tuner.difficulty == 4
+
+
+def test_difficulty_keeps_the_buffer_from_filling():
+    tuner = Autotuner(nloops=1000, difficulty=4, batch_seconds=1.0, max_nonces=64)
+    hashes = 1000 * 2**20
+
+    tuner.record(1.0, hashes, 64)
+    raised = tuner.difficulty
+    assert raised > 4
+    assert tuner.expected_nonces(hashes, raised) <= 0.25 * 64
+    assert tuner.expected_nonces(hashes, raised - 1) > 0.25 * 64
+
+    # Steady batches at the new difficulty do not change it again
+    for _ in range(3):
+        tuner.record(1.0, hashes, 8)
+    assert tuner.difficulty == raised
+    assert tuner.nloops == 1000
+
+    # Smaller batches lower it again, but never below the configured difficulty
+    tuner.nloops = 1
+    for _ in range(3):
+        tuner.record(1.0, 1, 0)
+    assert tuner.difficulty == 4
+
+
+def test_pool_difficulty_is_a_floor():
+    tuner = Autotuner(nloops=4096, difficulty=4)
+
+    tuner.record(1.5, 4096, 0, 9)
+    assert tuner.difficulty == 9
+    assert tuner.adjustments[-1].reason == "pool difficulty 9"
+
+    # Fractional pool difficulties are rounded down
+    tuner.record(1.5, 4096, 0, 5.5)
+    assert tuner.difficulty == 5
+    assert isinstance(tuner.difficulty, int)
+    assert tuner.target.leading_zeros == 5
+
+    # Never below the configured difficulty
+    tuner.record(1.5, 4096, 0, 2)
+    assert tuner.difficulty == 4
+    tuner.record(1.5, 4096, 0, None)
+    assert tuner.difficulty == 4
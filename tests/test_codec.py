@@ -0,0 +1,93 @@
+import random
+from dataclasses import replace
+
+import pytest
+
+from tuna import codec
+from tuna.datums import TargetState
+from tuna.utils import get_hash
+
+EXTRA_NONCE_1 = bytes.fromhex("0c1ba0d2")
+
+TARGET = TargetState(
+    nonce=bytes(16),
+    miner=bytes(range(28)),
+    block_number=31200,
+    current_hash=bytes(range(32)),
+    leading_zeros=8,
+    target_number=65535,
+    epoch_time=1234567,
+)
+
+
+def random_targets(count: int, seed: int = 1) -> list[TargetState]:
+    """TargetStates with values on both sides of every CBOR head size."""
+    rng = random.Random(seed)
+    edges = [0, 23, 24, 255, 256, 65535, 65536, 2**32 - 1, 2**32, 2**63]
+    return [
+        TargetState(
+            nonce=rng.randbytes(16),
+            miner=rng.randbytes(rng.choice([0, 1, 23, 24, 28, 64])),
+            block_number=rng.choice(edges + [rng.getrandbits(rng.randint(1, 63))]),
+            current_hash=rng.randbytes(32),
+            leading_zeros=rng.randint(0, 64),
+            target_number=rng.choice(edges[:7]),
+            epoch_time=rng.getrandbits(rng.randint(1, 63)),
+        )
+        for _ in range(count)
+    ]
+
+
+def test_encode_matches_pycardano():
+    for target in [TARGET] + random_targets(500):
+        assert codec.encode(target) == target.to_cbor(), target
+
+
+def test_decode_matches_pycardano():
+    for target in [TARGET] + random_targets(500, seed=2):
+        data = target.to_cbor()
+        assert codec.decode(data) == TargetState.from_cbor(data), target
+
+
+def test_nonce_offset():
+    data = TARGET.to_cbor()
+    assert data[codec.NONCE_OFFSET : codec.NONCE_OFFSET + 16] == TARGET.nonce
+
+
+def test_decode_rejects_other_data():
+    with pytest.raises(ValueError):
+        codec.decode(bytes.fromhex("d87a9fff"))
+    with pytest.raises(ValueError):
+        codec.decode(codec.encode(TARGET)[:-1] + b"\x00\xff")
+
+
+def test_encode_rejects_big_integers():
+    with pytest.raises(ValueError):
+        codec.encode(replace(TARGET, epoch_time=2**64))
+
+
+def test_template_patch_matches_pycardano():
+    template = codec.DatumTemplate(TARGET, EXTRA_NONCE_1)
+    assert template.window == slice(8, 20)
+
+    for extra_nonce_2 in [bytes(12), bytes(11) + b"\x05", bytes(range(12))]:
+        datum = template.patch(extra_nonce_2.hex())
+        expected = replace(TARGET, nonce=EXTRA_NONCE_1 + extra_nonce_2).to_cbor()
+        assert datum == expected
+        assert get_hash(datum) == get_hash(expected)
+        assert template.target() == TargetState.from_cbor(expected)
+
+
+def test_template_nonce_counter():
+    template = codec.DatumTemplate(TARGET, EXTRA_NONCE_1)
+    template.nonce = 5
+    template.nonce += 1
+    assert template.nonce == 6
+    assert template.datum() == replace(
+        TARGET, nonce=EXTRA_NONCE_1 + (6).to_bytes(12)
+    ).to_cbor()
+
+    # The counter wraps around in the window, extra nonce 1 is never touched
+    template.nonce = 1 << 96
+    assert template.datum()[4:8] == EXTRA_NONCE_1
+    assert template.nonce == 0
@@ -0,0 +1,105 @@
+import asyncio
+
+import pytest
+
+from tuna import codec
+from tuna.mock import job_datum
+from tuna.stratum import Share
+from tuna.stratum import ShareStatus
+from tuna.stratum import Stratum
+from tuna.stratum import StratumMessage
+from tuna.stratum import dumps
+
+
+def notify(job: int) -> dict:
+    return {
+        "id": None,
+        "method": "mining.notify",
+        "params": [f"{job:08x}", codec.encode(job_datum(job)).hex()],
+    }
+
+
+VALID = [
+    {"id": 1, "result": [[], "0c1ba0d2", 12], "error": None},
+    {"id": 2, "result": True, "error": None},
+    {"id": None, "method": "mining.set_difficulty", "params": [8]},
+    notify(1),
+    {"id": 3, "result": True, "error": None},
+    {"id": 4, "result": False, "error": [23, "Low difficulty", None]},
+    {"id": None, "method": "mining.set_difficulty", "params": [9]},
+    notify(2),
+]
+
+MALFORMED = [
+    [1, 2, 3],
+    {"id": 1, "result": None, "error": None},
+    {"id": 1, "result": [[], "not hex", 12], "error": None},
+    {"id": None, "method": "mining.set_difficulty"},
+    {"id": None, "method": "mining.notify", "params": ["00000003"]},
+    {"id": None, "method": "mining.notify", "params": ["00000003", "d87a9fff"]},
+    {"id": None, "method": "mining.notify", "params": None},
+]
+
+
+async def listen(messages: list, strict: bool) -> Stratum:
+    conn = Stratum("127.0.0.1", 0, "addr", "worker", "", strict=strict)
+    conn.reconnect = False
+    conn.notify_timeout = None
+    conn.reader = asyncio.StreamReader()
+    conn.reader.feed_data(b"".join(dumps(m) + b"\n" for m in messages))
+    conn.reader.feed_eof()
+    for share_id in (3, 4):
+        conn.shares[share_id] = Share(share_id, "00000001", "", {})
+
+    with pytest.raises(ConnectionError):
+        await conn.listen()
+    return conn
+
+
+def summary(conn: Stratum) -> dict:
+    """What the miner sees after the messages, without timings."""
+    queued = []
+    while not conn.messages.empty():
+        message = conn.messages.get_nowait()
+        if isinstance(message, StratumMessage):
+            queued.append((message.method, message.params))
+        elif isinstance(message, Share):
+            queued.append(("share", message.id, message.status))
+        else:
+            queued.append((type(message).__name__, message.id))
+    return {
+        "queued": queued,
+        "job_id": conn.job_id,
+        "target": conn.target,
+        "difficulty": conn.difficulty,
+        "extra_nonce_1": conn.extra_nonce_1,
+        "pending": sorted(conn.shares),
+    }
+
+
+def test_fast_and_strict_dispatch_agree():
+    fast = summary(asyncio.run(listen(VALID, strict=False)))
+    strict = summary(asyncio.run(listen(VALID, strict=True)))
+
+    assert fast == strict
+    assert fast["job_id"] == "00000002"
+    assert fast["difficulty"] == 9
+    assert fast["extra_nonce_1"] == bytes.fromhex("0c1ba0d2")
+    assert fast["target"].nonce == bytes.fromhex("0c1ba0d2") + bytes(12)
+    assert fast["pending"] == []
+    assert ("share", 3, ShareStatus.accepted) in fast["queued"]
+    assert ("share", 4, ShareStatus.rejected) in fast["queued"]
+
+
+@pytest.mark.parametrize("strict", [False, True])
+def test_malformed_messages_are_dropped(strict: bool):
+    # Every malformed message is dropped on its own, the listener keeps going and
+    # none of them changes what the valid messages set
+    mixed = []
+    for i, message in enumerate(VALID):
+        mixed.append(message)
+        mixed += MALFORMED[i : i + 1]
+    mixed += MALFORMED[len(VALID) :]
+
+    expected = summary(asyncio.run(listen(VALID, strict)))
+    assert summary(asyncio.run(listen(mixed, strict))) == expected
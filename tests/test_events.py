@@ -0,0 +1,44 @@
+from tuna import events
+from tuna.events import Event
+from tuna.events import EventLog
+from tuna.stratum import ShareStatus
+
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / "events.bin")
+    with EventLog(path) as log:
+        log.new_job("0000002a", 2.5, 8)
+        log.batch_start(16, 2**64 + 3)
+        log.share_submitted(1, "00ff")
+        log.share_result(1, ShareStatus.accepted, 0.0015)
+
+    records = events.read(path)
+    assert [r[1] for r in records] == [
+        Event.JOB,
+        Event.BATCH_START,
+        Event.SHARE_SUBMITTED,
+        Event.SHARE_RESULT,
+    ]
+    # Fractional pool difficulties are rounded down
+    assert records[0][4:7] == (2, 8, b"0000002a".ljust(16, b"\0"))
+    assert records[1][4:6] == (16, 3)
+    assert records[3][2] == 1 and records[3][5] == 1500
+
+
+def test_no_difficulty(tmp_path):
+    path = str(tmp_path / "events.bin")
+    with EventLog(path) as log:
+        log.new_job("1", None, 8)
+
+    assert events.read(path)[0][4] == 0
+
+
+def test_reopen_continues_jobs(tmp_path):
+    path = str(tmp_path / "events.bin")
+    with EventLog(path) as log:
+        log.new_job("1", 1, 8)
+        log.new_job("2", 1, 8)
+    with EventLog(path) as log:
+        log.new_job("3", 1, 8)
+
+    assert [r[3] for r in events.read(path)] == [1, 2, 3]
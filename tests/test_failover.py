@@ -0,0 +1,138 @@
+import asyncio
+import time
+
+import pytest
+
+from tuna import backends
+from tuna import miner
+from tuna.mock import MockPool
+from tuna.stratum import Stratum
+from tuna.stratum import parse_pools
+from tuna.utils import Target
+
+
+async def wait_for(condition, timeout: float = 10.0):
+    deadline = time.perf_counter() + timeout
+    while not condition():
+        assert time.perf_counter() < deadline, "timed out"
+        await asyncio.sleep(0.01)
+
+
+async def kill_and_restart(outage: float, notify_before_kill: bool) -> dict:
+    pool = MockPool(difficulty=3, notify_interval=0.5)
+    await pool.start()
+    conn = Stratum(pool.host, pool.port, "addr", "worker", "", notify_timeout=None)
+    task = asyncio.create_task(
+        miner.mine(conn, backends.create("hashlib"), Target(3), 16)
+    )
+    try:
+        await wait_for(lambda: len(pool.submits) > 0)
+
+        # A job that arrives right before the connection is lost is still queued for
+        # the miner after resume() dropped the target
+        if notify_before_kill:
+            await pool.notify()
+        await pool.close()
+        await wait_for(lambda: conn.target is None)
+
+        # The miner has nothing to hash while the pool is down and must not spin
+        cpu = time.process_time()
+        await asyncio.sleep(outage)
+        idle = time.process_time() - cpu
+
+        await pool.start()
+        submits = len(pool.submits)
+        await wait_for(lambda: len(pool.submits) > submits)
+        assert not task.done()
+        return {"idle": idle, "connects": conn.connects}
+    finally:
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        await pool.close()
+
+
+def test_reconnect_after_restart():
+    result = asyncio.run(kill_and_restart(1.0, notify_before_kill=False))
+
+    assert result["connects"] >= 2
+    assert result["idle"] < 0.5
+
+
+def test_notify_before_connection_lost():
+    result = asyncio.run(kill_and_restart(1.0, notify_before_kill=True))
+
+    assert result["connects"] >= 2
+    assert result["idle"] < 0.5
+
+
+async def fail_over(kill: bool) -> dict:
+    primary = MockPool(difficulty=3, notify_interval=0.5)
+    backup = MockPool(difficulty=3, notify_interval=0.5)
+    await primary.start()
+    await backup.start()
+    conn = Stratum(
+        primary.host,
+        primary.port,
+        "addr",
+        "worker",
+        "",
+        pools=[(backup.host, backup.port)],
+        notify_timeout=None if kill else 1.0,
+    )
+    task = asyncio.create_task(
+        miner.mine(conn, backends.create("hashlib"), Target(3), 16)
+    )
+    try:
+        await wait_for(lambda: len(primary.submits) + len(backup.submits) > 0)
+        # Either pool may have been the fastest to answer the probe
+        current, other = primary, backup
+        if conn.port == backup.port:
+            current, other = backup, primary
+
+        if kill:
+            await current.close()
+        else:
+            # The pool stays up but sends no new jobs
+            current.notifier.cancel()
+        submits = len(other.submits)
+        await wait_for(lambda: len(other.submits) > submits)
+        assert not task.done()
+        return {"port": conn.port, "other": other.port, "connects": conn.connects}
+    finally:
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        await primary.close()
+        await backup.close()
+
+
+def test_fail_over_to_backup_pool():
+    result = asyncio.run(fail_over(kill=True))
+
+    assert result["port"] == result["other"]
+    assert result["connects"] >= 2
+
+
+def test_switch_pools_without_jobs():
+    result = asyncio.run(fail_over(kill=False))
+
+    assert result["port"] == result["other"]
+    assert result["connects"] >= 2
+
+
+def test_parse_pools():
+    pools = "10.0.0.2:3643, 10.0.0.3 ,,[::1]:3643"
+    assert parse_pools(pools, default_port=3333) == [
+        ("10.0.0.2", 3643),
+        ("10.0.0.3", 3333),
+        ("[::1]", 3643),
+    ]
+    with pytest.raises(ValueError, match="has no port"):
+        parse_pools("10.0.0.2:3643,10.0.0.3")
+    with pytest.raises(ValueError, match="invalid port"):
+        parse_pools("10.0.0.2:port")
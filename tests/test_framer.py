@@ -0,0 +1,70 @@
+import json
+
+import pytest
+
+from tuna import stratum
+from tuna.stratum import LineFramer
+
+MESSAGES = [
+    {"id": None, "method": "mining.set_difficulty", "params": [8]},
+    {
+        "id": None,
+        "method": "mining.notify",
+        "params": ["00007f2a", "d8799f44" + "00" * 150 + "ff", True],
+    },
+    {"id": 5, "result": True, "error": None},
+]
+
+STREAM = b"".join(json.dumps(message).encode() + b"\n" for message in MESSAGES)
+
+
+@pytest.fixture(params=["orjson", "json"])
+def framer(request, monkeypatch) -> LineFramer:
+    """A framer decoding with orjson (if installed) and with the json fallback."""
+    if request.param == "json":
+        monkeypatch.setattr(stratum, "loads", json.loads)
+    elif stratum.loads is json.loads:
+        pytest.skip("orjson is not installed")
+    return LineFramer()
+
+
+def test_coalesced_messages(framer: LineFramer):
+    assert framer.feed(STREAM) == MESSAGES
+    assert framer.buffer == b""
+
+
+def test_message_split_in_two(framer: LineFramer):
+    for split in range(1, len(STREAM)):
+        messages = framer.feed(STREAM[:split]) + framer.feed(STREAM[split:])
+        assert messages == MESSAGES, f"split at {split}"
+        assert framer.buffer == b""
+
+
+def test_one_byte_at_a_time(framer: LineFramer):
+    messages = []
+    for i in range(len(STREAM)):
+        messages += framer.feed(STREAM[i : i + 1])
+    assert messages == MESSAGES
+
+
+def test_partial_line_is_kept(framer: LineFramer):
+    first = json.dumps(MESSAGES[0]).encode() + b"\n"
+    assert framer.feed(first + STREAM[:10]) == MESSAGES[:1]
+    assert framer.buffer == STREAM[:10]
+
+
+def test_crlf_and_empty_lines(framer: LineFramer):
+    stream = STREAM.replace(b"\n", b"\r\n") + b"\r\n\n"
+    assert framer.feed(stream) == MESSAGES
+
+
+def test_malformed_line_is_dropped_alone(framer: LineFramer):
+    stream = b'{"id": 3, "result"\n' + STREAM + b"not json\n"
+    assert framer.feed(stream) == MESSAGES
+
+
+def test_line_without_newline_is_bounded():
+    framer = LineFramer(max_line=64)
+    assert framer.feed(b"x" * 65) == []
+    assert framer.buffer == b""
+    assert framer.feed(STREAM) == MESSAGES
@@ -0,0 +1,32 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from tuna import bench
+
+# Modules with an import time budget, the timings themselves are left to bench_import
+MODULES = [
+    module for module, budget in bench.IMPORT_BUDGETS.items() if budget is not None
+]
+
+# Slow to import, only loaded by the commands that use them
+HEAVY = ["pycardano", "blockfrost", "pydantic", "numpy"]
+
+
+def loaded_modules(module: str) -> set[str]:
+    """The modules in sys.modules after importing `module` in a new interpreter."""
+    code = f"import sys, {module}; print(' '.join(sys.modules))"
+    env = os.environ | {"PYTHONPATH": os.pathsep.join(p for p in sys.path if p)}
+    result = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True, env=env
+    )
+    return set(result.stdout.split())
+
+
+@pytest.mark.parametrize("module", MODULES)
+def test_import_does_not_load_heavy_modules(module: str):
+    loaded = loaded_modules(module)
+    assert module in loaded
+    assert [name for name in HEAVY if name in loaded] == []
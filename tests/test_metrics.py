@@ -0,0 +1,99 @@
+import asyncio
+import socket
+import time
+
+from tuna import backends
+from tuna import jobs
+from tuna import metrics
+from tuna import miner
+from tuna.mock import MockPool
+from tuna.stratum import Stratum
+from tuna.utils import Target
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def scrape(port: int, path: str = "/metrics") -> str:
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(f"GET {path} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode())
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+
+    head, _, body = response.decode().partition("\r\n\r\n")
+    assert head.startswith("HTTP/1.1 200 OK")
+    assert "Content-Type: text/plain; version=0.0.4" in head
+    return body
+
+
+def samples(text: str) -> dict[str, float]:
+    """Parse the Prometheus text format into {name{labels}: value}."""
+    values = {}
+    for line in text.splitlines():
+        if line and not line.startswith("#"):
+            name, value = line.rsplit(" ", 1)
+            values[name] = float(value)
+    return values
+
+
+async def mine_and_scrape(seconds: float) -> tuple[MockPool, list[dict]]:
+    port = free_port()
+    scrapes = []
+    async with MockPool(difficulty=3, notify_interval=0.5) as pool:
+        conn = Stratum(pool.host, pool.port, "addr", "worker", "", notify_timeout=None)
+        conn.reconnect = False
+        task = asyncio.create_task(
+            miner.mine(conn, backends.create("hashlib"), Target(3), 16, port)
+        )
+
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            await asyncio.sleep(0.5)
+            if not task.done():
+                scrapes.append(samples(await scrape(port)))
+
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+    return pool, scrapes
+
+
+def test_metrics_while_mining():
+    metrics.metrics = metrics.Metrics()
+    jobs.metrics = jobs.JobMetrics()
+
+    pool, scrapes = asyncio.run(mine_and_scrape(4.0))
+
+    assert len(scrapes) >= 4
+    first, last = scrapes[0], scrapes[-1]
+
+    # Counters only go up while mining
+    hashes = [s['tuna_hashes_total{backend="hashlib"}'] for s in scrapes]
+    assert hashes == sorted(hashes)
+    assert hashes[-1] > hashes[0] > 0
+    assert last['tuna_batches_total{backend="hashlib"}'] > 0
+    assert last['tuna_hashrate{backend="hashlib"}'] > 0
+    assert last['tuna_batch_duration_seconds_count{backend="hashlib"}'] > 0
+
+    # Shares and jobs seen by the pool show up in the metrics
+    assert pool.submits
+    assert last['tuna_shares_total{status="accepted"}'] > 0
+    assert last["tuna_pool_difficulty"] == pool.difficulty
+    assert last["tuna_job_starts_total"] >= 2
+    assert first["tuna_start_time_seconds"] == last["tuna_start_time_seconds"]
+
+
+def test_any_path_serves_metrics():
+    async def run() -> str:
+        port = free_port()
+        server = await metrics.serve(port)
+        async with server:
+            return await scrape(port, "/")
+
+    assert "# TYPE tuna_hashes_total counter" in asyncio.run(run())
@@ -0,0 +1,117 @@
+import multiprocessing
+import random
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from tuna import nonces
+from tuna.nonces import NATIVE_BLOCK
+from tuna.nonces import NonceAllocator
+
+JOBS = ["00007f2a", "00007f2b", "a" * 40]
+
+
+def allocate_many(
+    path: str | None, seed: int, count: int, allocator: NonceAllocator | None = None
+) -> list[tuple[str, int, int]]:
+    """Allocate `count` random ranges, with its own allocator unless one is given."""
+    rng = random.Random(seed)
+    own = allocator is None
+    if own:
+        allocator = NonceAllocator(path)
+    try:
+        ranges = []
+        for _ in range(count):
+            job_id = rng.choice(JOBS)
+            if rng.random() < 0.2:
+                nonce_range = allocator.allocate(job_id, NATIVE_BLOCK, NATIVE_BLOCK)
+            else:
+                nonce_range = allocator.allocate(job_id, rng.randint(1, 5000))
+            ranges.append((job_id, nonce_range.start, nonce_range.stop))
+        return ranges
+    finally:
+        if own:
+            allocator.close()
+
+
+def assert_disjoint(ranges: list[tuple[str, int, int]], allocator: NonceAllocator):
+    for job_id in JOBS:
+        spans = sorted((start, stop) for job, start, stop in ranges if job == job_id)
+        for (_, stop), (start, _) in zip(spans, spans[1:]):
+            assert stop <= start, f"Overlapping ranges for job {job_id}"
+        # The cursor is past every range handed out
+        if spans:
+            assert allocator.consumed(job_id) == spans[-1][1]
+
+
+def test_ranges_are_disjoint_and_aligned():
+    with NonceAllocator() as allocator:
+        ranges = allocate_many(None, 0, 500, allocator)
+        assert_disjoint(ranges, allocator)
+
+    for job_id, start, stop in ranges:
+        if stop - start == NATIVE_BLOCK:
+            assert start % NATIVE_BLOCK == 0
+
+
+def test_threads_sharing_one_allocator(tmp_path):
+    path = str(tmp_path / "nonces.bin")
+    with NonceAllocator(path) as allocator:
+        with ThreadPoolExecutor(8) as executor:
+            results = executor.map(
+                lambda seed: allocate_many(path, seed, 300, allocator), range(8)
+            )
+            ranges = [r for result in results for r in result]
+        assert_disjoint(ranges, allocator)
+
+
+def test_threads_with_their_own_allocators(tmp_path):
+    path = str(tmp_path / "nonces.bin")
+    with ThreadPoolExecutor(8) as executor:
+        results = executor.map(lambda seed: allocate_many(path, seed, 300), range(8))
+        ranges = [r for result in results for r in result]
+
+    with NonceAllocator(path) as allocator:
+        assert_disjoint(ranges, allocator)
+
+
+@pytest.mark.skipif(not nonces.HAS_FCNTL, reason="File locks need fcntl")
+def test_processes_sharing_a_checkpoint(tmp_path):
+    path = str(tmp_path / "nonces.bin")
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(4, mp_context=context) as executor:
+        futures = [
+            executor.submit(allocate_many, path, seed, 500) for seed in range(8)
+        ]
+        ranges = [r for future in futures for r in future.result()]
+
+    with NonceAllocator(path) as allocator:
+        assert_disjoint(ranges, allocator)
+
+
+def test_checkpoint_survives_a_restart(tmp_path):
+    path = str(tmp_path / "nonces.bin")
+    with NonceAllocator(path) as allocator:
+        first = allocator.allocate(JOBS[0], 1000)
+
+    with NonceAllocator(path) as allocator:
+        second = allocator.allocate(JOBS[0], 1000)
+        other = allocator.allocate(JOBS[1], 10)
+
+    assert second.start == first.stop
+    assert other.start == 0
+
+
+def test_invalid_checkpoint_is_reset(tmp_path):
+    path = tmp_path / "nonces.bin"
+    path.write_bytes(b"not a checkpoint")
+    with NonceAllocator(str(path)) as allocator:
+        assert allocator.allocate(JOBS[0], 10).start == 0
+
+
+def test_exhausted_nonce_space():
+    with NonceAllocator(size=1) as allocator:
+        allocator.allocate(JOBS[0], 200)
+        with pytest.raises(ValueError):
+            allocator.allocate(JOBS[0], 100)
@@ -0,0 +1,139 @@
+import asyncio
+from dataclasses import replace
+
+import pytest
+
+from tuna import backends
+from tuna import codec
+from tuna import miner
+from tuna.mock import MockPool
+from tuna.mock import job_datum
+from tuna.proxy import Proxy
+from tuna.stratum import Stratum
+from tuna.utils import Target
+from tuna.utils import get_hash
+
+DIFFICULTY = 3
+
+BACKENDS = ["hashlib"] + [
+    name for name in ("native", "cuda") if name in backends.available()
+]
+
+# Extra nonce 1 of a worker behind the proxy, the pool's 4 bytes and the worker slot
+WORKER_EXTRA_NONCE_1 = bytes.fromhex("0c1ba0d2") + bytes([0, 7])
+
+
+async def worker(port: int, name: str, backend: str, seconds: float) -> Stratum:
+    conn = Stratum("127.0.0.1", port, f"addr_{name}", name, "", notify_timeout=None)
+    conn.reconnect = False
+    try:
+        await asyncio.wait_for(
+            miner.mine(conn, backends.create(backend), Target(DIFFICULTY), 16),
+            seconds,
+        )
+    except asyncio.TimeoutError:
+        pass
+    return conn
+
+
+async def mine_through_proxy(
+    workers: list[str], seconds: float
+) -> tuple[MockPool, list[Stratum]]:
+    async with MockPool(notify_interval=1.0, difficulty=DIFFICULTY) as pool:
+        upstream = Stratum(pool.host, pool.port, "addr", "rig", "", notify_timeout=None)
+        upstream.reconnect = False
+        async with upstream:
+            proxy = Proxy(upstream, port=0)
+            await proxy.start()
+            await upstream.subscribe()
+            await upstream.authorize()
+            relay = asyncio.create_task(proxy.run())
+
+            conns = await asyncio.gather(
+                *[
+                    worker(proxy.port, f"w{i}", backend, seconds)
+                    for i, backend in enumerate(workers)
+                ]
+            )
+
+            # Let the last answers reach the workers
+            await asyncio.sleep(0.3)
+            relay.cancel()
+            await proxy.close()
+    return pool, conns
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_workers_share_one_upstream(backend: str):
+    pool, conns = asyncio.run(mine_through_proxy([backend] * 3, 3.0))
+
+    # One upstream session for all workers
+    methods = [message["method"] for message in pool.received]
+    assert methods.count("mining.subscribe") == 1
+    assert methods.count("mining.authorize") == 1
+
+    # Every worker sees its own slot appended to the extra nonce 1
+    prefixes = [conn.extra_nonce_1[len(pool.extra_nonce_1) :] for conn in conns]
+    assert all(conn.extra_nonce_1.startswith(pool.extra_nonce_1) for conn in conns)
+    assert sorted(prefixes) == [bytes([0, i]) for i in range(3)]
+    assert all(len(conn.extra_nonce_2) == pool.extra_nonce_2_size - 2 for conn in conns)
+
+    # Every upstream share is valid for its job and no nonce is submitted twice
+    seen = set()
+    by_slot = {prefix: 0 for prefix in prefixes}
+    for message in pool.submits:
+        _, job_id, nonce = message["params"]
+        assert (job_id, nonce) not in seen
+        seen.add((job_id, nonce))
+
+        nonce = bytes.fromhex(nonce)
+        target = replace(job_datum(int(job_id, 16)), nonce=pool.extra_nonce_1 + nonce)
+        assert Target(DIFFICULTY).check(get_hash(codec.encode(target)))
+        by_slot[nonce[:2]] += 1
+
+    # Every worker found shares, and got the pool's answers back
+    assert all(count > 0 for count in by_slot.values())
+    for conn in conns:
+        assert conn.share_stats.accepted > 0
+        assert conn.share_stats.rejected == 0
+
+
+def fake_mine_cuda(datum: bytes, zeros: int, nloops: int, keep: int = 0) -> list[str]:
+    """The nonce layout of the CUDA kernel, for a few of its 2^18 threads."""
+    payload = bytearray(datum)
+    threshold = Target(zeros).threshold
+    nonces = []
+    for thread in [0, 1, 0xFFFF, 0x10000, 0x3FFFF]:
+        kept = int.from_bytes(datum[8:12], "little") & ((1 << (8 * keep)) - 1)
+        word = (kept | (thread << (8 * keep))) & 0xFFFFFFFF
+        high = thread >> (32 - 8 * keep) if keep else 0
+        for loop in range(nloops):
+            payload[8:12] = word.to_bytes(4, "little")
+            payload[16:20] = ((high << 24) | (2 * loop)).to_bytes(4, "little")
+            if get_hash(payload) < threshold:
+                nonces.append(payload[4:20].hex())
+    return nonces
+
+
+def test_cuda_keeps_the_worker_slot(monkeypatch):
+    monkeypatch.setattr(backends, "mine_cuda", fake_mine_cuda, raising=False)
+    template = codec.DatumTemplate(job_datum(1), WORKER_EXTRA_NONCE_1)
+    datum = template.datum()
+    assert template.window == slice(10, 20)
+
+    nonces = backends.CudaBackend().mine(datum, template.window, Target(1), 64)
+
+    # Every nonce is valid with the worker's slot in front of it, and none repeats
+    assert len(nonces) > 0
+    assert len(set(nonces)) == len(nonces)
+    for nonce in nonces:
+        assert Target(1).check(get_hash(template.patch(nonce)))
+        assert template.patch(nonce)[4:10] == WORKER_EXTRA_NONCE_1
+
+
+def test_cuda_needs_the_thread_bytes(monkeypatch):
+    monkeypatch.setattr(backends, "mine_cuda", fake_mine_cuda, raising=False)
+    template = codec.DatumTemplate(job_datum(1), WORKER_EXTRA_NONCE_1 + b"\x01")
+
+    with pytest.raises(ValueError):
+        backends.CudaBackend().mine(template.datum(), template.window, Target(1), 64)
@@ -0,0 +1,142 @@
+import asyncio
+import time
+
+from tuna.mock import MockPool
+from tuna.stratum import Share
+from tuna.stratum import ShareStatus
+from tuna.stratum import Stratum
+from tuna.stratum import StratumAuthorized
+
+
+def stratum() -> Stratum:
+    conn = Stratum("127.0.0.1", 3333, "addr", "worker", "")
+    conn.job_id = "00000001"
+    return conn
+
+
+def queued(conn: Stratum) -> list:
+    return [conn.messages.get_nowait() for _ in range(conn.messages.qsize())]
+
+
+def test_responses_match_share_ids():
+    conn = stratum()
+    first = conn.submit_nonce("aa")
+    second = conn.submit_nonce("bb")
+    assert first.id != second.id
+    assert conn.shares.keys() == {first.id, second.id}
+
+    # Answers may come back in any order
+    conn.dispatch({"id": second.id, "result": True, "error": None})
+    error = [23, "Low difficulty", None]
+    conn.dispatch({"id": first.id, "result": False, "error": error})
+
+    assert second.status == ShareStatus.accepted
+    assert first.status == ShareStatus.rejected
+    assert first.error == error
+    assert conn.shares == {}
+    assert queued(conn) == [second, first]
+
+
+def test_other_responses_are_not_shares():
+    conn = stratum()
+    share = conn.submit_nonce("aa")
+    conn.dispatch({"id": 2, "result": True, "error": None})
+
+    assert conn.shares == {share.id: share}
+    [message] = queued(conn)
+    assert isinstance(message, StratumAuthorized)
+    assert message.id == 2
+
+
+def test_stale_shares():
+    conn = stratum()
+    replaced = conn.submit_nonce("aa")
+    late = conn.submit_nonce("bb")
+
+    # A rejection for a job that was replaced in the meantime is stale
+    conn.job_id = "00000002"
+    error = [21, "Job not found", None]
+    conn.dispatch({"id": replaced.id, "result": None, "error": error})
+    assert replaced.status == ShareStatus.stale
+
+    # As is one the pool calls stale, whatever the job
+    late.job_id = conn.job_id
+    conn.dispatch({"id": late.id, "result": False, "error": "Stale share"})
+    assert late.status == ShareStatus.stale
+
+    stats = conn.share_stats
+    assert (stats.submitted, stats.accepted, stats.rejected, stats.stale) == (2, 0, 0, 2)
+
+
+def test_latency():
+    conn = stratum()
+    share = conn.submit_nonce("aa")
+    share.sent = time.perf_counter() - 0.25
+    conn.dispatch({"id": share.id, "result": True, "error": None})
+
+    assert 0.25 <= share.latency < 1.0
+    assert conn.share_stats.mean_latency == share.latency
+    assert conn.share_stats.max_latency == share.latency
+
+
+def test_unanswered_shares_expire():
+    conn = stratum()
+    conn.share_timeout = 10.0
+    old = conn.submit_nonce("aa")
+    old.sent = time.perf_counter() - 11.0
+    new = conn.submit_nonce("bb")
+    new.sent = time.perf_counter()
+
+    conn.expire_shares()
+
+    assert old.status == ShareStatus.stale
+    assert new.status == ShareStatus.pending
+    assert conn.shares == {new.id: new}
+    assert conn.share_stats.stale == 1
+    assert queued(conn) == [old]
+
+    # A late answer for the expired share is not counted again
+    conn.dispatch({"id": old.id, "result": True, "error": None})
+    assert old.status == ShareStatus.stale
+    assert conn.share_stats.accepted == 0
+
+
+def test_shares_without_connection_are_stale():
+    async def run() -> tuple[Stratum, Share]:
+        conn = stratum()
+        sender = asyncio.create_task(conn.send_shares())
+        try:
+            share = conn.submit_nonce("aa")
+            while share.status == ShareStatus.pending:
+                await asyncio.sleep(0.01)
+        finally:
+            sender.cancel()
+        return conn, share
+
+    conn, share = asyncio.run(run())
+
+    assert share.status == ShareStatus.stale
+    assert conn.shares == {}
+    assert conn.share_stats.stale == 1
+
+
+def test_shares_answered_by_a_pool():
+    async def run() -> tuple[Stratum, list[Share]]:
+        async with MockPool(difficulty=3) as pool:
+            conn = Stratum(pool.host, pool.port, "addr", "worker", "")
+            conn.reconnect = False
+            async with conn:
+                await conn.subscribe()
+                await conn.authorize()
+                while conn.job_id is None:
+                    await asyncio.sleep(0.01)
+                shares = [conn.submit_nonce(f"{i:024x}") for i in range(5)]
+                while conn.shares:
+                    await asyncio.sleep(0.01)
+        return conn, shares
+
+    conn, shares = asyncio.run(run())
+
+    assert all(share.status == ShareStatus.accepted for share in shares)
+    assert all(share.sent is not None and share.latency > 0 for share in shares)
+    assert conn.share_stats.accepted == 5
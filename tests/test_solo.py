@@ -0,0 +1,169 @@
+import asyncio
+import time
+
+import pytest
+
+from tuna import backends
+from tuna import config
+from tuna import solo
+from tuna.mock import StateServer
+from tuna.mock import genesis_state
+
+ADDRESS = (
+    "addr1q9dfupytkpdzqrkmp664vgjneelgh0yvwkqkx9dccyyw5r96h2p5jcgwnv4tw5tq3yzd2dmh3"
+    "sgcgfyta3tv8x3vdq8qsc8jza"
+)
+
+
+@pytest.fixture(autouse=True)
+def account(monkeypatch):
+    # Solo mining needs the address but none of the pool settings
+    for name in ["STRATUM_HOST", "STRATUM_PORT", "STRATUM_WORKER", "STRATUM_PASSWORD"]:
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.delenv("SEED", raising=False)
+    monkeypatch.setenv("ADDRESS", ADDRESS)
+    config.account.cache_clear()
+    yield
+    config.account.cache_clear()
+
+
+async def wait_for(condition, timeout: float = 10.0):
+    deadline = time.perf_counter() + timeout
+    while not condition():
+        assert time.perf_counter() < deadline, "timed out"
+        await asyncio.sleep(0.01)
+
+
+class RejectingServer(StateServer):
+    """Rejects the first `rejects` valid solutions."""
+
+    def __init__(self, *args, rejects: int = 2, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.rejects = rejects
+
+    def solve(self, solution: dict) -> bool:
+        if self.rejects > 0:
+            self.rejects -= 1
+            return False
+        return super().solve(solution)
+
+
+class FailingSource(solo.StateSource):
+    """Serves a fixed state, the first `failures` submits can not reach the source."""
+
+    submits = True
+
+    def __init__(self, state, failures: int = 1):
+        self.state = state
+        self.failures = failures
+        self.submitted: list[solo.Solution] = []
+
+    async def fetch(self):
+        return self.state
+
+    async def submit(self, solution: solo.Solution) -> bool:
+        if self.failures > 0:
+            self.failures -= 1
+            raise ConnectionRefusedError("state service is down")
+        self.submitted.append(solution)
+        return True
+
+
+async def mine(server: StateServer, condition, nloops: int = 1024) -> solo.SoloMiner:
+    async with server:
+        source = solo.HttpStateSource(server.url)
+        solo_miner = solo.SoloMiner(source, backends.create("hashlib"), nloops, 0.05)
+        task = asyncio.create_task(solo_miner.run())
+        try:
+            await wait_for(lambda: condition(solo_miner) or task.done())
+            assert not task.done()
+        finally:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+    return solo_miner
+
+
+def test_solutions_advance_the_state():
+    server = StateServer(genesis_state(leading_zeros=3))
+    solo_miner = asyncio.run(
+        mine(server, lambda m: m.state is not None and m.state.block_number >= 3)
+    )
+
+    assert len(server.accepted) >= 3
+    assert server.state.block_number == len(server.accepted)
+    assert server.rejected == []
+    # Every accepted solution is for a different block
+    blocks = [s.state.block_number for s in solo_miner.solutions]
+    assert len(set(blocks)) >= 3
+
+
+def test_rejected_solution_searches_on():
+    server = RejectingServer(genesis_state(leading_zeros=3), rejects=2)
+    asyncio.run(mine(server, lambda m: server.state.block_number >= 1))
+
+    assert len(server.rejected) == 2
+    assert len(server.accepted) >= 1
+    # The miner searched on in the same block instead of waiting for it to advance
+    assert [s["block_number"] for s in server.rejected] == [0, 0]
+    assert server.accepted[0]["block_number"] == 0
+
+
+def test_failed_submit_is_retried():
+    async def run():
+        state = genesis_state(leading_zeros=3)
+        source = FailingSource(state)
+        solo_miner = solo.SoloMiner(source, backends.create("hashlib"), 1024, 0.05)
+        solo_miner.update(state)
+        solution = solo.Solution(state, bytes(16), bytes(32), b"", time.time())
+
+        await solo_miner.submit(solution)
+        assert solo_miner.pending is solution
+        assert solo_miner.solved is None
+
+        watcher = asyncio.create_task(solo_miner.watch())
+        try:
+            await wait_for(lambda: solo_miner.pending is None)
+        finally:
+            watcher.cancel()
+        return source, solo_miner, solution
+
+    source, solo_miner, solution = asyncio.run(run())
+
+    assert source.submitted == [solution]
+    assert solo_miner.solved == solo.state_key(solution.state)
+
+
+def test_new_state_cancels_the_batch():
+    # No solution at this difficulty, the miner only stops for the new state
+    server = StateServer(genesis_state(leading_zeros=16))
+
+    async def run():
+        async with server:
+            source = solo.HttpStateSource(server.url)
+            solo_miner = solo.SoloMiner(
+                source, backends.create("hashlib"), 10**7, 0.05
+            )
+            task = asyncio.create_task(solo_miner.run())
+            try:
+                await wait_for(lambda: solo_miner.state is not None)
+                await asyncio.sleep(0.2)
+                start = time.perf_counter()
+                server.advance(bytes(range(32)))
+                await wait_for(lambda: solo_miner.state.block_number == 1)
+                await wait_for(lambda: not solo_miner.changed.is_set())
+                return time.perf_counter() - start, task.done()
+            finally:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+
+    elapsed, done = asyncio.run(run())
+
+    assert not done
+    # A batch of 10**7 hashes takes far longer than this
+    assert elapsed < 2.0
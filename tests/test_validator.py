@@ -0,0 +1,86 @@
+from tuna.utils import Target
+from tuna.validator import BloomFilter
+from tuna.validator import ShareValidator
+
+TARGET = Target(4)
+
+
+def below(target: Target) -> bytes:
+    """The largest hash that meets a target."""
+    return (int.from_bytes(target.threshold) - 1).to_bytes(32)
+
+
+# Hashes that meet 4 leading zeros only, 6 (the pool or block target), and neither
+EASY = below(TARGET)
+HARD = below(Target(6))
+INVALID = TARGET.threshold
+
+
+def test_bloom_filter():
+    bloom = BloomFilter(bits=1 << 16)
+    items = [i.to_bytes(12) for i in range(1000)]
+
+    assert not any(bloom.add(item) for item in items)
+    assert all(bloom.add(item) for item in items)
+    assert bloom.count == 1000
+
+    bloom.clear()
+    assert bloom.count == 0
+    assert not bloom.add(items[0])
+
+
+def test_invalid_hash_is_rejected():
+    validator = ShareValidator()
+    assert TARGET.check(EASY) and not TARGET.check(INVALID)
+
+    assert not validator.check("00" * 12, INVALID, TARGET)
+    assert validator.stats.invalid == 1
+    assert validator.stats.passed == 0
+
+
+def test_below_pool_difficulty():
+    validator = ShareValidator()
+
+    # Meets the submit target but not the pool's difficulty of 6
+    assert not validator.check("01" * 12, EASY, TARGET, 6)
+    assert validator.check("02" * 12, HARD, TARGET, 6)
+    # Fractional pool difficulties round down
+    assert validator.check("03" * 12, EASY, TARGET, 4.5)
+
+    assert validator.stats.below_pool == 1
+    assert validator.stats.passed == 2
+
+
+def test_duplicates_and_new_job():
+    validator = ShareValidator(bits=1 << 16)
+    validator.new_job("1", 8, 65535)
+
+    assert validator.check("aa" * 12, EASY, TARGET)
+    assert not validator.check("aa" * 12, EASY, TARGET)
+    assert validator.check("bb" * 12, EASY, TARGET)
+    assert validator.stats.duplicate == 1
+
+    # The same nonce is a new share for the next job
+    validator.new_job("2", 8, 65535)
+    assert validator.job_id == "2"
+    assert validator.check("aa" * 12, EASY, TARGET)
+    assert validator.stats.duplicate == 1
+
+
+def test_stats():
+    validator = ShareValidator(bits=1 << 16)
+    validator.new_job("1", 6, 65535)
+
+    validator.check("00" * 12, INVALID, TARGET)
+    validator.check("01" * 12, EASY, TARGET, 6)
+    validator.check("02" * 12, EASY, TARGET)
+    validator.check("02" * 12, EASY, TARGET)
+    validator.check("03" * 12, HARD, TARGET)
+
+    stats = validator.stats
+    assert stats.checked == 5
+    assert (stats.invalid, stats.below_pool, stats.duplicate) == (1, 1, 1)
+    assert stats.filtered == 3
+    assert stats.passed == 2
+    # Only the hard share meets the block target of 6 leading zeros
+    assert stats.blocks == 1